@@ -0,0 +1,100 @@
+"""
+ZIP archives versus tarballs for downloading and extracting repositories.
+
+Downloads each repository from GitHub in both formats and reports the size on the
+wire, the time taken to download and extract it while it downloads, and the time
+taken to extract the downloaded archive afterwards. Both formats must produce the
+same result, which is checked along the way. Needs network access.
+
+Usage:
+    python benchmarks/bench_archive_formats.py [--repeat N] [owner/repo ...]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django
+from django.conf import settings
+
+REPOS = ["dmwyatt/gh_repo_download", "psf/requests", "pallets/flask"]
+
+
+async def run(repo_url, archive_format, repeat):
+    from downloader.file_utils import StreamingTextExtractor, extract_text_files
+    from downloader.repo_utils import download_repo
+
+    best_download = best_extract = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await download_repo(
+            repo_url,
+            text_extractor=StreamingTextExtractor(),
+            archive_format=archive_format,
+        )
+        download = time.perf_counter() - start
+        try:
+            start = time.perf_counter()
+            extraction = await extract_text_files(result.archive, mode="sequential")
+            extract = time.perf_counter() - start
+        finally:
+            result.close()
+        assert result.extraction == extraction, "streaming extraction disagrees"
+        best_download = (
+            download if best_download is None else min(best_download, download)
+        )
+        best_extract = extract if best_extract is None else min(best_extract, extract)
+    return result.download_size, best_download, best_extract, extraction
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("repos", nargs="*", default=REPOS)
+    args = parser.parse_args()
+
+    settings.configure(
+        MAX_REPO_SIZE=1024**3,
+        EXTRACTION_MODE="sequential",
+        ARCHIVE_FORMAT="zip",
+        SKIP_RULES=["vendor", "lockfile", "generated", "large", "minified"],
+        SKIP_LARGE_FILE_SIZE=1024 * 1024,
+        EXTRACTION_PRIORITY=True,
+        EXTRACTION_PRIORITY_WEIGHTS={},
+        # every run is a full download and decodes every member
+        ARCHIVE_CACHE_MAX_SIZE=0,
+        BLOB_STORE_MAX_SIZE=0,
+        DOWNLOAD_SPOOL_MAX_MEMORY=1024 * 1024,
+        ARCHIVE_MMAP=True,
+        HTTP_CLIENT_HTTP2=False,
+        HTTP_CLIENT_MAX_CONNECTIONS=10,
+        HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS=10,
+        HTTP_CLIENT_KEEPALIVE_EXPIRY=30.0,
+        HTTP_CLIENT_TIMEOUT=60.0,
+    )
+    django.setup()
+    from downloader.archives import ARCHIVE_FORMATS
+
+    for repo in args.repos:
+        print(f"{repo}: best of {args.repeat}")
+        results = {}
+        for archive_format in ARCHIVE_FORMATS:
+            size, download, extract, extraction = await run(
+                f"https://github.com/{repo}", archive_format, args.repeat
+            )
+            results[archive_format] = extraction
+            print(
+                f"  {archive_format:>7}: {size / 1024**2:7.2f} MB, "
+                f"download and extract {download * 1000:8.1f} ms, "
+                f"extract afterwards {extract * 1000:8.1f} ms"
+            )
+        first, *others = results.values()
+        assert all(other == first for other in others), "the formats disagree"
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
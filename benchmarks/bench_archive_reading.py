@@ -0,0 +1,144 @@
+"""
+Wall-clock time of `extract_text_files` reading a ZIP archive from an `io.BytesIO`,
+a file, or a memory map of the file.
+
+Two archives are generated: many small files and a few huge ones. Every reader must
+produce the same result, which is checked along the way. The archive is read once
+before timing, so the file and the map are served from the page cache.
+
+Usage:
+    python benchmarks/bench_archive_reading.py [--mode MODE] [--repeat N]
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django
+from django.conf import settings
+
+
+def write_archive(path, files):
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        for name, content in files:
+            zip_file.writestr(name, content)
+
+
+def text(rng, size):
+    words = [b"def", b"return", b"self", b"value", b"import", b"class", b"caf\xc3\xa9"]
+    parts = []
+    length = 0
+    while length < size:
+        line = b" ".join(rng.choice(words) for _ in range(10)) + b"\n"
+        parts.append(line)
+        length += len(line)
+    return b"".join(parts)[:size]
+
+
+def many_small_files(rng):
+    return [(f"repo/src/{i}.py", text(rng, 2048)) for i in range(5000)]
+
+
+def few_huge_files(rng):
+    return [(f"repo/data/{i}.txt", text(rng, 16 * 1024 * 1024)) for i in range(4)]
+
+
+def open_bytes_io(path):
+    with open(path, "rb") as f:
+        return zipfile.ZipFile(io.BytesIO(f.read()))
+
+
+def open_file(path):
+    settings.ARCHIVE_MMAP = False
+    return zipfile.ZipFile(open(path, "rb"))
+
+
+def open_mmap(path):
+    from downloader.archives import open_zip
+
+    settings.ARCHIVE_MMAP = True
+    return open_zip(path)
+
+
+READERS = {"BytesIO": open_bytes_io, "file": open_file, "mmap": open_mmap}
+
+
+async def run(path, reader, mode, repeat):
+    from downloader.archives import close_archive
+    from downloader.file_utils import extract_text_files
+    from downloader.skip_rules import NO_SKIP_RULES
+
+    best = None
+    result = None
+    for _ in range(repeat):
+        zip_file = READERS[reader](path)
+        try:
+            start = time.perf_counter()
+            result = await extract_text_files(
+                zip_file,
+                max_files=10_000,
+                max_total_size=1024**3,
+                mode=mode,
+                # the huge files would be skipped as large
+                skip_rules=NO_SKIP_RULES,
+            )
+            elapsed = time.perf_counter() - start
+        finally:
+            close_archive(zip_file)
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mode", default="sequential")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    settings.configure(
+        EXTRACTION_MODE=args.mode,
+        EXTRACTION_WORKERS=os.cpu_count() or 1,
+        EXTRACTION_PRIORITY=True,
+        EXTRACTION_PRIORITY_WEIGHTS={},
+        ARCHIVE_MMAP=True,
+        # every run decodes every member
+        BLOB_STORE_MAX_SIZE=0,
+    )
+    django.setup()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        for name, files in [
+            ("many small files", many_small_files(rng)),
+            ("few huge files", few_huge_files(rng)),
+        ]:
+            path = os.path.join(directory, "archive.zip")
+            write_archive(path, files)
+            size = sum(len(content) for _, content in files)
+            print(
+                f"{name}: {len(files)} files, {size / 1024**2:.0f} MB, "
+                f"{args.mode} mode, best of {args.repeat}"
+            )
+
+            baseline = None
+            for reader in READERS:
+                # warm up the page cache (and the pools)
+                await run(path, reader, args.mode, 1)
+                elapsed, result = await run(path, reader, args.mode, args.repeat)
+                if baseline is None:
+                    baseline = (elapsed, result)
+                assert result == baseline[1], f"reading from {reader} disagrees"
+                speedup = baseline[0] / elapsed
+                print(f"  {reader:>8}: {elapsed * 1000:8.1f} ms ({speedup:.2f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
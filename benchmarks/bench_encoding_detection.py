@@ -0,0 +1,118 @@
+"""
+Speed of encoding declaration detection.
+
+Compares the detection `MemberTextDecoder` used to run on the head of every text file
+(a dict of regexes compiled on each call, run over the whole head, then the EBCDIC
+fallbacks whenever nothing was declared) with `detect_internal_encoding_from_bytes`.
+
+Usage:
+    python benchmarks/bench_encoding_detection.py [--number N] [--repeat N]
+"""
+
+import argparse
+import codecs
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader.file_utils import detect_internal_encoding_from_bytes
+
+
+def legacy_find_encoding_declaration(decoded_content):
+    encoding_patterns = {
+        "Python": re.compile(r"coding[=:]\s*([-\w.]+)"),
+        "Ruby": re.compile(r"coding[=:]\s*([-\w.]+)"),
+        "XML": re.compile(r'<\?xml\s+.*encoding=["\']([-\w.]+)["\'].*\?>'),
+        "HTML": re.compile(r'<meta\s+.*charset=["\']([-\w.]+)["\'].*>'),
+        "Perl": re.compile(r'use\s+encoding\s+["\']([-\w.]+)["\']'),
+        "CSS": re.compile(r'@charset\s+["\']([-\w.]+)["\']'),
+        "LaTeX": re.compile(r"%\s*!TEX\s+encoding\s*=\s*([-\w.]+)"),
+        "XHTML": re.compile(r'<\?xml\s+.*encoding=["\']([-\w.]+)["\'].*\?>'),
+    }
+    for file_type, pattern in encoding_patterns.items():
+        match = pattern.search(decoded_content)
+        if match:
+            encoding = match.group(1)
+            try:
+                codecs.lookup(encoding)
+                return file_type, encoding
+            except LookupError:
+                return file_type, None
+    return None, None
+
+
+def legacy_detect_internal_encoding_from_bytes(bytes_content):
+    encoding = None
+    for bom, bom_encoding in [
+        (codecs.BOM_UTF32_LE, "utf-32-le"),
+        (codecs.BOM_UTF32_BE, "utf-32-be"),
+        (codecs.BOM_UTF16_LE, "utf-16-le"),
+        (codecs.BOM_UTF16_BE, "utf-16-be"),
+        (codecs.BOM_UTF8, "utf-8-sig"),
+    ]:
+        if bytes_content.startswith(bom):
+            encoding = bom_encoding
+            break
+    if encoding:
+        decoded_content = bytes_content.decode(encoding)
+    else:
+        try:
+            decoded_content = bytes_content.decode("utf-8")
+        except UnicodeDecodeError:
+            decoded_content = bytes_content.decode("ascii", errors="ignore")
+    file_type, encoding = legacy_find_encoding_declaration(decoded_content)
+    if encoding:
+        return file_type, encoding
+    for fallback_encoding in ["cp875", "cp1026", "cp1140"]:
+        try:
+            decoded_content = bytes_content.decode(fallback_encoding)
+            file_type, encoding = legacy_find_encoding_declaration(decoded_content)
+            if encoding:
+                return file_type, encoding
+        except UnicodeDecodeError:
+            continue
+    return None, None
+
+
+def sample(text: str, encoding: str = "utf-8") -> bytes:
+    # heads are up to 4096 bytes, like `MemberTextDecoder.head_size`
+    data = text.encode(encoding)
+    return (data * (4096 // len(data) + 1))[:4096]
+
+
+SAMPLES = {
+    "ascii": ("app.js", sample("function add(a, b) {\n  return a + b;\n}\n")),
+    "utf-8": ("README.md", sample("# Café\n\nNaïve résumé.\n")),
+    "latin-1": ("notes.txt", sample("Café, naïve résumé.\n", "latin-1")),
+    "declared": ("main.py", sample("# -*- coding: utf-8 -*-\nx = 1\n")),
+    "css": ("style.css", sample("body {\n  color: blue;\n}\n")),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Detecting {args.number:,} heads per sample, best of {args.repeat}")
+    for name, (filename, head) in SAMPLES.items():
+        results = []
+        for detect in [
+            lambda: legacy_detect_internal_encoding_from_bytes(head),
+            lambda: detect_internal_encoding_from_bytes(head, filename),
+        ]:
+            seconds = min(timeit.repeat(detect, number=args.number, repeat=args.repeat))
+            results.append(seconds / args.number * 1_000_000)
+        legacy, current = results
+        print(
+            f"{name:>10}: legacy {legacy:8.1f} us, current {current:8.1f} us "
+            f"({legacy / current:5.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Wall-clock time of `extract_text_files` in each extraction mode.
+
+Two archives are generated: many small files and a few huge ones. Every mode must
+produce the same result, which is checked along the way.
+
+Usage:
+    python benchmarks/bench_parallel_extraction.py [--workers N] [--repeat N]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django
+from django.conf import settings
+
+
+def write_archive(path, files):
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        for name, content in files:
+            zip_file.writestr(name, content)
+
+
+def text(rng, size):
+    words = [b"def", b"return", b"self", b"value", b"import", b"class", b"caf\xc3\xa9"]
+    parts = []
+    length = 0
+    while length < size:
+        line = b" ".join(rng.choice(words) for _ in range(10)) + b"\n"
+        parts.append(line)
+        length += len(line)
+    return b"".join(parts)[:size]
+
+
+def many_small_files(rng):
+    return [(f"repo/src/{i}.py", text(rng, 2048)) for i in range(5000)]
+
+
+def few_huge_files(rng):
+    return [(f"repo/data/{i}.txt", text(rng, 16 * 1024 * 1024)) for i in range(4)]
+
+
+async def run(path, mode, repeat):
+    from downloader.file_utils import extract_text_files
+    from downloader.skip_rules import NO_SKIP_RULES
+
+    best = None
+    result = None
+    for _ in range(repeat):
+        with zipfile.ZipFile(path) as zip_file:
+            start = time.perf_counter()
+            result = await extract_text_files(
+                zip_file,
+                max_files=10_000,
+                max_total_size=1024**3,
+                mode=mode,
+                # the huge files would be skipped as large
+                skip_rules=NO_SKIP_RULES,
+            )
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    settings.configure(
+        EXTRACTION_MODE="sequential",
+        EXTRACTION_WORKERS=args.workers,
+        EXTRACTION_PRIORITY=True,
+        EXTRACTION_PRIORITY_WEIGHTS={},
+        # every run decodes every member
+        BLOB_STORE_MAX_SIZE=0,
+        ARCHIVE_MMAP=True,
+    )
+    django.setup()
+    from downloader.file_utils import EXTRACTION_MODES
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        for name, files in [
+            ("many small files", many_small_files(rng)),
+            ("few huge files", few_huge_files(rng)),
+        ]:
+            path = os.path.join(directory, "archive.zip")
+            write_archive(path, files)
+            size = sum(len(content) for _, content in files)
+            print(
+                f"{name}: {len(files)} files, {size / 1024**2:.0f} MB, "
+                f"{args.workers} workers, best of {args.repeat}"
+            )
+
+            baseline = None
+            for mode in EXTRACTION_MODES:
+                # warm up the pools so their startup isn't measured
+                await run(path, mode, 1)
+                elapsed, result = await run(path, mode, args.repeat)
+                if baseline is None:
+                    baseline = (elapsed, result)
+                assert result == baseline[1], f"{mode} mode disagrees"
+                speedup = baseline[0] / elapsed
+                print(f"  {mode:>10}: {elapsed * 1000:8.1f} ms ({speedup:.2f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""
+Throughput of the plain text classifier backends.
+
+Compares the per-byte list membership loop `is_plain_text_file` used to run with the
+table-driven backends in `downloader.file_utils`.
+
+Usage:
+    python benchmarks/bench_text_classifier.py [--size-mb N] [--repeat N]
+"""
+
+import argparse
+import io
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader.file_utils import CLASSIFIER_BACKENDS, is_plain_text_file, np
+
+
+def legacy_is_plain_text_file(file_obj):
+    allow_list = list(range(9, 11)) + list(range(13, 14)) + list(range(32, 256))
+    block_list = list(range(0, 7)) + list(range(14, 32))
+    allow_found = False
+    first_chunk = file_obj.read(4096)
+    chunk = first_chunk
+    while chunk:
+        for byte in chunk:
+            if byte in allow_list:
+                allow_found = True
+            elif byte in block_list:
+                return False, first_chunk
+        chunk = file_obj.read(4096)
+    return allow_found, first_chunk
+
+
+def sample_text(size: int) -> bytes:
+    line = b"def function(argument):  # caf\xc3\xa9\n    return argument * 2\n\t\r\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+def measure(name, classify, data, repeat):
+    seconds = min(
+        timeit.repeat(lambda: classify(io.BytesIO(data)), number=1, repeat=repeat)
+    )
+    throughput = len(data) / seconds / (1024 * 1024)
+    print(f"{name:>8}: {throughput:10.1f} MB/s ({seconds * 1000:8.2f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = sample_text(int(args.size_mb * 1024 * 1024))
+    print(f"Classifying {len(data):,} bytes of text, best of {args.repeat}")
+
+    measure("legacy", legacy_is_plain_text_file, data, args.repeat)
+    for backend in CLASSIFIER_BACKENDS:
+        if backend == "numpy" and np is None:
+            print(f"{backend:>8}: skipped (numpy is not installed)")
+            continue
+        measure(
+            backend,
+            lambda file_obj: is_plain_text_file(file_obj, backend),
+            data,
+            args.repeat,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import os
+import shutil
+from dataclasses import dataclass
+from typing import IO, BinaryIO
+
+from django.conf import settings
+
+from .archives import ARCHIVE_FORMATS
+from .shared_cache import SharedCache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedArchive:
+    url: str
+    etag: str | None
+    last_modified: str | None
+    # one of `ARCHIVE_FORMATS`, which names the archive's file in the cache
+    archive_format: str = "zip"
+
+    def conditional_headers(self) -> dict[str, str]:
+        """The headers that make a request for this archive conditional."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def _cache() -> SharedCache:
+    # every worker process shares the archives
+    return SharedCache(
+        settings.ARCHIVE_CACHE_DIR, max_size=settings.ARCHIVE_CACHE_MAX_SIZE
+    )
+
+
+def _entry_name(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def is_enabled() -> bool:
+    return bool(settings.ARCHIVE_CACHE_MAX_SIZE)
+
+
+def get_cached_archive(url: str, archive_format: str = "zip") -> CachedArchive | None:
+    """
+    Returns the cached archive for a URL, or None if it isn't cached as an archive
+    of `archive_format`.
+    """
+    if not is_enabled():
+        return None
+    entry = _cache().get(_entry_name(url))
+    if entry is None or ARCHIVE_FORMATS[archive_format] not in entry.suffixes:
+        return None
+    return CachedArchive(
+        url, entry.metadata["etag"], entry.metadata["last_modified"], archive_format
+    )
+
+
+def cache_archive(
+    url: str,
+    file_obj: IO[bytes],
+    etag: str | None,
+    last_modified: str | None,
+    archive_format: str = "zip",
+):
+    """
+    Copies a downloaded archive of `archive_format` into the cache along with its
+    validators. Its file is named with the format's suffix.
+
+    Archives without an `ETag` or `Last-Modified` can't be revalidated, so they
+    aren't cached. The least recently used archives are evicted once the cache
+    holds more than `settings.ARCHIVE_CACHE_MAX_SIZE` bytes. The file object's
+    position is restored afterwards.
+    """
+    if not is_enabled() or not (etag or last_modified):
+        return
+
+    cache = _cache()
+    position = file_obj.tell()
+    file_obj.seek(0)
+    tmp_file, tmp_path = cache.temporary_file()
+    try:
+        with tmp_file:
+            shutil.copyfileobj(file_obj, tmp_file)
+        metadata = {"url": url, "etag": etag, "last_modified": last_modified}
+        cache.put(
+            _entry_name(url), {ARCHIVE_FORMATS[archive_format]: tmp_path}, metadata
+        )
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            # moved into the cache already
+            pass
+        raise
+    finally:
+        file_obj.seek(position)
+    logger.info(f"Cached archive from {url}")
+
+
+def open_cached_archive(archive: CachedArchive) -> BinaryIO | None:
+    """
+    Opens a cached archive and marks it as recently used. Returns None if it has
+    been evicted since `get_cached_archive` returned it.
+    """
+    return _cache().open(
+        _entry_name(archive.url), ARCHIVE_FORMATS[archive.archive_format]
+    )
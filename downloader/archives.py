@@ -0,0 +1,419 @@
+import asyncio
+import errno
+import io
+import mmap
+import os
+import queue
+import tarfile
+import tempfile
+import threading
+import zipfile
+import zlib
+from typing import IO, Callable
+
+from django.conf import settings
+
+from .zip_stream import MemberHandler, ZipStreamError, ZipStreamParser
+
+# archive format -> suffix of GitHub's /archive/<ref><suffix> endpoint
+ARCHIVE_FORMATS = {"zip": ".zip", "tar.gz": ".tar.gz"}
+
+Archive = zipfile.ZipFile | tarfile.TarFile
+
+TAR_READ_CHUNK_SIZE = 64 * 1024
+
+# how many downloaded chunks can wait to be parsed before the download waits for them
+STREAM_QUEUE_SIZE = 32
+
+
+class ArchiveStreamError(Exception):
+    """The archive couldn't be parsed while it downloaded."""
+
+
+def get_archive_format(archive_format: str | None = None) -> str:
+    """
+    Validates an archive format, defaulting to `settings.ARCHIVE_FORMAT`.
+
+    Raises:
+        ValueError: If the format isn't one of `ARCHIVE_FORMATS`.
+    """
+    if archive_format is None:
+        archive_format = settings.ARCHIVE_FORMAT
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(f"Unknown archive format: {archive_format!r}")
+    return archive_format
+
+
+def archive_url(repo_url: str, ref: str, archive_format: str) -> str:
+    return f"{repo_url}/archive/{ref}{ARCHIVE_FORMATS[archive_format]}"
+
+
+class MappedFile(mmap.mmap):
+    """
+    A read-only memory map of a file, read like the file itself.
+
+    `name` is the file's path, if it has one, which `zipfile.ZipFile` records as its
+    `filename`. Closing the map closes `file`, the file object it maps, too.
+    """
+
+    name: str | None = None
+    file: IO[bytes] | None = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, pos: int, whence: int = os.SEEK_SET):
+        try:
+            return super().seek(pos, whence)
+        except ValueError as e:
+            # file objects raise OSError for positions before the start, which
+            # `zipfile` relies on to tell a file is too short to be an archive
+            raise OSError(errno.EINVAL, str(e)) from None
+
+    def close(self):
+        super().close()
+        if self.file is not None:
+            self.file.close()
+
+
+def _in_memory(file: IO[bytes]) -> bool:
+    # a `tempfile.SpooledTemporaryFile` is kept in memory until it rolls over, which
+    # asking for its file descriptor would make it do. Its `name` is None until then.
+    return isinstance(file, tempfile.SpooledTemporaryFile) and file.name is None
+
+
+def map_file(file: str | IO[bytes], use_mmap: bool | None = None) -> IO[bytes]:
+    """
+    Maps an archive on disk into memory to read it from.
+
+    Reads of the map are served straight from the page cache, which every worker
+    reading the same file shares, instead of being copied through the buffers of a
+    file object first. Closing the map closes the file.
+
+    Args:
+        file (str | IO[bytes]): The path of the archive, or a file object of it.
+        use_mmap (bool | None): Whether to map it. Defaults to
+            `settings.ARCHIVE_MMAP`.
+
+    Returns:
+        IO[bytes]: A `MappedFile`, or `file` itself if it's held in memory (an
+        `io.BytesIO`, or a `tempfile.SpooledTemporaryFile` that hasn't rolled over),
+        is empty or isn't to be mapped. A path is then opened.
+    """
+    if use_mmap is None:
+        use_mmap = settings.ARCHIVE_MMAP
+    if isinstance(file, str):
+        file = open(file, "rb")
+    if not use_mmap or _in_memory(file):
+        return file
+    try:
+        fd = file.fileno()
+    except (AttributeError, OSError):
+        # `io.UnsupportedOperation` is an `OSError`
+        return file
+    # the map only sees what has been written to the file descriptor
+    file.flush()
+    if os.fstat(fd).st_size == 0:
+        # empty files can't be mapped
+        return file
+    mapped = MappedFile(fd, 0, access=mmap.ACCESS_READ)
+    mapped.file = file
+    name = getattr(file, "name", None)
+    mapped.name = name if isinstance(name, str) else None
+    return mapped
+
+
+class ZipArchive(zipfile.ZipFile):
+    """
+    A ZIP archive opened by `open_zip`. `file` is the file object it's read from,
+    which is closed along with it.
+    """
+
+    def __init__(self, file: IO[bytes]):
+        # set first: `close` is also called when the archive turns out invalid
+        self.file = file
+        super().__init__(file)
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+
+def open_zip(file: str | IO[bytes], use_mmap: bool | None = None) -> ZipArchive:
+    """
+    Opens a ZIP archive through `map_file`.
+
+    Raises:
+        zipfile.BadZipFile: If it isn't a valid archive, in which case `file` is
+            closed.
+    """
+    file_obj = map_file(file, use_mmap)
+    try:
+        return ZipArchive(file_obj)
+    except BaseException:
+        file_obj.close()
+        raise
+
+
+def open_archive(
+    file_obj: IO[bytes], archive_format: str, root: str | None = None
+) -> Archive:
+    """
+    Opens a downloaded archive. ZIP archives on disk are read through a memory map
+    of them (see `open_zip`).
+
+    Args:
+        file_obj (IO[bytes]): The archive.
+        archive_format (str): One of `ARCHIVE_FORMATS`.
+        root (str | None): For tarballs, the name their top-level directory is
+            renamed to (see `rename_root`).
+
+    Raises:
+        zipfile.BadZipFile | tarfile.TarError: If it isn't a valid archive.
+    """
+    if archive_format == "zip":
+        return open_zip(file_obj)
+    tar = tarfile.open(fileobj=file_obj, mode="r:gz")
+    if root is not None:
+        for tarinfo in tar.getmembers():
+            tarinfo.name = rename_root(tarinfo.name, root)
+    return tar
+
+
+def rename_root(name: str, root: str) -> str:
+    """
+    Renames the top-level directory of an archive member.
+
+    GitHub names the top-level directory of its ZIP archives `<repo>-<ref>`, and that
+    of its tarballs `<owner>-<repo>-<sha>`. Renaming the latter makes both formats
+    produce the same paths.
+    """
+    _, separator, rest = name.partition("/")
+    return f"{root}{separator}{rest}"
+
+
+def close_archive(archive: Archive):
+    """Closes an archive along with the file object it was opened from."""
+    if isinstance(archive, ZipArchive):
+        archive.close()
+        return
+    if isinstance(archive, zipfile.ZipFile):
+        file_obj = archive.fp
+    else:
+        # the underlying file of the gzip stream
+        file_obj = getattr(archive.fileobj, "fileobj", archive.fileobj)
+    archive.close()
+    if file_obj is not None:
+        file_obj.close()
+
+
+def get_archive_comment(archive: Archive) -> str:
+    """
+    Returns the comment of an archive. GitHub records the commit an archive was
+    built from as the ZIP comment, or in the tarball's pax global header.
+    """
+    if isinstance(archive, zipfile.ZipFile):
+        return archive.comment.decode("ascii", errors="ignore")
+    return archive.pax_headers.get("comment", "")
+
+
+def get_uncompressed_size(archive: Archive) -> int:
+    """Returns the sum of the uncompressed sizes of an archive's members."""
+    if isinstance(archive, zipfile.ZipFile):
+        return sum(member.file_size for member in archive.infolist())
+    members = (tar_member_info(tarinfo) for tarinfo in archive.getmembers())
+    return sum(member.file_size for member in members if member is not None)
+
+
+def tar_member_info(tarinfo: tarfile.TarInfo) -> zipfile.ZipInfo | None:
+    """
+    Describes a tarball member the way the same member of a ZIP archive is described,
+    so the rest of the extraction doesn't need to know which format it came from.
+
+    Like in GitHub's ZIP archives, a symlink is a file holding its target. Returns
+    None for members GitHub's ZIP archives don't have (devices, hard links...).
+    """
+    if tarinfo.isdir():
+        member = zipfile.ZipInfo(tarinfo.name.rstrip("/") + "/")
+    elif tarinfo.isfile():
+        member = zipfile.ZipInfo(tarinfo.name)
+        member.file_size = tarinfo.size
+    elif tarinfo.issym():
+        member = zipfile.ZipInfo(tarinfo.name)
+        member.file_size = len(tarinfo.linkname.encode("utf-8"))
+    else:
+        return None
+    # tarballs don't record checksums of their members
+    member.CRC = 0
+    return member
+
+
+def read_tar_members(
+    tar: tarfile.TarFile, handler: MemberHandler, root: str | None = None
+):
+    """
+    Passes the members of a tarball to a `MemberHandler` in archive order, reading
+    it front to back exactly once.
+
+    Args:
+        tar (tarfile.TarFile): The tarball, opened for random or stream access.
+        handler (MemberHandler): Receives the members and their content.
+        root (str | None): The name the top-level directory is renamed to (see
+            `rename_root`).
+    """
+    for tarinfo in tar:
+        if root is not None:
+            tarinfo.name = rename_root(tarinfo.name, root)
+        member = tar_member_info(tarinfo)
+        if member is None:
+            continue
+        if handler.start_member(member):
+            if tarinfo.issym():
+                handler.member_data(tarinfo.linkname.encode("utf-8"))
+            elif tarinfo.isfile():
+                with tar.extractfile(tarinfo) as file:
+                    while chunk := file.read(TAR_READ_CHUNK_SIZE):
+                        if not handler.member_data(chunk):
+                            break
+        handler.end_member(member)
+
+
+class _QueueReader(io.RawIOBase):
+    # a blocking file object over the chunks put on a queue, None or `aborted` marking
+    # the end
+    def __init__(self, chunks: queue.Queue, aborted: threading.Event):
+        self._chunks = chunks
+        self._aborted = aborted
+        self._pending = b""
+        self.exhausted = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending and not self.exhausted:
+            chunk = self._chunks.get()
+            if chunk is None or self._aborted.is_set():
+                self.exhausted = True
+            else:
+                self._pending = chunk
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def _parse_zip(reader: _QueueReader, handler: MemberHandler, root: str | None):
+    parser = ZipStreamParser(handler)
+    while data := reader.read(TAR_READ_CHUNK_SIZE):
+        parser.feed(data)
+    parser.close()
+
+
+def _parse_tar(reader: _QueueReader, handler: MemberHandler, root: str | None):
+    with tarfile.open(fileobj=reader, mode="r|gz") as tar:
+        read_tar_members(tar, handler, root)
+
+
+_STREAM_PARSERS: dict[
+    str, Callable[[_QueueReader, MemberHandler, str | None], None]
+] = {
+    "zip": _parse_zip,
+    "tar.gz": _parse_tar,
+}
+
+# what a truncated, corrupt or unsupported archive raises while it's parsed
+_STREAM_ERRORS = (ZipStreamError, tarfile.TarError, EOFError, zlib.error, OSError)
+
+
+class BackgroundArchiveParser:
+    """
+    Parses an archive in a thread of its own while it downloads.
+
+    `feed` only queues the chunk, so parsing, decompressing and whatever the handler
+    does with the members overlap the download instead of blocking the event loop. At
+    most `STREAM_QUEUE_SIZE` chunks wait to be parsed: past that, `feed` waits for the
+    parser, which slows the download down to its pace. ZIP archives are read from their
+    local file headers (see `ZipStreamParser`), tarballs through a single gzip decoder.
+    Must be created from a running event loop.
+
+    Args:
+        handler (MemberHandler): Receives the members and their content.
+        archive_format (str): One of `ARCHIVE_FORMATS`.
+        root (str | None): For tarballs, the name their top-level directory is
+            renamed to (see `rename_root`).
+    """
+
+    def __init__(
+        self, handler: MemberHandler, archive_format: str, root: str | None = None
+    ):
+        self._parse = _STREAM_PARSERS[archive_format]
+        self._handler = handler
+        self._root = root
+        self._chunks = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self._aborted = threading.Event()
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self._done = loop.create_future()
+        self._thread = threading.Thread(
+            target=self._run, args=(loop,), name="archive-stream", daemon=True
+        )
+        self._thread.start()
+
+    async def feed(self, data: bytes):
+        """Queues a chunk, waiting while `STREAM_QUEUE_SIZE` chunks are queued."""
+        if data:
+            await self._put(data)
+
+    async def close(self):
+        """
+        Waits for the queued chunks to be parsed.
+
+        Raises:
+            ArchiveStreamError: If the archive can't be parsed front to back.
+                Anything else the handler raised is raised as is.
+        """
+        await self._put(None)
+        await self._done
+
+    def abort(self):
+        """Stops the thread without waiting for it, e.g. when the download failed."""
+        self._aborted.set()
+        try:
+            self._chunks.put_nowait(None)
+        except queue.Full:
+            # the thread stops at the next chunk it takes
+            pass
+        self._done.cancel()
+
+    async def _put(self, chunk: bytes | None):
+        try:
+            self._chunks.put_nowait(chunk)
+        except queue.Full:
+            await self._loop.run_in_executor(None, self._chunks.put, chunk)
+
+    def _run(self, loop: asyncio.AbstractEventLoop):
+        reader = _QueueReader(self._chunks, self._aborted)
+        error = None
+        try:
+            self._parse(reader, self._handler, self._root)
+        except _STREAM_ERRORS as e:
+            error = ArchiveStreamError(str(e) or type(e).__name__)
+            error.__cause__ = e
+        except Exception as e:
+            error = e
+        # keep draining the queue so it doesn't grow until the download ends
+        while not reader.exhausted and reader.read(TAR_READ_CHUNK_SIZE):
+            pass
+        loop.call_soon_threadsafe(self._finish, error)
+
+    def _finish(self, error: Exception | None):
+        if self._done.done():
+            return
+        if error is None:
+            self._done.set_result(None)
+        else:
+            self._done.set_exception(error)
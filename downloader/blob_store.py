@@ -0,0 +1,86 @@
+import os
+import zipfile
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from .caching import LRUCache
+
+
+@dataclass(frozen=True)
+class DecodedBlob:
+    # the SHA-256 of the member's data, which members taken from the store are
+    # recorded with, to find their duplicates by
+    digest: bytes
+    text: str
+
+
+# (CRC-32, size, extension, classifier backend, detect_minified) -> DecodedBlob,
+# bounded by the number of characters of text kept. Created on first use, so
+# importing this module doesn't need Django's settings (e.g. in worker processes).
+_blobs: LRUCache | None = None
+
+
+def _get_blobs() -> LRUCache:
+    global _blobs
+    if _blobs is None:
+        _blobs = LRUCache(max_size=settings.BLOB_STORE_MAX_SIZE)
+    return _blobs
+
+
+def is_enabled() -> bool:
+    return bool(settings.BLOB_STORE_MAX_SIZE)
+
+
+def _blob_key(
+    member: zipfile.ZipInfo, classifier_backend: str, detect_minified: bool
+) -> tuple:
+    # besides its data, decoding a member only depends on its extension (which
+    # encoding declarations are looked for, whether it can be minified) and on how
+    # it's classified
+    extension = os.path.splitext(member.filename)[1].lower()
+    return (
+        member.CRC,
+        member.file_size,
+        extension,
+        classifier_backend,
+        detect_minified,
+    )
+
+
+def get_blob(
+    member: zipfile.ZipInfo, classifier_backend: str, detect_minified: bool
+) -> DecodedBlob | None:
+    """
+    Returns the text a member with the same CRC-32, size and extension was decoded
+    to, in this or any other archive, if there is one.
+
+    Like duplicates within an archive, the member is taken to have the same data
+    from its CRC-32 and size alone, so it never has to be decompressed. Members
+    without a CRC-32 (those of tarballs) are never found.
+    """
+    if not member.CRC or not is_enabled():
+        return None
+    return _get_blobs().get(_blob_key(member, classifier_backend, detect_minified))
+
+
+def store_blob(
+    member: zipfile.ZipInfo,
+    classifier_backend: str,
+    detect_minified: bool,
+    digest: bytes,
+    text: str,
+):
+    """Keeps the text a member was decoded to, for `get_blob`."""
+    if not member.CRC or not is_enabled():
+        return
+    _get_blobs().set(
+        _blob_key(member, classifier_backend, detect_minified),
+        DecodedBlob(digest, text),
+        size=len(text),
+    )
+
+
+def clear_blob_store():
+    if _blobs is not None:
+        _blobs.clear()
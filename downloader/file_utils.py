@@ -1,29 +1,148 @@
 import asyncio
 import codecs
+import collections
+import concurrent.futures
+import hashlib
 import io
 import logging
+import math
+import multiprocessing
+import operator
+import os
+import queue
 import re
+import shutil
+import tarfile
+import tempfile
+import threading
 import zipfile
 from contextlib import contextmanager
-from dataclasses import dataclass
-from typing import Any, BinaryIO, IO, TextIO
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Callable, IO, Iterable, Iterator, TextIO
 
+from django.conf import settings
 from django.template.loader import render_to_string
+from django.utils.html import escape
+
+from . import blob_store
+from .archives import (
+    ZipArchive,
+    close_archive,
+    open_zip,
+    read_tar_members,
+    tar_member_info,
+)
+from .path_filter import PathFilter
+from .priority import MemberPriority, get_member_priority
+from .skip_rules import SkipRules, get_skip_rules, looks_minified
 
 logger = logging.getLogger(__name__)
 
 
+# Regular expressions for encoding declarations, each capturing the encoding in a group
+# named after the file type it's declared in
+ENCODING_PATTERNS = {
+    "Python": r"coding[=:]\s*(?P<Python>[-\w.]+)",
+    "Ruby": r"coding[=:]\s*(?P<Ruby>[-\w.]+)",
+    "XML": r'<\?xml\s+.*encoding=["\'](?P<XML>[-\w.]+)["\'].*\?>',
+    "HTML": r'<meta\s+.*charset=["\'](?P<HTML>[-\w.]+)["\'].*>',
+    "Perl": r'use\s+encoding\s+["\'](?P<Perl>[-\w.]+)["\']',
+    "CSS": r'@charset\s+["\'](?P<CSS>[-\w.]+)["\']',
+    "LaTeX": r"%\s*!TEX\s+encoding\s*=\s*(?P<LaTeX>[-\w.]+)",
+    "XHTML": r'<\?xml\s+.*encoding=["\'](?P<XHTML>[-\w.]+)["\'].*\?>',
+}
+
+# Declarations that are only legal in the first two lines of a file...
+LINE_DECLARATION_TYPES = ["Python", "Ruby", "XML", "CSS", "LaTeX", "XHTML"]
+DECLARATION_LINES = 2
+# ...and ones that may come later, as long as it's within the first 1024 characters
+# (where browsers look for a `<meta charset>`)
+DOCUMENT_DECLARATION_TYPES = ["HTML", "Perl"]
+DECLARATION_SCAN_SIZE = 1024
+
+# The file types whose declarations are looked for in files with these extensions.
+# Files with other extensions are checked for every type.
+EXTENSION_FILE_TYPES = {
+    ".py": ["Python"],
+    ".pyw": ["Python"],
+    ".pyx": ["Python"],
+    ".rb": ["Ruby"],
+    ".rake": ["Ruby"],
+    ".gemspec": ["Ruby"],
+    ".xml": ["XML"],
+    ".xsd": ["XML"],
+    ".xsl": ["XML"],
+    ".xslt": ["XML"],
+    ".svg": ["XML"],
+    ".html": ["XML", "HTML"],
+    ".htm": ["XML", "HTML"],
+    ".xhtml": ["XHTML", "HTML"],
+    ".pl": ["Perl"],
+    ".pm": ["Perl"],
+    ".t": ["Perl"],
+    ".css": ["CSS"],
+    ".scss": ["CSS"],
+    ".less": ["CSS"],
+    ".tex": ["LaTeX"],
+    ".sty": ["LaTeX"],
+    ".cls": ["LaTeX"],
+}
+
+
+def _compile_declaration_pattern(file_types: list[str]) -> re.Pattern | None:
+    # Alternatives are tried in order at each position, so this finds the earliest
+    # declaration in a single pass. Python and Ruby, and XML and XHTML, share a
+    # pattern: only the first of each pair can ever match.
+    alternatives = [ENCODING_PATTERNS[file_type] for file_type in file_types]
+    return re.compile("|".join(alternatives)) if alternatives else None
+
+
+def _compile_declaration_patterns(
+    file_types: list[str],
+) -> tuple[re.Pattern | None, re.Pattern | None]:
+    return (
+        _compile_declaration_pattern(
+            [t for t in file_types if t in LINE_DECLARATION_TYPES]
+        ),
+        _compile_declaration_pattern(
+            [t for t in file_types if t in DOCUMENT_DECLARATION_TYPES]
+        ),
+    )
+
+
+_DEFAULT_DECLARATION_PATTERNS = _compile_declaration_patterns(list(ENCODING_PATTERNS))
+_EXTENSION_DECLARATION_PATTERNS = {
+    extension: _compile_declaration_patterns(file_types)
+    for extension, file_types in EXTENSION_FILE_TYPES.items()
+}
+
+
+def _first_lines(text: str, count: int) -> str:
+    end = -1
+    for _ in range(count):
+        end = text.find("\n", end + 1)
+        if end == -1:
+            return text
+    return text[:end]
+
+
 def find_encoding_declaration(
     decoded_content: str,
+    filename: str | None = None,
 ) -> tuple[str, str] | tuple[str, None] | tuple[None, None]:
     """
     Searches for and verifies encoding declarations within a given string.
 
-    The function scans the input string for encoding declarations specific to several
-    file types. If a valid encoding declaration is found, the file type and the
-    encoding are returned. If the encoding declaration is found but is invalid,
-    the function returns the file type and None. If no encoding declaration is
-    detected, the function returns (None, None).
+    The function scans the start of the input string for encoding declarations
+    specific to several file types. If a valid encoding declaration is found, the file
+    type and the encoding are returned. If the encoding declaration is found but is
+    invalid, the function returns the file type and None. If no encoding declaration
+    is detected, the function returns (None, None).
+
+    Only the places a declaration is legal in are scanned: the first two lines, or
+    the first 1024 characters for HTML and Perl. When a filename is given, only the
+    declarations that make sense for its extension are looked for (see
+    `EXTENSION_FILE_TYPES`), so a CSS file isn't mistaken for Python.
 
     Supported file types include:
     - Python
@@ -37,6 +156,7 @@ def find_encoding_declaration(
 
     Args:
         decoded_content (str): The input string to scan for encoding declarations.
+        filename (str | None): The name of the file the string comes from.
 
     Returns:
         A tuple (file_type, encoding) where 'file_type' is the file type of the found
@@ -50,87 +170,107 @@ def find_encoding_declaration(
         >>> find_encoding_declaration('# coding: unknown_encoding')
         ('Python', None)
 
+        >>> find_encoding_declaration('# coding: utf-8', 'lib/gem.rb')
+        ('Ruby', 'utf-8')
+
         >>> find_encoding_declaration('Hello, World!')
         (None, None)
     """
-    # Regular expressions for encoding declarations
-    encoding_patterns = {
-        "Python": re.compile(r"coding[=:]\s*([-\w.]+)"),
-        "Ruby": re.compile(r"coding[=:]\s*([-\w.]+)"),
-        "XML": re.compile(r'<\?xml\s+.*encoding=["\']([-\w.]+)["\'].*\?>'),
-        "HTML": re.compile(r'<meta\s+.*charset=["\']([-\w.]+)["\'].*>'),
-        "Perl": re.compile(r'use\s+encoding\s+["\']([-\w.]+)["\']'),
-        "CSS": re.compile(r'@charset\s+["\']([-\w.]+)["\']'),
-        "LaTeX": re.compile(r"%\s*!TEX\s+encoding\s*=\s*([-\w.]+)"),
-        "XHTML": re.compile(r'<\?xml\s+.*encoding=["\']([-\w.]+)["\'].*\?>'),
-    }
+    patterns = _DEFAULT_DECLARATION_PATTERNS
+    if filename is not None:
+        extension = os.path.splitext(filename)[1].lower()
+        patterns = _EXTENSION_DECLARATION_PATTERNS.get(extension, patterns)
+    line_pattern, document_pattern = patterns
 
-    # Check for encoding declarations in the decoded content
-    for file_type, pattern in encoding_patterns.items():
-        match = pattern.search(decoded_content)
-        if match:
-            encoding = match.group(1)
-            try:
-                codecs.lookup(encoding)
-                return file_type, encoding
-            except LookupError:
-                return file_type, None
+    match = None
+    if line_pattern is not None:
+        match = line_pattern.search(_first_lines(decoded_content, DECLARATION_LINES))
+    if match is None and document_pattern is not None:
+        match = document_pattern.search(decoded_content, 0, DECLARATION_SCAN_SIZE)
+    if match is None:
+        # No encoding declaration found
+        return None, None
 
-    # No encoding declaration found
-    return None, None
+    file_type = match.lastgroup
+    encoding = match.group(file_type)
+    try:
+        codecs.lookup(encoding)
+        return file_type, encoding
+    except LookupError:
+        return file_type, None
+
+
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+]
+
+# EBCDIC code pages a declaration is looked for in when the content isn't ASCII
+# compatible
+FALLBACK_ENCODINGS = ["cp875", "cp1026", "cp1140"]
 
 
 def detect_internal_encoding_from_bytes(
     bytes_content: bytes,
+    filename: str | None = None,
 ) -> tuple[str, str] | tuple[None, None]:
     """
     Determines the encoding from the bytes content, if an encoding declaration is present.
 
+    Only the first `DECLARATION_SCAN_SIZE` characters' worth of bytes are decoded.
+    Content that is ASCII or valid UTF-8, which is nearly everything, is scanned
+    once; the EBCDIC fallback encodings are only tried for anything else.
+
     Args:
         bytes_content: Bytes to be assessed for an encoding declaration.
+        filename: The name of the file the bytes come from, used to only look for
+            the declarations that make sense for its extension.
 
     Returns:
         A tuple containing the file type and the declared encoding found within the content.
         If no encoding declaration is found, returns a tuple with None values.
     """
-    encoding = None
-    for bom, bom_encoding in [
-        (codecs.BOM_UTF32_LE, "utf-32-le"),
-        (codecs.BOM_UTF32_BE, "utf-32-be"),
-        (codecs.BOM_UTF16_LE, "utf-16-le"),
-        (codecs.BOM_UTF16_BE, "utf-16-be"),
-        (codecs.BOM_UTF8, "utf-8-sig"),
-    ]:
+    ascii_compatible = True
+    for bom, bom_encoding in BOMS:
         if bytes_content.startswith(bom):
-            encoding = bom_encoding
+            # a BOM'd UTF-16 or UTF-32 character takes up to 4 bytes
+            head = bytes_content[: DECLARATION_SCAN_SIZE * 4]
+            decoded_content = codecs.decode(head, bom_encoding, "ignore")
             break
-
-    if encoding:
-        decoded_content = bytes_content.decode(encoding)
     else:
-        try:
-            decoded_content = bytes_content.decode("utf-8")
-        except UnicodeDecodeError:
-            decoded_content = bytes_content.decode("ascii", errors="ignore")
+        head = bytes_content[:DECLARATION_SCAN_SIZE]
+        if head.isascii():
+            decoded_content = head.decode("ascii")
+        else:
+            try:
+                # not final: the head may end in the middle of a character
+                decoded_content, _ = codecs.utf_8_decode(head, "strict", False)
+            except UnicodeDecodeError:
+                decoded_content = head.decode("ascii", errors="ignore")
+                ascii_compatible = False
 
-    file_type, encoding = find_encoding_declaration(decoded_content)
+    file_type, encoding = find_encoding_declaration(decoded_content, filename)
 
     if encoding:
         return file_type, encoding
+    if ascii_compatible:
+        return None, None
 
-    fallback_encodings = ["cp875", "cp1026", "cp1140"]
-    for fallback_encoding in fallback_encodings:
-        try:
-            decoded_content = bytes_content.decode(fallback_encoding)
-            file_type, encoding = find_encoding_declaration(decoded_content)
-            if encoding:
-                return file_type, encoding
-        except UnicodeDecodeError:
-            continue
+    for fallback_encoding in FALLBACK_ENCODINGS:
+        decoded_content = head.decode(fallback_encoding, errors="ignore")
+        file_type, encoding = find_encoding_declaration(decoded_content, filename)
+        if encoding:
+            return file_type, encoding
 
     return None, None
 
 
+READ_CHUNK_SIZE = 64 * 1024
+
+
 @contextmanager
 def seek_to_start(file_obj):
     file_obj.seek(0)
@@ -143,7 +283,89 @@ def seek_to_start(file_obj):
         file_obj.seek(0)
 
 
-def is_plain_text_file(file_obj: IO[bytes]) -> tuple[bool, bytes]:
+# Byte classes from zlib's txtvsbin algorithm. Bytes 7, 8, 11 and 12 are neither
+# allowed nor blocked: they are tolerated but not counted as evidence of text.
+ALLOW_BYTES = bytes([9, 10, 13]) + bytes(range(32, 256))
+BLOCK_BYTES = bytes(range(0, 7)) + bytes(range(14, 32))
+
+# ``bytes.translate`` deletion sets. Deleting every non-blocked byte leaves only the
+# blocked ones, and deleting every allowed byte tells us whether any were present.
+_NON_BLOCK_BYTES = bytes(b for b in range(256) if b not in BLOCK_BYTES)
+
+# 256-entry lookup tables for the pure Python backend.
+_ALLOW_TABLE = tuple(b in ALLOW_BYTES for b in range(256))
+_BLOCK_TABLE = tuple(b in BLOCK_BYTES for b in range(256))
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+else:
+    _NUMPY_ALLOW_INDEX = np.frombuffer(ALLOW_BYTES, dtype=np.uint8)
+    _NUMPY_BLOCK_INDEX = np.frombuffer(BLOCK_BYTES, dtype=np.uint8)
+
+
+def _classify_chunk_table(chunk: bytes) -> tuple[bool, bool]:
+    blocked = bool(chunk.translate(None, _NON_BLOCK_BYTES))
+    if blocked:
+        return False, True
+    allowed = len(chunk.translate(None, ALLOW_BYTES)) < len(chunk)
+    return allowed, False
+
+
+def _classify_chunk_numpy(chunk: bytes) -> tuple[bool, bool]:
+    histogram = np.bincount(np.frombuffer(chunk, dtype=np.uint8), minlength=256)
+    if histogram[_NUMPY_BLOCK_INDEX].any():
+        return False, True
+    return bool(histogram[_NUMPY_ALLOW_INDEX].any()), False
+
+
+def _classify_chunk_python(chunk: bytes) -> tuple[bool, bool]:
+    allowed = False
+    for byte in chunk:
+        if _BLOCK_TABLE[byte]:
+            return False, True
+        if _ALLOW_TABLE[byte]:
+            allowed = True
+    return allowed, False
+
+
+CLASSIFIER_BACKENDS = {
+    "table": _classify_chunk_table,
+    "numpy": _classify_chunk_numpy,
+    "python": _classify_chunk_python,
+}
+
+DEFAULT_CLASSIFIER_BACKEND = "table"
+
+
+def get_chunk_classifier(backend: str = DEFAULT_CLASSIFIER_BACKEND):
+    """
+    Returns the chunk classification function for the given backend.
+
+    Each classifier takes a chunk of bytes and returns a tuple
+    ``(allow_found, block_found)``.
+
+    Args:
+        backend (str): One of "table" (``bytes.translate`` based, the default),
+            "numpy" (histogram based, requires numpy) or "python" (a pure Python
+            loop over lookup tables).
+
+    Raises:
+        ValueError: If the backend is unknown or its dependencies are missing.
+    """
+    try:
+        classifier = CLASSIFIER_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown text classifier backend: {backend!r}")
+    if backend == "numpy" and np is None:
+        raise ValueError("The 'numpy' text classifier backend requires numpy.")
+    return classifier
+
+
+def is_plain_text_file(
+    file_obj: IO[bytes], backend: str = DEFAULT_CLASSIFIER_BACKEND
+) -> tuple[bool, bytes]:
     """
     Checks whether a file is a plain text or a binary file by analyzing its contents.
 
@@ -158,8 +380,13 @@ def is_plain_text_file(file_obj: IO[bytes]) -> tuple[bool, bytes]:
     A thorough explanation of the algorithm can be located at:
     https://github.com/madler/zlib/blob/8678871f18f4dd51101a9db1e37791f975969079/doc/txtvsbin.txt
 
+    The byte classes are precomputed, so each chunk is classified by the selected
+    backend (see `get_chunk_classifier`) rather than by testing every byte against
+    the allow and block lists.
+
     Args:
         file_obj (IO[bytes]): The file object to be checked.
+        backend (str): The classifier backend to use (default: "table").
 
     Returns:
         tuple[bool, bytes]: A tuple containing two items:
@@ -168,42 +395,214 @@ def is_plain_text_file(file_obj: IO[bytes]) -> tuple[bool, bytes]:
 
     Raises:
         IOError: If there's a problem in reading the file.
+        ValueError: If the backend is unknown or unavailable.
 
     Note:
         The algorithm considers an empty file as a binary.
     """
-    allow_list = list(range(9, 11)) + list(range(13, 14)) + list(range(32, 256))
-    # gray_list = [7, 8, 11, 12, 26, 27]
-    block_list = list(range(0, 7)) + list(range(14, 32))
-
+    classify_chunk = get_chunk_classifier(backend)
     allow_found = False
 
     with seek_to_start(file_obj) as file_obj:
-        #    Check if the file is empty and return True immediately if it is
-        first_byte = file_obj.read(1)
-        if not first_byte:
+        first_chunk = file_obj.read(4096)
+        if not first_chunk:
             return False, b""  # Return False for an empty file
 
-        on_first_chunk = True
-        first_chunk = None
+        chunk = first_chunk
+        while chunk:
+            chunk_allow_found, block_found = classify_chunk(chunk)
+            if block_found:
+                return False, first_chunk
+            allow_found = allow_found or chunk_allow_found
+            chunk = file_obj.read(4096)
+
+        return allow_found, first_chunk
+
+
+class MemberTextDecoder:
+    """
+    Classifies and decodes a single archive member while its bytes arrive.
+
+    Data is passed to `feed` as it is decompressed. Every chunk is classified with the
+    same zlib txtvsbin rules as `is_plain_text_file` before it is decoded, the
+    encoding is detected from the first `head_size` bytes, and the rest is decoded
+    incrementally. This lets a member be decompressed exactly once, and `feed`
+    returns False the moment a blocked byte shows up so the caller can stop
+    decompressing a binary file early.
+
+    Args:
+        classifier_backend (str): The chunk classifier backend to use.
+        max_size (int | None): The maximum number of decoded characters to keep. Once
+            it is exceeded, decoding stops (classification continues so that a binary
+            file is still reported as binary) and, once `finish` has been called,
+            `size_exceeded` is True for a text member.
+        filename (str | None): The member's name, used to pick the encoding
+            declarations to look for.
+        detect_minified (bool): Stop as soon as the head shows the member is minified
+            (see `looks_minified`); `minified` is then True and `finish` returns
+            None.
+        digest (bool): Hash the member's data as it's fed, for `digest`.
+    """
+
+    head_size = 4096
+
+    def __init__(
+        self,
+        classifier_backend: str = DEFAULT_CLASSIFIER_BACKEND,
+        max_size: int | None = None,
+        filename: str | None = None,
+        detect_minified: bool = False,
+        digest: bool = False,
+    ):
+        self._classify_chunk = get_chunk_classifier(classifier_backend)
+        self._hash = hashlib.sha256() if digest else None
+        self._max_size = max_size
+        self._filename = filename
+        self._detect_minified = detect_minified and filename is not None
+        self.minified = False
+        self._allow_found = False
+        self._block_found = False
+        self._head = bytearray()
+        self._decoder = None
+        self._parts = []
+        self._size_exceeded = False
+        self.size = 0
+
+    @property
+    def is_binary(self) -> bool:
+        return self._block_found
+
+    @property
+    def size_exceeded(self) -> bool:
+        return self._size_exceeded and self._allow_found and not self._block_found
+
+    @property
+    def digest(self) -> bytes | None:
+        """
+        The SHA-256 of the data fed so far, if it was asked for. It's only the
+        member's if all of it was fed, i.e. `feed` never returned False.
+        """
+        return None if self._hash is None else self._hash.digest()
+
+    def feed(self, data: bytes) -> bool:
+        """
+        Classifies and decodes the next chunk of the member.
+
+        Returns:
+            bool: False if the member turned out to be binary and no more data is
+            needed, True otherwise.
+        """
+        if self._block_found or self.minified:
+            return False
+        if not data:
+            return True
+        if self._hash is not None:
+            self._hash.update(data)
+
+        allow_found, block_found = self._classify_chunk(data)
+        if block_found:
+            self._block_found = True
+            self._head = None
+            self._parts = []
+            return False
+        self._allow_found = self._allow_found or allow_found
+
+        if self._decoder is None:
+            self._head += data
+            if len(self._head) >= self.head_size:
+                if self._detect_minified and looks_minified(
+                    self._filename, self._head[: self.head_size], self.head_size
+                ):
+                    self.minified = True
+                    self._head = None
+                    return False
+                self._start_decoding()
+        else:
+            self._decode(data)
+        return True
+
+    def finish(self) -> str | None:
+        """
+        Flushes the decoder.
+
+        Returns:
+            str | None: The decoded content, or None if the member is binary, empty,
+            minified, or exceeded `max_size`.
+        """
+        if self._block_found or self.minified:
+            return None
+        if self._decoder is None:
+            if not self._head:
+                return None  # an empty file is considered binary
+            self._start_decoding()
+        if not self._allow_found:
+            return None
+        self._decode(b"", final=True)
+        if self._size_exceeded:
+            return None
+        return "".join(self._parts)
 
-        while True:
-            chunk = file_obj.read(4095 if on_first_chunk else 4096)
-            if not chunk:
+    def _start_decoding(self):
+        head = bytes(self._head)
+        self._head = None
+        _, encoding = detect_internal_encoding_from_bytes(
+            head[: self.head_size], self._filename
+        )
+        try:
+            decoder_class = codecs.getincrementaldecoder(encoding or "utf-8")
+        except LookupError:
+            decoder_class = codecs.getincrementaldecoder("utf-8")
+        self._decoder = decoder_class(errors="replace")
+        self._decode(head)
+
+    def _decode(self, data: bytes, final: bool = False):
+        if self._size_exceeded:
+            return
+        text = self._decoder.decode(data, final)
+        self.size += len(text)
+        if self._max_size is not None and self.size > self._max_size:
+            self._size_exceeded = True
+            self._parts = []
+            return
+        self._parts.append(text)
+
+
+def read_text_member(
+    zip_file: zipfile.ZipFile,
+    member: zipfile.ZipInfo,
+    max_size: int | None = None,
+    classifier_backend: str = DEFAULT_CLASSIFIER_BACKEND,
+    detect_minified: bool = False,
+    digest: bool = False,
+) -> MemberTextDecoder:
+    """
+    Decompresses, classifies and decodes a ZIP member in a single pass.
+
+    Returns:
+        MemberTextDecoder: The finished decoder. Use `finish()` to get the content.
+    """
+    decoder = MemberTextDecoder(
+        classifier_backend, max_size, member.filename, detect_minified, digest
+    )
+    with zip_file.open(member, "r") as file:
+        while chunk := file.read(READ_CHUNK_SIZE):
+            if not decoder.feed(chunk):
                 break
+    return decoder
 
-            if on_first_chunk:
-                chunk = first_byte + chunk
-                on_first_chunk = False
-                first_chunk = chunk
 
-            for byte in chunk:
-                if byte in allow_list:
-                    allow_found = True
-                elif byte in block_list:
-                    return False, first_chunk
+def member_digest(zip_file: zipfile.ZipFile, member: zipfile.ZipInfo) -> bytes:
+    """Returns the SHA-256 of a ZIP member's data, decompressing but not decoding it."""
+    with zip_file.open(member, "r") as file:
+        return hashlib.file_digest(file, "sha256").digest()
 
-        return allow_found, first_chunk
+
+def content_key(member: zipfile.ZipInfo) -> tuple[int, int]:
+    """
+    Identifies a member's content from its CRC-32 and size: members with different
+    keys can't have the same content, members with the same key almost always do.
+    """
+    return member.CRC, member.file_size
 
 
 @dataclass
@@ -212,6 +611,12 @@ class ExtractionResult:
     file_limit_reached: bool
     size_limit_reached: bool
     total_files_count: int
+    # how many members each skip rule left out (see `downloader.skip_rules`)
+    skipped_files: dict[str, int] = field(default_factory=dict)
+    # the path of each text file whose content is the same as that of an earlier one
+    # -> the path of that earlier one. They're still in `text_files`, but their
+    # content is only rendered once.
+    duplicate_files: dict[str, str] = field(default_factory=dict)
 
     def render_template(self, repo_name: str, template_name: str) -> str:
         files = []
@@ -220,6 +625,7 @@ class ExtractionResult:
                 {
                     "path": file_path,
                     "content": file_content,
+                    "duplicate_of": self.duplicate_files.get(file_path),
                 }
             )
 
@@ -230,12 +636,1207 @@ class ExtractionResult:
         rendered_template = render_to_string(template_name, context)
         return rendered_template
 
+    def render_chunks(self, repo_name: str) -> Iterator[str]:
+        """
+        Renders the concatenated output piece by piece.
 
-async def extract_text_files(
+        The output is exactly what `render_template` renders with
+        `repo_template.txt`, produced straight from `text_files` in chunks of about
+        `RENDER_CHUNK_SIZE` characters. Nothing the size of the whole output is
+        ever built, so it can be written to a file (see `store_result`) or sent with
+        a `StreamingHttpResponse` while it's rendered.
+        """
+        return _coalesce(self._render_pieces(repo_name), RENDER_CHUNK_SIZE)
+
+    def _render_pieces(self, repo_name: str) -> Iterator[str]:
+        # mirrors repo_template.txt, which autoescapes everything but the contents
+        yield f"# GITHUB REPO: {escape(repo_name)}\n\n"
+        for file_path, file_content in self.text_files.items():
+            duplicate_of = self.duplicate_files.get(file_path)
+            if duplicate_of:
+                yield (
+                    f"\n## {escape(file_path)}\n\n"
+                    f">>> SAME CONTENTS AS {escape(duplicate_of)}\n"
+                )
+                continue
+            yield f"\n## {escape(file_path)}\n\n>>> BEGIN FILE CONTENTS\n\n"
+            for start in range(0, len(file_content), RENDER_CHUNK_SIZE):
+                yield file_content[start : start + RENDER_CHUNK_SIZE]
+            yield "\n\n>>> END FILE CONTENTS\n"
+        yield "\n"
+
+
+RENDER_CHUNK_SIZE = 64 * 1024
+
+
+def _coalesce(pieces: Iterable[str], size: int) -> Iterator[str]:
+    """Joins small pieces into chunks of at least `size` characters."""
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield "".join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+# (content, size_exceeded, skip rule, digest) for one member. content is None for
+# binary members, and for members skipped by a rule judged from their content.
+# digest is the SHA-256 of the member's data, for members that may be duplicates.
+MemberOutcome = tuple[str | None, bool, str | None, bytes | None]
+
+EXTRACTION_MODES = ["sequential", "threads", "processes"]
+
+# Extensions of files that are never plain text. Members with one of these are
+# skipped without being decompressed.
+# fmt: off
+BINARY_EXTENSIONS = frozenset(
+    [
+        # images
+        ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".icns", ".webp", ".tif",
+        ".tiff", ".psd",
+        # audio and video
+        ".mp3", ".wav", ".ogg", ".flac", ".mp4", ".mov", ".avi", ".mkv", ".webm",
+        # fonts
+        ".ttf", ".otf", ".woff", ".woff2", ".eot",
+        # archives
+        ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".jar", ".war",
+        ".whl", ".egg",
+        # compiled code and libraries
+        ".pyc", ".pyo", ".class", ".o", ".obj", ".a", ".so", ".dylib", ".dll",
+        ".exe", ".bin", ".wasm",
+        # documents and databases
+        ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".sqlite",
+        ".sqlite3", ".db",
+    ]
+)
+# fmt: on
+
+
+def has_binary_extension(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() in BINARY_EXTENSIONS
+
+
+@dataclass
+class ExtractionPlan:
+    """
+    The members worth decompressing, decided from the central directory alone.
+    """
+
+    # (index in `infolist()`, member) for each candidate, in the order the limits
+    # are spent on them: archive order unless they were ranked by a `MemberPriority`
+    members: list[tuple[int, zipfile.ZipInfo]]
+    # the number of files in the archive, not counting excluded ones
+    total_files: int
+    # how many members each skip rule left out
+    skipped_files: dict[str, int] = field(default_factory=dict)
+    # whether `members` were ranked, so their text must be put back in archive order
+    ranked: bool = False
+    # the `content_key` of the members that may have the same content as another
+    duplicate_keys: frozenset[tuple[int, int]] = frozenset()
+
+    def fits(self, max_files: int, max_total_size: int) -> bool:
+        """
+        Tells whether the limits are sure to fit every candidate, so the order they're
+        read in doesn't matter.
+        """
+        return len(self.members) <= max_files and (
+            sum(member.file_size for _, member in self.members) <= max_total_size
+        )
+
+    def in_archive_order(self, text_files: dict[str, str]) -> dict[str, str]:
+        if not self.ranked:
+            return text_files
+        return {
+            member.filename: text_files[member.filename]
+            for _, member in sorted(self.members, key=operator.itemgetter(0))
+            if member.filename in text_files
+        }
+
+
+def _skip_reason(
+    member: zipfile.ZipInfo,
+    exclude_files: frozenset[str],
+    path_filter: PathFilter | None = None,
+    skip_rules: SkipRules | None = None,
+) -> str | None:
+    """
+    Returns why a member won't be extracted, judging by its name and size alone.
+
+    Returns:
+        str | None: "excluded" (listed in `exclude_files` or left out by
+        `path_filter`), "ignored" (directories and known binary extensions), the
+        name of the skip rule that applies to it, or None if the member is a
+        candidate for extraction.
+    """
+    if member.filename in exclude_files:
+        return "excluded"
+    if path_filter and not path_filter.matches(member.filename):
+        return "excluded"
+    if member.is_dir() or has_binary_extension(member.filename):
+        return "ignored"
+    if skip_rules and (rule := skip_rules.match_name(member)):
+        return rule
+    if skip_rules and skip_rules.is_large(member):
+        return "large"
+    return None
+
+
+def _count_skipped(skipped_files: dict[str, int], rule: str):
+    skipped_files[rule] = skipped_files.get(rule, 0) + 1
+
+
+def plan_extraction(
+    members: list[zipfile.ZipInfo],
+    exclude_files: list[str],
+    path_filter: PathFilter | None = None,
+    skip_rules: SkipRules | None = None,
+    priority: MemberPriority | None = None,
+) -> ExtractionPlan:
+    """
+    Picks the members that can appear in the output before any is decompressed.
+
+    Directories, excluded members (listed in `exclude_files` or left out by
+    `path_filter`), members with a known binary extension and members skipped by
+    `skip_rules` are left out. The others are ranked by `priority`, if given.
+    Candidates with the same CRC-32 and size are noted as possible duplicates.
+
+    Members bigger than the size budget stay candidates: whether leaving them out
+    drops any text is only known once they're read (see
+    `TextFileCollector.remaining_size`).
+    """
+    exclude_files = frozenset(exclude_files)
+    candidates = []
+    total_files = len(members)
+    skipped_files = {}
+    for index, member in enumerate(members):
+        reason = _skip_reason(member, exclude_files, path_filter, skip_rules)
+        if reason == "excluded":
+            logger.info(f"Excluding file: {member.filename}")
+            total_files -= 1
+        elif reason is None:
+            candidates.append((index, member))
+        elif reason != "ignored":
+            _count_skipped(skipped_files, reason)
+    if priority:
+        candidates = priority.rank(candidates)
+    keys = collections.Counter(
+        content_key(member) for _, member in candidates if member.file_size
+    )
+    return ExtractionPlan(
+        candidates,
+        total_files,
+        skipped_files,
+        bool(priority),
+        frozenset(key for key, count in keys.items() if count > 1),
+    )
+
+
+class TextFileCollector:
+    """
+    Applies the extraction limits to text members, in the order they're added.
+
+    Keeping the limit accounting here, separate from how members are read, is what
+    makes every way of extracting an archive produce exactly the same result.
+
+    A member is only taken if its uncompressed size in bytes fits what's left of
+    `max_total_size`, and its text then spends the budget by its length in
+    characters. Text never decodes to more characters than it has bytes, so the
+    size is an upper bound that's known before decompressing anything, but text
+    with multibyte characters that would fit by its length can be left out.
+    `size_limit_reached` is only set when a member left out for its size is text.
+    """
+
+    def __init__(
+        self,
+        max_files: int,
+        max_total_size: int,
+        skipped_files: dict[str, int] | None = None,
+    ):
+        self.max_files = max_files
+        self.max_total_size = max_total_size
+        self.text_files = {}
+        self.file_count = 0
+        self.total_size = 0
+        self.file_limit_reached = False
+        self.size_limit_reached = False
+        self.skipped_files = dict(skipped_files or {})
+        # whether a member was turned down because of what the members before it
+        # took of the limits, i.e. whether the order they came in mattered
+        self.limits_exhausted = False
+        self.duplicate_files = {}
+        # `content_key` -> (name, digest) of the first member taken with that key
+        self._originals = {}
+
+    def possible_original(self, member: zipfile.ZipInfo) -> tuple[str, bytes] | None:
+        """
+        Returns the name and digest of a member taken before that may have the same
+        content as `member`, if it could be taken as a duplicate of it.
+        """
+        if self.file_count >= self.max_files:
+            return None
+        return self._originals.get(content_key(member))
+
+    def add_duplicate(self, member: zipfile.ZipInfo, original: str):
+        """
+        Takes a member whose content is the same as that of `original`, without
+        spending the size budget on it.
+        """
+        self.duplicate_files[member.filename] = original
+        self.text_files[member.filename] = self.text_files.get(original)
+        self.file_count += 1
+
+    def remaining_size(self, member: zipfile.ZipInfo) -> int | None:
+        """
+        Returns the size budget left for reading `member`, or None if it shouldn't be
+        read at all. After a None, `file_limit_reached` tells if no more members will
+        be taken.
+
+        A member whose uncompressed size doesn't fit can't be taken. Until the size
+        limit is reached, it's still read against a budget of 0, which classifies it
+        without decoding it, so `admit` can tell whether it's text.
+        """
+        if self.file_count >= self.max_files:
+            self.file_limit_reached = True
+            self.limits_exhausted = True
+            return None
+        remaining = self.max_total_size - self.total_size
+        if member.file_size > remaining:
+            self.limits_exhausted = True
+            return None if self.size_limit_reached else 0
+        return remaining
+
+    def admit(
+        self,
+        member: zipfile.ZipInfo,
+        size: int | None,
+        size_exceeded: bool,
+        skip_rule: str | None = None,
+        digest: bytes | None = None,
+    ) -> bool:
+        """
+        Counts a member read against the budget `remaining_size` returned, given the
+        length of its text (None if it's binary), and returns whether it's taken.
+        Members taken with a `digest` can be found by `possible_original`.
+        """
+        if skip_rule is not None:
+            _count_skipped(self.skipped_files, skip_rule)
+            return False
+        remaining = self.max_total_size - self.total_size
+        if size_exceeded or (
+            size is not None and (member.file_size > remaining or size > remaining)
+        ):
+            self.size_limit_reached = True
+            self.limits_exhausted = True
+            return False
+        if size is None:
+            return False
+        self.total_size += size
+        self.file_count += 1
+        if digest is not None:
+            self._originals.setdefault(content_key(member), (member.filename, digest))
+        return True
+
+    def add(
+        self,
+        member: zipfile.ZipInfo,
+        content: str | None,
+        size_exceeded: bool,
+        skip_rule: str | None = None,
+        digest: bytes | None = None,
+    ):
+        """Adds a member read against the budget `remaining_size` returned."""
+        size = None if content is None else len(content)
+        if self.admit(member, size, size_exceeded, skip_rule, digest):
+            self.text_files[member.filename] = content
+
+    def result(self, total_files: int) -> ExtractionResult:
+        """
+        Returns the result, once `text_files` is in archive order. The first copy of
+        each content in that order is the one rendered.
+        """
+        return ExtractionResult(
+            self.text_files,
+            self.file_limit_reached,
+            self.size_limit_reached,
+            total_files,
+            self.skipped_files,
+            _first_copies(self.text_files, self.duplicate_files),
+        )
+
+
+def _first_copies(
+    text_files: dict[str, str], duplicate_files: dict[str, str]
+) -> dict[str, str]:
+    # points the duplicates of each content at its first copy in `text_files`
+    first_copies = {}
+    result = {}
+    for name in text_files:
+        original = duplicate_files.get(name, name)
+        if original in first_copies:
+            result[name] = first_copies[original]
+        else:
+            first_copies[original] = name
+    return result
+
+
+class StreamedMembers:
+    """
+    What a `StreamingTextExtractor` read of an archive's members, for
+    `extract_text_files` to reuse when the finished archive has to be extracted
+    again, instead of decompressing them a second time.
+
+    Members are recorded by name along with their `content_key`, and only found
+    again by a member with the same key.
+    """
+
+    def __init__(self):
+        # name -> (content_key, digest, outcome or None)
+        self._members = {}
+
+    def add(
+        self,
+        member: zipfile.ZipInfo,
+        digest: bytes | None,
+        outcome: MemberOutcome | None = None,
+    ):
+        """
+        Records the digest of a member, if all of it was hashed, and its outcome if
+        its text didn't exceed the budget it was read against: reading it again
+        against any other budget would produce the same outcome, or one the limits
+        treat the same.
+        """
+        self._members[member.filename] = content_key(member), digest, outcome
+
+    def _get(self, member: zipfile.ZipInfo) -> tuple | None:
+        streamed = self._members.get(member.filename)
+        if streamed is None or streamed[0] != content_key(member):
+            return None
+        return streamed
+
+    def digest(self, member: zipfile.ZipInfo) -> bytes | None:
+        streamed = self._get(member)
+        return None if streamed is None else streamed[1]
+
+    def outcome(self, member: zipfile.ZipInfo) -> MemberOutcome | None:
+        streamed = self._get(member)
+        return None if streamed is None else streamed[2]
+
+    def covers(
+        self, member: zipfile.ZipInfo, duplicate_keys: frozenset[tuple[int, int]]
+    ) -> bool:
+        """
+        Tells whether a planned member never has to be read: its outcome is known,
+        and so is its digest if `duplicate_keys` says it may be a duplicate.
+        """
+        return self.outcome(member) is not None and (
+            content_key(member) not in duplicate_keys or self.digest(member) is not None
+        )
+
+
+def _collect_text_files(
+    plan: ExtractionPlan,
+    max_files: int,
+    max_total_size: int,
+    read_member: Callable[[int, zipfile.ZipInfo, int], MemberOutcome],
+    read_digest: Callable[[int, zipfile.ZipInfo], bytes],
+    collector: TextFileCollector | None = None,
+    streamed: StreamedMembers | None = None,
+) -> ExtractionResult:
+    """
+    Walks the planned members in their planned order and applies the extraction
+    limits. Ranked members are walked in their ranking, and their text is put back in
+    archive order.
+
+    `read_member(index, member, remaining_size)` produces each member's outcome, and
+    is only called for members whose uncompressed size fits the remaining budget.
+    `read_digest(index, member)` produces the digest of a member that may be a
+    duplicate of one taken before, which is taken without being decoded if the
+    digests match. Neither is called for members `streamed` has the outcome or
+    digest of. The limits are counted by `collector`, if the caller needs to follow
+    them, or by a new one.
+    """
+    if collector is None:
+        collector = TextFileCollector(max_files, max_total_size, plan.skipped_files)
+    if streamed is None:
+        streamed = StreamedMembers()
+    for index, member in plan.members:
+        original = collector.possible_original(member)
+        if original is not None:
+            digest = streamed.digest(member)
+            if digest is None:
+                digest = read_digest(index, member)
+            if digest == original[1]:
+                collector.add_duplicate(member, original[0])
+                continue
+        remaining = collector.remaining_size(member)
+        if remaining is None:
+            if collector.file_limit_reached:
+                break
+            continue
+        outcome = streamed.outcome(member)
+        if outcome is None:
+            outcome = read_member(index, member, remaining)
+        collector.add(member, *outcome)
+    collector.text_files = plan.in_archive_order(collector.text_files)
+    return collector.result(plan.total_files)
+
+
+class StreamingTextExtractor:
+    """
+    Extracts text files from the members of a `ZipStreamParser` as they arrive.
+
+    The members are planned, read and counted with the same rules as
+    `extract_text_files`, so the result is the same as extracting the finished
+    archive. Members whose sizes are only known after their data (they have a data
+    descriptor) are decoded against the remaining budget and judged once their
+    sizes are known.
+
+    Members can only be taken in the order they arrive. With a `priority`, the
+    result is only valid if the limits fit every member, which isn't known until
+    the last one: `result` returns None otherwise, and the finished archive has to
+    be extracted with `extract_text_files` instead. Nothing more is read once that's
+    known, and what was read until then is kept in `streamed`, for the second
+    extraction to reuse instead of decompressing those members again.
+
+    Members with the same CRC-32 and size as one in `downloader.blob_store` are
+    taken with the stored text without being decompressed. Members with the same
+    CRC-32 and size as a member taken before are only hashed, and taken as
+    duplicates of it if the digests match. `result` also returns None in the rare
+    case they don't. Tarball members, which have no CRC-32, are decoded as well when
+    their size is that of a member taken before, and taken as duplicates of it if
+    the digests match.
+
+    Args:
+        max_files (int): The maximum number of files allowed to be extracted.
+        max_total_size (int): The maximum total size of extracted text allowed.
+        exclude_files (list): A list of file paths to be excluded from extraction.
+        classifier_backend (str): The `is_plain_text_file` backend to use.
+        path_filter (PathFilter | None): Leaves out the members it doesn't match.
+        skip_rules (SkipRules | None): Leaves out vendored, generated, large and
+            minified members. Defaults to `settings.SKIP_RULES`.
+        priority (MemberPriority | None): The ranking `extract_text_files` spends
+            the limits in. Defaults to `settings.EXTRACTION_PRIORITY`.
+    """
+
+    def __init__(
+        self,
+        max_files: int = 1000,
+        max_total_size: int = 10 * 1024 * 1024,
+        exclude_files: list[str] = None,
+        classifier_backend: str = DEFAULT_CLASSIFIER_BACKEND,
+        path_filter: PathFilter | None = None,
+        skip_rules: SkipRules | None = None,
+        priority: MemberPriority | None = None,
+    ):
+        self._exclude_files = frozenset(exclude_files or [])
+        self._path_filter = path_filter
+        self._skip_rules = get_skip_rules() if skip_rules is None else skip_rules
+        self._priority = get_member_priority() if priority is None else priority
+        # fail fast on an unknown or unavailable backend
+        get_chunk_classifier(classifier_backend)
+        self._classifier_backend = classifier_backend
+        self._collector = TextFileCollector(max_files, max_total_size)
+        self._total_files = 0
+        self.streamed = StreamedMembers()
+        self._decoder = None
+        # hashes a member that isn't decoded, whose digest is `_expected`'s: the
+        # (name, digest) of a possible original
+        self._hash = None
+        self._expected = None
+        # the `blob_store.DecodedBlob` a member is taken from, without reading it
+        self._blob = None
+        # whether a member was left undecoded that should have been
+        self._invalid = False
+
+    def start_member(self, member: zipfile.ZipInfo) -> bool:
+        reason = self._skip_reason(member)
+        if reason == "excluded":
+            logger.info(f"Excluding file: {member.filename}")
+        else:
+            self._total_files += 1
+        if reason not in (None, "excluded", "ignored"):
+            _count_skipped(self._collector.skipped_files, reason)
+        if reason is not None or self._collector.file_limit_reached:
+            return False
+        if self._priority and self._collector.limits_exhausted:
+            # `result` will be None
+            return False
+
+        original = None
+        if member.file_size:
+            original = self._collector.possible_original(member)
+        if original is not None and member.CRC:
+            # only hashed: taken as a duplicate if the digests match
+            self._hash, self._expected = hashlib.sha256(), original
+            return True
+        if original is not None:
+            # Tarballs don't record CRCs, so a member with the same size as one taken
+            # before is decoded as well as hashed. `end_member` takes it as a
+            # duplicate if the digests match, before the budget is spent on it, so
+            # it's read against what's left of the budget even if it doesn't fit.
+            remaining = self._collector.max_total_size - self._collector.total_size
+        else:
+            remaining = self._collector.remaining_size(member)
+            if remaining is None:
+                return False
+            blob = blob_store.get_blob(
+                member, self._classifier_backend, self._skip_rules.detect_minified
+            )
+            if blob is not None:
+                # not even decompressed: its text is the blob's
+                self._blob = blob
+                return False
+        self._decoder = MemberTextDecoder(
+            self._classifier_backend,
+            remaining,
+            member.filename,
+            self._skip_rules.detect_minified,
+            digest=True,
+        )
+        return True
+
+    def _skip_reason(self, member: zipfile.ZipInfo) -> str | None:
+        return _skip_reason(
+            member, self._exclude_files, self._path_filter, self._skip_rules
+        )
+
+    def member_data(self, data: bytes) -> bool:
+        if self._hash is not None:
+            self._hash.update(data)
+            return True
+        return self._decoder.feed(data)
+
+    def end_member(self, member: zipfile.ZipInfo):
+        if self._blob is not None:
+            blob, self._blob = self._blob, None
+            outcome = _blob_outcome(blob, self._collector.remaining_size(member))
+            self.streamed.add(member, blob.digest, None if outcome[1] else outcome)
+            self._collector.add(member, *outcome)
+            return
+        if self._hash is not None:
+            digest, self._hash = self._hash.digest(), None
+            expected, self._expected = self._expected, None
+            self.streamed.add(member, digest)
+            if digest == expected[1]:
+                self._collector.add_duplicate(member, expected[0])
+                return
+            # same CRC and size, different content: it wasn't decoded
+            self._invalid = True
+            return
+        if self._decoder is None:
+            return
+        decoder, self._decoder = self._decoder, None
+        content, *outcome = _decoder_outcome(decoder)
+        self.streamed.add(
+            member,
+            None if decoder.is_binary or decoder.minified else decoder.digest,
+            None if decoder.size_exceeded else (content, *outcome),
+        )
+        # for members with a data descriptor, this is the first look at their sizes
+        reason = self._skip_reason(member)
+        if reason is not None:
+            _count_skipped(self._collector.skipped_files, reason)
+            return
+        original = self._collector.possible_original(member)
+        if original is not None and decoder.digest == original[1]:
+            # a member with a data descriptor, whose CRC wasn't known in time. Its
+            # data was hashed to the end even if it was too big to decode.
+            self._collector.add_duplicate(member, original[0])
+            return
+        if self._collector.remaining_size(member) is None:
+            return
+        self._collector.add(member, content, *outcome)
+        if content is not None:
+            blob_store.store_blob(
+                member,
+                self._classifier_backend,
+                self._skip_rules.detect_minified,
+                decoder.digest,
+                content,
+            )
+
+    def result(self) -> ExtractionResult | None:
+        if self._invalid:
+            return None
+        if self._priority and self._collector.limits_exhausted:
+            # some of the members that were taken may have been ranked lower than
+            # some that weren't
+            return None
+        return self._collector.result(self._total_files)
+
+
+def _read_member_outcome(
+    zip_file: zipfile.ZipFile,
+    member: zipfile.ZipInfo,
+    max_size: int,
+    classifier_backend: str,
+    detect_minified: bool,
+    digest: bool,
+    use_blob_store: bool,
+) -> MemberOutcome:
+    if use_blob_store:
+        blob = blob_store.get_blob(member, classifier_backend, detect_minified)
+        if blob is not None:
+            return _blob_outcome(blob, max_size)
+    decoder = read_text_member(
+        zip_file,
+        member,
+        max_size,
+        classifier_backend,
+        detect_minified,
+        digest or use_blob_store,
+    )
+    outcome = _decoder_outcome(decoder)
+    if use_blob_store and outcome[0] is not None:
+        blob_store.store_blob(
+            member, classifier_backend, detect_minified, decoder.digest, outcome[0]
+        )
+    return outcome
+
+
+def _blob_outcome(blob: blob_store.DecodedBlob, max_size: int) -> MemberOutcome:
+    # what decoding the member against `max_size` would have produced
+    if len(blob.text) > max_size:
+        return None, True, None, blob.digest
+    return blob.text, False, None, blob.digest
+
+
+def _decoder_outcome(decoder: MemberTextDecoder) -> MemberOutcome:
+    content = decoder.finish()
+    return (
+        content,
+        decoder.size_exceeded,
+        "minified" if decoder.minified else None,
+        decoder.digest,
+    )
+
+
+def _extract_batch(
     zip_file: zipfile.ZipFile,
+    indices: list[int],
+    max_total_size: int,
+    classifier_backend: str,
+    detect_minified: bool,
+    duplicate_keys: frozenset[tuple[int, int]],
+    use_blob_store: bool,
+) -> dict[int, MemberOutcome]:
+    """
+    Reads a batch of planned members independently of the rest of the archive.
+
+    Every member is read against the whole `max_total_size` budget, since how much
+    of it is left depends on the batches before this one. Whether a member is a
+    duplicate also depends on them, so the members that may be are read and hashed.
+    """
+    members = zip_file.infolist()
+    return {
+        index: _read_member_outcome(
+            zip_file,
+            members[index],
+            max_total_size,
+            classifier_backend,
+            detect_minified,
+            content_key(members[index]) in duplicate_keys,
+            use_blob_store,
+        )
+        for index in indices
+    }
+
+
+def _extract_batch_from_path(
+    archive_path: str,
+    use_mmap: bool,
+    indices: list[int],
+    max_total_size: int,
+    classifier_backend: str,
+    detect_minified: bool,
+    duplicate_keys: frozenset[tuple[int, int]],
+) -> dict[int, MemberOutcome]:
+    # runs in a worker process, which has neither the blob store of the process
+    # that submitted the batch nor, necessarily, its Django settings
+    zip_file = open_zip(archive_path, use_mmap)
+    try:
+        return _extract_batch(
+            zip_file,
+            indices,
+            max_total_size,
+            classifier_backend,
+            detect_minified,
+            duplicate_keys,
+            use_blob_store=False,
+        )
+    finally:
+        close_archive(zip_file)
+
+
+# the least number of batches each worker gets, so uneven batches even out
+BATCHES_PER_WORKER = 4
+
+
+def _batch_members(
+    members: list[tuple[int, zipfile.ZipInfo]], workers: int, max_files: int
+) -> list[list[int]]:
+    """
+    Splits planned members into runs of their planned order, read by a worker at a
+    time. Each worker gets at least `BATCHES_PER_WORKER` of them, and none holds
+    more than a worker's share of `max_files`.
+    """
+    size = max(
+        1,
+        min(
+            math.ceil(len(members) / (workers * BATCHES_PER_WORKER)),
+            math.ceil(max_files / workers),
+        ),
+    )
+    indices = [index for index, _ in members]
+    return [indices[start : start + size] for start in range(0, len(indices), size)]
+
+
+class _BatchReader:
+    """
+    Reads planned members in batches on a pool, ahead of `_collect_text_files`
+    walking them in their planned order.
+
+    Batches are submitted in that order, as long as fewer than two per worker are
+    in flight and there are fewer members in flight than files left to take. Once
+    the members in flight may reach the file limit, nothing more is submitted until
+    the walk has caught up with them, so the members after the limit are never read.
+
+    Args:
+        submit (Callable): Submits a batch's indices to the pool, returning a
+            future of their outcomes.
+        batches (list[list[int]]): The batches, from `_batch_members`.
+        collector (TextFileCollector): The collector of the walk.
+        workers (int): The number of workers of the pool.
+    """
+
+    def __init__(
+        self,
+        submit: Callable[[list[int]], concurrent.futures.Future],
+        batches: list[list[int]],
+        collector: TextFileCollector,
+        workers: int,
+    ):
+        self._submit = submit
+        self._batches = batches
+        self._batch_numbers = {
+            index: number for number, batch in enumerate(batches) for index in batch
+        }
+        self._collector = collector
+        self._max_in_flight = 2 * workers
+        # batch number -> future of its outcomes
+        self._futures = {}
+        # the next batch to submit
+        self._next = 0
+
+    def outcome(self, index: int) -> MemberOutcome:
+        number = self._batch_numbers[index]
+        self._submit_from(number)
+        return self._futures[number].result()[index]
+
+    def _submit_from(self, number: int):
+        # submits the batch being walked, then as many after it as allowed. Batches
+        # the walk went past without reading them are never submitted.
+        self._next = max(self._next, number)
+        files_left = self._collector.max_files - self._collector.file_count
+        while self._next < len(self._batches):
+            in_flight = self._batches[number : self._next]
+            if in_flight and (
+                len(in_flight) >= self._max_in_flight
+                or sum(map(len, in_flight)) >= files_left
+            ):
+                return
+            self._futures[self._next] = self._submit(self._batches[self._next])
+            self._next += 1
+
+    def cancel(self):
+        """Cancels the batches that haven't started, and waits for the others."""
+        for future in self._futures.values():
+            future.cancel()
+        concurrent.futures.wait(self._futures.values())
+
+
+_process_pool: concurrent.futures.ProcessPoolExecutor | None = None
+# held while a pool is created, since requests get to them from executor threads
+_pool_lock = threading.Lock()
+
+
+def _get_process_pool() -> concurrent.futures.ProcessPoolExecutor:
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            # spawned rather than forked: we're called from threads of a running
+            # server
+            _process_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=settings.EXTRACTION_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _process_pool
+
+
+def _zip_path(zip_file: zipfile.ZipFile) -> str | None:
+    if isinstance(zip_file.filename, str) and os.path.isfile(zip_file.filename):
+        return zip_file.filename
+    return None
+
+
+@contextmanager
+def _archive_path(zip_file: zipfile.ZipFile):
+    """
+    Yields a path worker processes can open the archive from, or None if there's
+    none.
+
+    Archives opened from a path are used as is. Archives `open_zip` opened from
+    anything else (an in-memory or anonymous temporary file) are copied to a named
+    temporary file first, so nothing else may read them meanwhile.
+    """
+    path = _zip_path(zip_file)
+    if path is not None or not isinstance(zip_file, ZipArchive):
+        yield path
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=".zip") as f:
+        zip_file.file.seek(0)
+        shutil.copyfileobj(zip_file.file, f)
+        f.flush()
+        yield f.name
+
+
+class _ArchiveHandles:
+    """
+    Handles of an archive for worker threads, each used by one thread at a time so
+    they don't contend for one file position. They're opened by path as they're
+    needed and reused by later batches. Archives without a path are shared: ZipFile
+    serializes reads of the underlying file object itself, and member decompression
+    still happens outside of its lock.
+    """
+
+    def __init__(self, zip_file: zipfile.ZipFile):
+        self._zip_file = zip_file
+        self._path = _zip_path(zip_file)
+        self._idle = queue.SimpleQueue()
+        self._opened = []
+
+    @contextmanager
+    def handle(self):
+        if self._path is None:
+            yield self._zip_file
+            return
+        try:
+            handle = self._idle.get_nowait()
+        except queue.Empty:
+            handle = open_zip(self._path)
+            self._opened.append(handle)
+        try:
+            yield handle
+        finally:
+            self._idle.put(handle)
+
+    def close(self):
+        for handle in self._opened:
+            close_archive(handle)
+
+
+def _extract_batch_in_thread(
+    handles: _ArchiveHandles,
+    indices: list[int],
+    max_total_size: int,
+    classifier_backend: str,
+    detect_minified: bool,
+    duplicate_keys: frozenset[tuple[int, int]],
+    use_blob_store: bool,
+) -> dict[int, MemberOutcome]:
+    # runs in a worker thread
+    with handles.handle() as zip_file:
+        return _extract_batch(
+            zip_file,
+            indices,
+            max_total_size,
+            classifier_backend,
+            detect_minified,
+            duplicate_keys,
+            use_blob_store,
+        )
+
+
+_thread_pool: concurrent.futures.ThreadPoolExecutor | None = None
+
+
+def _get_thread_pool() -> concurrent.futures.ThreadPoolExecutor:
+    global _thread_pool
+    with _pool_lock:
+        if _thread_pool is None:
+            _thread_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=settings.EXTRACTION_WORKERS,
+                thread_name_prefix="extraction",
+            )
+        return _thread_pool
+
+
+def _collect_in_parallel(
+    plan: ExtractionPlan,
+    max_files: int,
+    max_total_size: int,
+    submit: Callable[[list[int]], concurrent.futures.Future],
+    streamed: StreamedMembers | None,
+) -> ExtractionResult:
+    # runs the walk of `_collect_text_files` over members read by a `_BatchReader`,
+    # leaving out those `streamed` covers
+    workers = settings.EXTRACTION_WORKERS
+    collector = TextFileCollector(max_files, max_total_size, plan.skipped_files)
+    members = plan.members
+    if streamed is not None:
+        members = [
+            (index, member)
+            for index, member in members
+            if not streamed.covers(member, plan.duplicate_keys)
+        ]
+    reader = _BatchReader(
+        submit, _batch_members(members, workers, max_files), collector, workers
+    )
+    try:
+        return _collect_text_files(
+            plan,
+            max_files,
+            max_total_size,
+            lambda index, member, remaining: reader.outcome(index),
+            lambda index, member: reader.outcome(index)[3],
+            collector,
+            streamed,
+        )
+    finally:
+        reader.cancel()
+
+
+async def _extract_in_parallel(
+    zip_file: zipfile.ZipFile,
+    plan: ExtractionPlan,
+    max_files: int,
+    max_total_size: int,
+    classifier_backend: str,
+    detect_minified: bool,
+    mode: str,
+    streamed: StreamedMembers | None,
+) -> ExtractionResult:
+    loop = asyncio.get_event_loop()
+    batch_args = (
+        max_total_size,
+        classifier_backend,
+        detect_minified,
+        plan.duplicate_keys,
+    )
+
+    if mode == "processes":
+        with _archive_path(zip_file) as path:
+            if path is not None:
+                # passed along, since worker processes may not have the settings
+                use_mmap = settings.ARCHIVE_MMAP
+                return await loop.run_in_executor(
+                    None,
+                    _collect_in_parallel,
+                    plan,
+                    max_files,
+                    max_total_size,
+                    lambda batch: _get_process_pool().submit(
+                        _extract_batch_from_path, path, use_mmap, batch, *batch_args
+                    ),
+                    streamed,
+                )
+        logger.info("Extracting an archive without a file in threads")
+
+    use_blob_store = blob_store.is_enabled()
+    handles = _ArchiveHandles(zip_file)
+    try:
+        return await loop.run_in_executor(
+            None,
+            _collect_in_parallel,
+            plan,
+            max_files,
+            max_total_size,
+            lambda batch: _get_thread_pool().submit(
+                _extract_batch_in_thread, handles, batch, *batch_args, use_blob_store
+            ),
+            streamed,
+        )
+    finally:
+        handles.close()
+
+
+class _TarMemberReader:
+    """
+    A `MemberHandler` reading some of the members of a tarball, numbered like
+    `plan_extraction` numbers them, in one pass over it.
+
+    Args:
+        indices (set[int]): The members to read.
+        max_size (int): The size budget each member is read against.
+        classifier_backend (str): The `is_plain_text_file` backend to use.
+        detect_minified (bool): See `MemberTextDecoder`.
+        keep_content (bool): Whether `outcomes` keep the text of the members, or
+            only its length.
+        duplicate_keys (frozenset[tuple[int, int]]): The `content_key` of the
+            members to hash.
+    """
+
+    def __init__(
+        self,
+        indices: set[int],
+        max_size: int,
+        classifier_backend: str,
+        detect_minified: bool,
+        keep_content: bool,
+        duplicate_keys: frozenset[tuple[int, int]] = frozenset(),
+    ):
+        self._indices = indices
+        self._max_size = max_size
+        self._classifier_backend = classifier_backend
+        self._detect_minified = detect_minified
+        self._keep_content = keep_content
+        self._duplicate_keys = duplicate_keys
+        self._index = -1
+        self._decoder = None
+        # index -> (content or its length, size_exceeded, skip rule, digest)
+        self.outcomes = {}
+
+    def start_member(self, member: zipfile.ZipInfo) -> bool:
+        self._index += 1
+        if self._index not in self._indices:
+            return False
+        self._decoder = MemberTextDecoder(
+            self._classifier_backend,
+            self._max_size,
+            member.filename,
+            self._detect_minified,
+            content_key(member) in self._duplicate_keys,
+        )
+        return True
+
+    def member_data(self, data: bytes) -> bool:
+        return self._decoder.feed(data)
+
+    def end_member(self, member: zipfile.ZipInfo):
+        if self._decoder is None:
+            return
+        decoder, self._decoder = self._decoder, None
+        content, *outcome = _decoder_outcome(decoder)
+        if not self._keep_content and content is not None:
+            content = len(content)
+        self.outcomes[self._index] = content, *outcome
+
+
+def _extract_tar(
+    tar: tarfile.TarFile,
+    max_files: int,
+    max_total_size: int,
+    exclude_files: list[str],
+    classifier_backend: str,
+    path_filter: PathFilter | None,
+    skip_rules: SkipRules,
+    priority: MemberPriority,
+    streamed: StreamedMembers | None,
+) -> ExtractionResult:
+    # runs in the default thread pool
+    members = [
+        member
+        for tarinfo in tar.getmembers()
+        if (member := tar_member_info(tarinfo)) is not None
+    ]
+    plan = plan_extraction(members, exclude_files, path_filter, skip_rules, priority)
+    if not plan.ranked or plan.fits(max_files, max_total_size):
+        # the members are taken in archive order, so they're handled in one pass, as
+        # they would be while the tarball downloads
+        extractor = StreamingTextExtractor(
+            max_files,
+            max_total_size,
+            exclude_files,
+            classifier_backend,
+            path_filter,
+            skip_rules,
+            priority,
+        )
+        read_tar_members(tar, extractor)
+        return extractor.result()
+
+    # A member of a tarball can't be reached without decompressing everything before
+    # it, so ranked members aren't read one by one: the length of their text (and
+    # the digest of those that may be duplicates) is measured in a first pass, the
+    # limits are spent on them in their ranking, and the members taken are read
+    # again in a second pass. Neither pass decodes the members `streamed` covers.
+    if streamed is None:
+        streamed = StreamedMembers()
+    probe = _TarMemberReader(
+        {
+            index
+            for index, member in plan.members
+            if not streamed.covers(member, plan.duplicate_keys)
+        },
+        max_total_size,
+        classifier_backend,
+        skip_rules.detect_minified,
+        keep_content=False,
+        duplicate_keys=plan.duplicate_keys,
+    )
+    read_tar_members(tar, probe)
+    collector = TextFileCollector(max_files, max_total_size, plan.skipped_files)
+    contents = {}
+    taken = set()
+    for index, member in plan.members:
+        original = collector.possible_original(member)
+        if original is not None:
+            digest = streamed.digest(member)
+            if digest is None:
+                digest = probe.outcomes[index][3]
+            if digest == original[1]:
+                collector.add_duplicate(member, original[0])
+                continue
+        if collector.remaining_size(member) is None:
+            if collector.file_limit_reached:
+                break
+            continue
+        outcome = streamed.outcome(member)
+        if outcome is not None:
+            content, *outcome = outcome
+            size = None if content is None else len(content)
+            if collector.admit(member, size, *outcome):
+                collector.text_files[member.filename] = None
+                contents[member.filename] = content
+        elif collector.admit(member, *probe.outcomes[index]):
+            # read in the second pass
+            collector.text_files[member.filename] = None
+            taken.add(index)
+    if taken:
+        reader = _TarMemberReader(
+            taken,
+            max_total_size,
+            classifier_backend,
+            skip_rules.detect_minified,
+            keep_content=True,
+        )
+        read_tar_members(tar, reader)
+        for index in taken:
+            contents[members[index].filename] = reader.outcomes[index][0]
+    collector.text_files = {
+        name: contents[collector.duplicate_files.get(name, name)]
+        for name in plan.in_archive_order(collector.text_files)
+    }
+    return collector.result(plan.total_files)
+
+
+async def extract_text_files(
+    zip_file: zipfile.ZipFile | tarfile.TarFile,
     max_files: int = 1000,
     max_total_size: int = 10 * 1024 * 1024,
     exclude_files: list[str] = None,
+    classifier_backend: str = DEFAULT_CLASSIFIER_BACKEND,
+    mode: str | None = None,
+    path_filter: PathFilter | None = None,
+    skip_rules: SkipRules | None = None,
+    priority: MemberPriority | None = None,
+    streamed: StreamedMembers | None = None,
 ) -> ExtractionResult:
     """
     Asynchronously extracts plain text files from a ZIP file.
@@ -250,13 +1851,31 @@ async def extract_text_files(
     to reaching the size limit.
 
     Args:
-        zip_file (zipfile.ZipFile): The ZIP file object containing the files to be
-            extracted.
+        zip_file (zipfile.ZipFile | tarfile.TarFile): The ZIP file object (or
+            tarball) containing the files to be extracted.
         max_files (int): The maximum number of files allowed to be extracted
             (default: 1000).
         max_total_size (int): The maximum total size (in bytes) of extracted text
             allowed (default: 10MB).
         exclude_files (list): A list of file paths to be excluded from extraction.
+        classifier_backend (str): The `is_plain_text_file` backend used to tell text
+            files from binary ones (default: "table").
+        mode (str | None): How members are processed: "sequential" (one after the
+            other in the default thread pool), "threads" or "processes" (partitioned
+            across a pool of `settings.EXTRACTION_WORKERS` threads or processes).
+            Defaults to `settings.EXTRACTION_MODE`. Every mode produces the same
+            result. Tarballs are always processed sequentially.
+        path_filter (PathFilter | None): Include and exclude patterns; members it
+            doesn't match are left out like those in `exclude_files`.
+        skip_rules (SkipRules | None): The vendored, lock, generated, large and
+            minified file rules to apply (see `downloader.skip_rules`). Defaults to
+            `settings.SKIP_RULES`; pass `NO_SKIP_RULES` to read every member.
+        priority (MemberPriority | None): The ranking the limits are spent in when
+            they can't fit every member (see `downloader.priority`). Defaults to
+            `settings.EXTRACTION_PRIORITY`; pass `ARCHIVE_ORDER` to take members in
+            archive order.
+        streamed (StreamedMembers | None): The members a `StreamingTextExtractor`
+            read while the archive arrived, which aren't decoded again.
 
     Returns:
         ExtractionResult: An `ExtractionResult` object containing:
@@ -265,62 +1884,117 @@ async def extract_text_files(
               stopped due to reaching the file limit.
             - size_limit_reached (bool): A boolean indicating whether the extraction was
               stopped due to reaching the size limit.
+            - skipped_files (dict): How many members each skip rule left out.
+            - duplicate_files (dict): Maps each member with the same contents as one
+              before it in `text_files` to the first of them.
 
     Notes:
         - The function uses the `asyncio` event loop to perform the extraction
-          asynchronously.
-        - Only files that pass the `is_plain_text_file` check are considered as plain
-          text files and extracted.
+          asynchronously. In the parallel modes batches of members are read concurrently
+          (worker processes open the archive by path, worker threads get their own
+          handle when it has one), submitted in the order the limits are applied in and
+          only a few batches ahead of it, so members past the file limit aren't read.
+          Archives without a path are copied to a temporary file for the worker
+          processes if they were opened with `open_zip`, and extracted in threads
+          otherwise.
+        - Members are planned from the central directory before anything is decompressed
+          (see `plan_extraction`): directories, excluded and filtered out members, known
+          binary extensions and members skipped by name or size by `skip_rules` are
+          never decompressed. Minified members are recognized from their first bytes,
+          and reading them stops there.
+        - `max_total_size` counts characters, but a member is only taken if its
+          uncompressed size in bytes fits what's left of it, an upper bound of its
+          length known before it's decompressed. Members that don't fit are only read to
+          classify them until one of them turns out to be text, which sets
+          `size_limit_reached`; members after that which don't fit are never
+          decompressed.
+        - Each member is decompressed once: it is classified with the same rules as
+          `is_plain_text_file` and decoded incrementally as it is read (see
+          `MemberTextDecoder`), and reading stops as soon as it is found to be binary.
+        - Members with the same CRC-32 and size as a member taken before are confirmed
+          to be copies of it by their SHA-256, without being decoded (the parallel modes
+          decode them anyway). Copies count towards `max_files` but not
+          `max_total_size`, and are rendered as a reference to the first.
+        - The text of members with the same CRC-32, size and extension as a member of
+          any archive decoded before is taken from `downloader.blob_store`, without
+          being decompressed again.
         - The function checks for explicit encoding information within the file using
           the `detect_internal_encoding` function.
         - If no explicit encoding information is found, the file is decoded using the
-          default UTF-8 encoding.
+          default UTF-8 encoding. Undecodable bytes are replaced.
         - The extraction stops if the number of extracted files reaches the specified
-          `max_files` or
-          if the total size of extracted text exceeds the specified `max_total_size`.
+          `max_files`. Files that would take the total size of extracted text over
+          `max_total_size` are skipped, and smaller files after them are still
+          extracted. Members are taken in the ranking of `priority`, and the text files
+          are returned in archive order.
     """
     if exclude_files is None:
         exclude_files = []
-    loop = asyncio.get_event_loop()
+    if mode is None:
+        mode = settings.EXTRACTION_MODE
+    if mode not in EXTRACTION_MODES:
+        raise ValueError(f"Unknown extraction mode: {mode!r}")
+    # fail fast on an unknown or unavailable backend
+    get_chunk_classifier(classifier_backend)
+    if skip_rules is None:
+        skip_rules = get_skip_rules()
+    if priority is None:
+        priority = get_member_priority()
 
-    def extract_files():
-        text_files = {}
-        total_size = 0
-        file_limit_reached = False
-        size_limit_reached = False
-        total_files = len(zip_file.infolist())
-
-        for member in zip_file.infolist():
-            if len(text_files) >= max_files:
-                file_limit_reached = True
-                break
-            if member.filename in exclude_files:
-                logger.info(f"Excluding file: {member.filename}")
-                total_files -= 1
-                continue
+    if isinstance(zip_file, tarfile.TarFile):
+        # a tarball can't be partitioned: reaching a member means decompressing
+        # everything before it
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None,
+            _extract_tar,
+            zip_file,
+            max_files,
+            max_total_size,
+            exclude_files,
+            classifier_backend,
+            path_filter,
+            skip_rules,
+            priority,
+            streamed,
+        )
 
-            with zip_file.open(member, "r") as file:
-                is_plain_text, first_chunk = is_plain_text_file(file)
-                if is_plain_text:
-                    _, encoding = detect_internal_encoding_from_bytes(first_chunk)
-                    if encoding:
-                        try:
-                            content = file.read().decode(encoding)
-                        except LookupError:
-                            content = file.read().decode("utf-8", errors="replace")
-                    else:
-                        content = file.read().decode("utf-8", errors="replace")
-
-                    total_size += len(content)
-                    if total_size > max_total_size:
-                        size_limit_reached = True
-                        break
-
-                    text_files[member.filename] = content
+    plan = plan_extraction(
+        zip_file.infolist(), exclude_files, path_filter, skip_rules, priority
+    )
 
-        return ExtractionResult(
-            text_files, file_limit_reached, size_limit_reached, total_files
+    if mode != "sequential":
+        return await _extract_in_parallel(
+            zip_file,
+            plan,
+            max_files,
+            max_total_size,
+            classifier_backend,
+            skip_rules.detect_minified,
+            mode,
+            streamed,
         )
 
+    use_blob_store = blob_store.is_enabled()
+
+    def extract_files():
+        return _collect_text_files(
+            plan,
+            max_files,
+            max_total_size,
+            lambda index, member, remaining: _read_member_outcome(
+                zip_file,
+                member,
+                remaining,
+                classifier_backend,
+                skip_rules.detect_minified,
+                content_key(member) in plan.duplicate_keys,
+                use_blob_store,
+            ),
+            lambda index, member: member_digest(zip_file, member),
+            streamed=streamed,
+        )
+
+    loop = asyncio.get_event_loop()
     extraction_result = await loop.run_in_executor(None, extract_files)
     return extraction_result
@@ -1,6 +1,7 @@
 import logging
-import io
+import re
 import zipfile
+from typing import IO
 from urllib.parse import urlparse
 
 from django import forms
@@ -9,10 +10,39 @@ from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import UploadedFile
 from django.template.defaultfilters import filesizeformat
 
+from .archives import open_zip
+from .path_filter import InvalidPatternError, PathFilter
+
 
 logger = logging.getLogger(__name__)
 
 
+# branch and tag names: no spaces, "..", or characters with a meaning in URLs
+REF_PATTERN = re.compile(r"^(?!.*\.\.)[\w.\-/]+$")
+
+
+def validate_ref(value: str):
+    if not REF_PATTERN.match(value) or value.startswith("/") or value.endswith("/"):
+        raise forms.ValidationError(f"Invalid branch or tag name: {value}")
+
+
+def parse_tree_path(path_parts: list[str]) -> tuple[str | None, str]:
+    """
+    Reads the ref and the subdirectory from the path of a GitHub URL like
+    `https://github.com/<owner>/<repo>/tree/<ref>/<subdirectory>`.
+
+    The ref is taken to be the first segment after `tree`: like on GitHub, a branch
+    whose name contains a slash is indistinguishable from a subdirectory here.
+
+    Returns:
+        tuple[str | None, str]: The ref (None if the URL isn't a `tree` URL) and the
+        subdirectory ("" for the whole repository).
+    """
+    if len(path_parts) < 4 or path_parts[2] != "tree":
+        return None, ""
+    return path_parts[3], "/".join(part for part in path_parts[4:] if part)
+
+
 def validate_repo_url(value):
     # parse the url and check if it is a valid GitHub repository
     parsed = urlparse(value)
@@ -26,6 +56,11 @@ def validate_repo_url(value):
     # must be http(s) protocol
     if parsed.scheme not in ["http", "https"]:
         raise forms.ValidationError(msg)
+    # https://github.com/<owner>/<repo>/tree/<ref>[/<subdirectory>]
+    if len(path_parts) > 2 and path_parts[2] == "tree":
+        if len(path_parts) < 4 or not path_parts[3]:
+            raise forms.ValidationError(msg)
+        validate_ref(path_parts[3])
 
 
 def validate_file_size(value):
@@ -47,6 +82,21 @@ def validate_is_zip(value: UploadedFile):
         raise forms.ValidationError("File is not a valid ZIP file.")
 
 
+def open_uploaded_file(file: UploadedFile) -> str | IO[bytes]:
+    """
+    Returns what to open an uploaded file from without copying it.
+
+    Uploads Django has written to a temporary file are opened by path, which gives the
+    archive a handle of its own that extraction threads and processes can reopen, and
+    lets `open_zip` map it into memory.
+    In-memory uploads are read straight from their buffer.
+    """
+    if hasattr(file, "temporary_file_path"):
+        return file.temporary_file_path()
+    file.seek(0)
+    return file.file
+
+
 class RepositoryURLForm(forms.Form):
     repo_url = forms.URLField(
         label="GitHub Repository URL",
@@ -59,6 +109,29 @@ class RepositoryURLForm(forms.Form):
         ),
     )
 
+    include = forms.CharField(
+        label="Include paths",
+        required=False,
+        help_text="Only extract these paths. One gitignore-style pattern per line.",
+        widget=forms.Textarea(attrs={"rows": 3, "placeholder": "src/\n*.md"}),
+    )
+    exclude = forms.CharField(
+        label="Exclude paths",
+        required=False,
+        help_text="Don't extract these paths. One gitignore-style pattern per line.",
+        widget=forms.Textarea(
+            attrs={"rows": 3, "placeholder": "tests/\n!tests/README.md"}
+        ),
+    )
+    keep_generated = forms.BooleanField(
+        label="Keep vendored and generated files",
+        required=False,
+        help_text=(
+            "Don't skip dependencies, lock files, generated, minified and very large "
+            "files."
+        ),
+    )
+
     def clean_repo_url(self):
         repo_url = self.cleaned_data["repo_url"]
         parsed = urlparse(repo_url)
@@ -67,6 +140,36 @@ class RepositoryURLForm(forms.Form):
         repo_name = path_parts[1].split(".")[0]
         return repo_url, username, repo_name
 
+    def clean(self):
+        cleaned_data = super().clean()
+        ref = subdirectory = None
+        if "repo_url" in cleaned_data:
+            repo_url = cleaned_data["repo_url"][0]
+            path_parts = urlparse(repo_url).path.strip("/").split("/")
+            ref, subdirectory = parse_tree_path(path_parts)
+        # the branch or tag, and the directory, of a `tree/<ref>/<subdirectory>` URL
+        cleaned_data["ref"] = ref
+        cleaned_data["subdirectory"] = subdirectory or ""
+        return cleaned_data
+
+    def _clean_patterns(self, field: str) -> list[str]:
+        patterns = [
+            line.strip("\r")
+            for line in self.cleaned_data[field].split("\n")
+            if line.strip()
+        ]
+        try:
+            PathFilter(exclude=patterns)
+        except InvalidPatternError as e:
+            raise ValidationError(str(e))
+        return patterns
+
+    def clean_include(self):
+        return self._clean_patterns("include")
+
+    def clean_exclude(self):
+        return self._clean_patterns("exclude")
+
 
 class ZipFileForm(forms.Form):
     zip_file = forms.FileField(
@@ -78,10 +181,9 @@ class ZipFileForm(forms.Form):
 
     def clean_zip_file(self):
         file = self.cleaned_data["zip_file"]
-        data = b"".join(chunk for chunk in file.chunks())
 
         try:
-            zip_file = zipfile.ZipFile(io.BytesIO(data))
+            zip_file = open_zip(open_uploaded_file(file))
         except zipfile.BadZipFile:
             error_message = "The uploaded file is not a valid zip file."
             raise ValidationError(error_message)
@@ -0,0 +1,61 @@
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_client: httpx.AsyncClient | None = None
+
+
+def create_client() -> httpx.AsyncClient:
+    """Creates an `httpx.AsyncClient` configured by the `HTTP_CLIENT_*` settings."""
+    return httpx.AsyncClient(
+        follow_redirects=True,
+        http2=settings.HTTP_CLIENT_HTTP2,
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY,
+        ),
+        timeout=settings.HTTP_CLIENT_TIMEOUT,
+    )
+
+
+async def start_client():
+    """
+    Creates the process-wide client. Called on ASGI lifespan startup.
+    """
+    global _client
+    if _client is None:
+        _client = create_client()
+        logger.info("Started shared HTTP client")
+
+
+async def close_client():
+    """
+    Closes the process-wide client and its pooled connections. Called on ASGI
+    lifespan shutdown.
+    """
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+        logger.info("Closed shared HTTP client")
+
+
+@asynccontextmanager
+async def get_client() -> AsyncIterator[httpx.AsyncClient]:
+    """
+    Yields the shared client, so connections to GitHub are reused across requests.
+
+    When the server didn't run the ASGI lifespan (the development server, tests...)
+    there's no shared client, and a short-lived one is created and closed instead.
+    """
+    if _client is not None:
+        yield _client
+    else:
+        async with create_client() as client:
+            yield client
@@ -0,0 +1,289 @@
+import functools
+import re
+from typing import Iterable
+
+# how many directories' decisions each filter remembers: members of the same
+# directory share the work of matching it
+DIRECTORY_CACHE_SIZE = 4096
+
+
+class InvalidPatternError(ValueError):
+    """A path pattern can't be compiled."""
+
+
+def _translate_segment(segment: str) -> str:
+    """Translates the glob syntax of one path segment to a regex."""
+    regex = []
+    i = 0
+    while i < len(segment):
+        char = segment[i]
+        i += 1
+        if char == "*":
+            # consecutive asterisks within a segment are regular asterisks
+            while i < len(segment) and segment[i] == "*":
+                i += 1
+            regex.append("[^/]*")
+        elif char == "?":
+            regex.append("[^/]")
+        elif char == "\\" and i < len(segment):
+            regex.append(re.escape(segment[i]))
+            i += 1
+        elif char == "[":
+            end = i
+            if end < len(segment) and segment[end] in "!^":
+                end += 1
+            if end < len(segment) and segment[end] == "]":
+                end += 1
+            end = segment.find("]", end)
+            if end == -1:
+                # like in git, a pattern with an unclosed bracket matches nothing
+                regex.append("(?!)")
+                break
+            body = segment[i:end].replace("\\", "\\\\").replace("[", "\\[")
+            if body[0] in "!^":
+                body = "^" + body[1:]
+            # a class never matches the separator, like in git
+            regex.append(f"(?!/)[{body}]")
+            i = end + 1
+        else:
+            regex.append(re.escape(char))
+    return "".join(regex)
+
+
+def _strip_trailing_spaces(pattern: str) -> str:
+    stripped = pattern.rstrip(" ")
+    if stripped.endswith("\\") and len(stripped) < len(pattern):
+        # the last space is escaped
+        stripped += " "
+    return stripped
+
+
+def translate_pattern(pattern: str) -> tuple[str, bool, bool] | None:
+    """
+    Translates a gitignore pattern to a regex matching the paths it applies to.
+
+    Paths are relative to the repository root and use "/" as the separator.
+
+    Returns:
+        tuple[str, bool, bool] | None: The regex, whether the pattern is negated
+        (starts with "!"), and whether it only matches directories (ends with "/").
+        None for blank lines and comments.
+    """
+    pattern = _strip_trailing_spaces(pattern.rstrip("\r\n"))
+    if not pattern or pattern.startswith("#"):
+        return None
+    negated = pattern.startswith("!")
+    if negated:
+        pattern = pattern[1:]
+    elif pattern.startswith(("\\!", "\\#")):
+        pattern = pattern[1:]
+
+    directory_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    # a pattern with a separator at the start or in the middle is relative to the
+    # root, any other matches at any depth
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    if not pattern:
+        return None
+
+    segments = pattern.split("/")
+    regex = [] if anchored else ["(?:.*/)?"]
+    for i, segment in enumerate(segments):
+        last = i == len(segments) - 1
+        if segment == "**":
+            # "**/" matches zero or more directories, a trailing "/**" everything
+            # inside
+            regex.append(".*" if last else "(?:.*/)?")
+        else:
+            regex.append(_translate_segment(segment))
+            if not last:
+                regex.append("/")
+    return "".join(regex), negated, directory_only
+
+
+class _PatternList:
+    """
+    An ordered list of gitignore patterns, compiled into two alternations (one for
+    directories, one for files) so that a path is matched against all of them at
+    once.
+
+    Like in a `.gitignore`, the last pattern matching a path decides: the
+    alternatives are in reverse order, so the first one that matches is the last
+    pattern.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self._negated = {}
+        directory_alternatives = []
+        file_alternatives = []
+        for index, pattern in enumerate(patterns):
+            translated = translate_pattern(pattern)
+            if translated is None:
+                continue
+            regex, negated, directory_only = translated
+            alternative = f"(?P<p{index}>{regex})"
+            try:
+                re.compile(alternative)
+            except re.error as e:
+                raise InvalidPatternError(f"Invalid pattern {pattern!r}: {e}") from e
+            self._negated[f"p{index}"] = negated
+            directory_alternatives.append(alternative)
+            if not directory_only:
+                file_alternatives.append(alternative)
+        self._directories = self._compile(directory_alternatives)
+        self._files = self._compile(file_alternatives)
+
+    def __bool__(self):
+        return bool(self._negated)
+
+    @staticmethod
+    def _compile(alternatives: list[str]) -> re.Pattern | None:
+        if not alternatives:
+            return None
+        return re.compile("|".join(reversed(alternatives)), re.DOTALL)
+
+    def _match(self, regex: re.Pattern | None, path: str) -> bool | None:
+        # True if the last matching pattern is positive, False if it's negated
+        if regex is None:
+            return None
+        match = regex.fullmatch(path)
+        if match is None:
+            return None
+        return not self._negated[match.lastgroup]
+
+    def match_directory(self, path: str) -> bool | None:
+        return self._match(self._directories, path)
+
+    def match_file(self, path: str) -> bool | None:
+        return self._match(self._files, path)
+
+
+class PathFilter:
+    """
+    Decides which archive members to extract from gitignore-style patterns and a
+    subdirectory.
+
+    Patterns follow `.gitignore` syntax: `*`, `?` and `[...]` match within a path
+    segment, `**` across segments, a leading or middle `/` anchors a pattern to the
+    repository root, a trailing `/` only matches directories, and `!` negates an
+    earlier pattern. The last matching pattern wins.
+
+    A member is extracted if it's matched by the include patterns (when there are
+    any) and isn't matched by the exclude patterns. Matching a directory matches
+    everything inside it, and as in git, a file inside an excluded directory can't
+    be included again by a negated exclude pattern. A negated include pattern does
+    leave out the paths it matches, so `src/` then `!src/vendor/` includes `src`
+    without `src/vendor`.
+
+    Member names are matched relative to the archive's top-level directory, which
+    GitHub puts every file of a repository in.
+
+    With a subdirectory, only the members inside it are extracted, before any pattern
+    is looked at. Patterns are still relative to the repository root.
+
+    Args:
+        include (Iterable[str]): Patterns of the paths to extract. Everything is
+            included if there are none.
+        exclude (Iterable[str]): Patterns of the paths not to extract.
+        subdirectory (str): The directory to extract, relative to the repository
+            root. The whole repository if empty.
+
+    Raises:
+        InvalidPatternError: If a pattern can't be compiled.
+    """
+
+    def __init__(
+        self,
+        include: Iterable[str] = (),
+        exclude: Iterable[str] = (),
+        subdirectory: str = "",
+    ):
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self.subdirectory = subdirectory.strip("/")
+        self._subdirectory_prefix = f"{self.subdirectory}/"
+        self._include = _PatternList(self.include)
+        self._exclude = _PatternList(self.exclude)
+        self._directory_decision = functools.lru_cache(maxsize=DIRECTORY_CACHE_SIZE)(
+            self._decide_directory
+        )
+
+    def __bool__(self):
+        return bool(self._include or self._exclude or self.subdirectory)
+
+    def _key(self) -> tuple:
+        return self.include, self.exclude, self.subdirectory
+
+    def __eq__(self, other):
+        if not isinstance(other, PathFilter):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return (
+            f"PathFilter(include={self.include!r}, exclude={self.exclude!r}, "
+            f"subdirectory={self.subdirectory!r})"
+        )
+
+    def _decide_directory(self, path: str) -> tuple[bool | None, bool]:
+        """
+        Returns the decisions for a directory, taking its parents into account: the
+        deepest include decision so far, and whether it's excluded.
+        """
+        parent, _, _ = path.rpartition("/")
+        if parent:
+            included, excluded = self._directory_decision(parent)
+        else:
+            included, excluded = None, False
+        if excluded:
+            return included, True
+        decision = self._include.match_directory(path)
+        if decision is not None:
+            included = decision
+        return included, bool(self._exclude.match_directory(path))
+
+    def matches(self, name: str) -> bool:
+        """Returns whether an archive member should be extracted."""
+        _, _, path = name.partition("/")
+        if not path:
+            # the top-level directory itself
+            return not self.subdirectory
+        is_directory = path.endswith("/")
+        path = path.rstrip("/")
+        if self.subdirectory and not (
+            path == self.subdirectory or path.startswith(self._subdirectory_prefix)
+        ):
+            return False
+        if is_directory:
+            included, excluded = self._directory_decision(path)
+        else:
+            parent, _, _ = path.rpartition("/")
+            if parent:
+                included, excluded = self._directory_decision(parent)
+            else:
+                included, excluded = None, False
+            if not excluded:
+                decision = self._include.match_file(path)
+                if decision is not None:
+                    included = decision
+                excluded = bool(self._exclude.match_file(path))
+        if excluded:
+            return False
+        return bool(included) if self._include else True
+
+
+@functools.lru_cache(maxsize=128)
+def get_path_filter(
+    include: tuple[str, ...], exclude: tuple[str, ...], subdirectory: str = ""
+) -> PathFilter:
+    """
+    Returns the compiled filter for some patterns, compiling each combination once.
+
+    Raises:
+        InvalidPatternError: If a pattern can't be compiled.
+    """
+    return PathFilter(include, exclude, subdirectory)
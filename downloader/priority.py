@@ -0,0 +1,147 @@
+import functools
+import os
+import re
+import zipfile
+
+from django.conf import settings
+
+# how much each kind of file is worth when the extraction limits can't fit every
+# member: higher is extracted first (see `member_category`)
+PRIORITY_WEIGHTS = {
+    "readme": 100,
+    "manifest": 90,
+    "source": 70,
+    "docs": 50,
+    "other": 40,
+    "test": 20,
+    "fixture": 10,
+}
+
+# fmt: off
+# files describing how a project is built and what it depends on
+MANIFEST_NAMES = frozenset([
+    "pyproject.toml", "setup.py", "setup.cfg", "requirements.txt", "pipfile",
+    "package.json", "tsconfig.json", "deno.json", "cargo.toml", "go.mod",
+    "pom.xml", "build.gradle", "build.gradle.kts", "settings.gradle", "gemfile",
+    "composer.json", "mix.exs", "pubspec.yaml", "package.swift", "cmakelists.txt",
+    "makefile", "dockerfile", "docker-compose.yml", "docker-compose.yaml",
+    "build.sbt", "project.clj", "stack.yaml", "dune-project", "meson.build",
+])
+SOURCE_EXTENSIONS = frozenset([
+    ".py", ".pyi", ".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".vue", ".svelte",
+    ".go", ".rs", ".c", ".h", ".cc", ".cpp", ".hpp", ".cs", ".java", ".kt", ".kts",
+    ".scala", ".swift", ".m", ".mm", ".rb", ".php", ".pl", ".lua", ".r", ".jl",
+    ".ex", ".exs", ".erl", ".hs", ".ml", ".clj", ".dart", ".zig", ".nim", ".sh",
+    ".bash", ".ps1", ".sql", ".html", ".css", ".scss", ".sass", ".less",
+])
+# fmt: on
+DOC_EXTENSIONS = frozenset([".md", ".rst", ".txt", ".adoc", ".org"])
+DOC_DIRECTORIES = frozenset(["docs", "doc", "documentation"])
+TEST_DIRECTORIES = frozenset(["test", "tests", "__tests__", "spec", "specs", "e2e"])
+FIXTURE_DIRECTORIES = frozenset(
+    [
+        "fixtures",
+        "fixture",
+        "__fixtures__",
+        "testdata",
+        "test_data",
+        "snapshots",
+        "__snapshots__",
+        "__mocks__",
+    ]
+)
+TEST_FILE_PATTERN = re.compile(
+    r"test_.*|.*_test\.\w+|.*\.(test|spec)\.\w+|.*Tests?\.\w+|conftest\.py"
+)
+
+
+def member_category(name: str) -> str:
+    """
+    Tells what kind of file an archive member is from its path alone.
+
+    Returns:
+        str: One of the keys of `PRIORITY_WEIGHTS`.
+    """
+    *directories, basename = name.rstrip("/").split("/")
+    lowered = basename.lower()
+    extension = os.path.splitext(lowered)[1]
+    directories = {directory.lower() for directory in directories}
+    if lowered.startswith("readme"):
+        return "readme"
+    if lowered in MANIFEST_NAMES:
+        return "manifest"
+    if directories & FIXTURE_DIRECTORIES:
+        return "fixture"
+    if directories & TEST_DIRECTORIES or TEST_FILE_PATTERN.fullmatch(basename):
+        return "test"
+    if directories & DOC_DIRECTORIES or extension in DOC_EXTENSIONS:
+        return "docs"
+    if extension in SOURCE_EXTENSIONS:
+        return "source"
+    return "other"
+
+
+class MemberPriority:
+    """
+    Ranks the members of an archive, so that extraction limits that can't fit all of
+    them are spent on the most useful ones.
+
+    Members are ranked by the weight of their kind (see `member_category`), then
+    smallest first, which fits the most files of a kind in the size budget. Members
+    that rank the same stay in archive order.
+
+    Args:
+        weights (dict[str, int] | None): Overrides of `PRIORITY_WEIGHTS`. If None,
+            members aren't ranked and are taken in archive order.
+
+    Raises:
+        ValueError: If a weight is for an unknown kind of file.
+    """
+
+    def __init__(self, weights: dict[str, int] | None = None):
+        if weights is None:
+            self.weights = None
+            return
+        unknown = set(weights) - set(PRIORITY_WEIGHTS)
+        if unknown:
+            raise ValueError(f"Unknown file kinds: {', '.join(sorted(unknown))}")
+        self.weights = {**PRIORITY_WEIGHTS, **weights}
+
+    def __bool__(self):
+        return self.weights is not None
+
+    def rank(
+        self, members: list[tuple[int, zipfile.ZipInfo]]
+    ) -> list[tuple[int, zipfile.ZipInfo]]:
+        """Sorts (index, member) pairs, most useful first."""
+        if self.weights is None:
+            return members
+        return sorted(
+            members,
+            key=lambda item: (
+                -self.weights[member_category(item[1].filename)],
+                item[1].file_size,
+                item[0],
+            ),
+        )
+
+
+# takes members in archive order
+ARCHIVE_ORDER = MemberPriority()
+
+
+@functools.lru_cache(maxsize=8)
+def _compile_member_priority(weights: tuple[tuple[str, int], ...]) -> MemberPriority:
+    return MemberPriority(dict(weights))
+
+
+def get_member_priority() -> MemberPriority:
+    """
+    Returns the ranking configured by `settings.EXTRACTION_PRIORITY` and
+    `settings.EXTRACTION_PRIORITY_WEIGHTS`.
+    """
+    if not settings.EXTRACTION_PRIORITY:
+        return ARCHIVE_ORDER
+    return _compile_member_priority(
+        tuple(sorted(settings.EXTRACTION_PRIORITY_WEIGHTS.items()))
+    )
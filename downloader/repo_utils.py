@@ -1,14 +1,41 @@
+import asyncio
 import io
 import logging
+import os
+import re
+import tarfile
+import tempfile
 import zipfile
+import zlib
 from dataclasses import dataclass
+from typing import IO
 
 import httpx
 from django.conf import settings
 from django.template.defaultfilters import filesizeformat
 
+from . import archive_cache
+from .archives import (
+    Archive,
+    ArchiveStreamError,
+    BackgroundArchiveParser,
+    archive_url,
+    close_archive,
+    get_archive_comment,
+    get_archive_format,
+    get_uncompressed_size,
+    open_archive,
+)
+from .file_utils import ExtractionResult, StreamingTextExtractor
+from .http_client import get_client
+
 logger = logging.getLogger(__name__)
 
+COMMIT_SHA_PATTERN = re.compile(r"^[0-9a-f]{40}$")
+
+# the "v" GitHub drops from version tags when it names an archive's top-level directory
+VERSION_PREFIX_PATTERN = re.compile(r"^v(?=\d)")
+
 
 class RepositorySizeExceededError(Exception):
     pass
@@ -20,24 +47,128 @@ class RepositoryDownloadError(Exception):
 
 @dataclass
 class DownloadResult:
-    zip_file: zipfile.ZipFile
+    archive: Archive
     download_size: int
     uncompressed_size: int
+    # the commit the archive was built from, if known
+    commit_sha: str | None = None
+    # the text files extracted while the archive downloaded, if they were
+    extraction: ExtractionResult | None = None
+
+    def close(self):
+        """Closes the archive and the buffer it was downloaded into."""
+        if self.archive is None:
+            return
+        close_archive(self.archive)
+
+
+def get_archive_commit_sha(archive: Archive) -> str | None:
+    """
+    Returns the commit SHA GitHub records as the comment of its archives.
+    """
+    sha = get_archive_comment(archive).strip()
+    return sha if COMMIT_SHA_PATTERN.match(sha) else None
+
+
+async def resolve_commit_sha(owner: str, repo_name: str, ref: str) -> str | None:
+    """
+    Asks the GitHub API which commit a ref currently points to.
+
+    This is a single small request, so it's a cheap way to tell whether a previous
+    download of the ref is still current.
+
+    Returns:
+        str | None: The commit SHA, or None if it couldn't be resolved for any reason
+        (network errors, rate limiting, unknown repository...).
+    """
+    url = f"{settings.GITHUB_API_URL}/repos/{owner}/{repo_name}/commits/{ref}"
+    headers = {"Accept": "application/vnd.github.sha"}
+    if settings.GITHUB_TOKEN:
+        headers["Authorization"] = f"Bearer {settings.GITHUB_TOKEN}"
+
+    try:
+        async with get_client() as client:
+            response = await client.get(url, headers=headers)
+    except httpx.HTTPError as e:
+        logger.info(f"Failed to resolve {owner}/{repo_name}@{ref}: {e}")
+        return None
+
+    if response.status_code != 200:
+        logger.info(
+            f"Failed to resolve {owner}/{repo_name}@{ref} because of status code "
+            f"{response.status_code}."
+        )
+        return None
+
+    sha = response.text.strip()
+    return sha if COMMIT_SHA_PATTERN.match(sha) else None
+
+
+def _create_download_buffer(content_length: int | None) -> IO[bytes]:
+    """
+    Creates the file object a repository archive is downloaded into.
+
+    With `settings.DOWNLOAD_SPOOL_MAX_MEMORY` set to None the archive is kept in an
+    `io.BytesIO`. Otherwise it's spooled: held in memory up to that many bytes and
+    then moved to a temporary file. If the server reports a `Content-Length` larger
+    than the threshold, we go straight to disk and reserve the space up front.
+    """
+    spool_max_memory = settings.DOWNLOAD_SPOOL_MAX_MEMORY
+    if spool_max_memory is None:
+        return io.BytesIO()
+
+    buffer = tempfile.SpooledTemporaryFile(max_size=spool_max_memory)
+    if content_length and content_length > spool_max_memory:
+        buffer.rollover()
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(buffer.fileno(), 0, content_length)
+            except OSError:
+                # not supported by every filesystem; it's only an optimization
+                pass
+    return buffer
+
+
+def archive_root(repo_url: str, ref: str) -> str:
+    """
+    Returns the name GitHub gives the top-level directory of a repository's ZIP
+    archives: `<repo>-<ref>`, with slashes in the ref replaced by dashes and the "v"
+    of version tags like `v1.2.3` dropped (`<repo>-1.2.3`).
+    """
+    repo_name = repo_url.rstrip("/").rsplit("/", 1)[-1]
+    ref = VERSION_PREFIX_PATTERN.sub("", ref)
+    return f"{repo_name}-{ref.replace('/', '-')}"
 
 
-async def download_repo(repo_url: str) -> DownloadResult:
+async def download_repo(
+    repo_url: str,
+    text_extractor: StreamingTextExtractor | None = None,
+    archive_format: str | None = None,
+    ref: str = "master",
+) -> DownloadResult:
     """
     Asynchronously downloads and extracts a repository from a given URL.
 
     This function is primarily used to download a repository from a given URL,
-    conduct checks on it, and make it ready for further processing. It returns a
-    `zipfile.ZipFile` object of the downloaded repository.
+    conduct checks on it, and make it ready for further processing. It returns the
+    downloaded archive opened as a `zipfile.ZipFile` or a `tarfile.TarFile`.
 
     Args:
         repo_url (str): The URL of the repository.
+        text_extractor (StreamingTextExtractor | None): If given, the archive's
+            members are fed to it while the archive downloads (see
+            `BackgroundArchiveParser`), and its result is returned as
+            `DownloadResult.extraction`. That's left as None if the archive was
+            served from the cache, can't be read front to back, or has more text
+            than the extractor's limits fit (see `StreamingTextExtractor`).
+        archive_format (str | None): The archive GitHub is asked for, "zip" or
+            "tar.gz". Defaults to `settings.ARCHIVE_FORMAT`. The top-level directory
+            of tarballs is renamed like that of the ZIP archives, so both formats
+            have the same member paths.
+        ref (str): The branch, tag or commit to download (default: "master").
 
     Returns:
-        zipfile.ZipFile: An object representing the downloaded repository.
+        DownloadResult: The downloaded repository.
 
     Raises:
         RepositoryDownloadError: If there are issues with the repository download
@@ -51,12 +182,37 @@ async def download_repo(repo_url: str) -> DownloadResult:
         - Repository size limitation and other policies related to the download
             process are managed by the settings in the application environment.
 
+        - Archives served with an `ETag` or `Last-Modified` header are cached on
+            disk (see `downloader.archive_cache`), and later downloads of the same URL
+            are conditional requests. A 304 response is served from the cache.
+
     """
-    async with httpx.AsyncClient(follow_redirects=True) as client:
-        url = repo_url + "/archive/master.zip"
+    archive_format = get_archive_format(archive_format)
+    root = archive_root(repo_url, ref)
+    async with get_client() as client:
+        url = archive_url(repo_url, ref, archive_format)
         logger.info(f"Downloading repository from URL: {url}")
 
-        async with client.stream("GET", url) as response:
+        cached = archive_cache.get_cached_archive(url, archive_format)
+        headers = cached.conditional_headers() if cached else {}
+
+        async with client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and cached:
+                logger.info(f"Cached archive of {url} is still current")
+                buffer = archive_cache.open_cached_archive(cached)
+                if buffer is None:
+                    raise RepositoryDownloadError(
+                        f"The cached archive of {url} was evicted while it was "
+                        f"being revalidated. Please try again."
+                    )
+                return await _open_archive(
+                    buffer,
+                    os.fstat(buffer.fileno()).st_size,
+                    url,
+                    archive_format,
+                    root,
+                )
+
             if response.status_code == 404:
                 raise RepositoryDownloadError(f"Repository not found at {url}")
 
@@ -76,7 +232,7 @@ async def download_repo(repo_url: str) -> DownloadResult:
             try:
                 parsed_content_length_header = int(content_length_header)
             except (ValueError, TypeError):
-                pass
+                parsed_content_length_header = None
             else:
                 if (
                     parsed_content_length_header
@@ -90,26 +246,98 @@ async def download_repo(repo_url: str) -> DownloadResult:
                         f"Reported size: {csize}, "
                         f"Max size: {msize}"
                     )
-            content = bytearray()
-            async for chunk in response.aiter_bytes():
-                content.extend(chunk)
-                if len(content) > max_repo_size:
-                    msize = filesizeformat(max_repo_size)
-                    raise RepositorySizeExceededError(
-                        f"Downloaded size exceeds the maximum allowed size. "
-                        f"Max size: {msize}"
-                    )
 
-            logger.info(f"Downloaded {len(content)} bytes from {url}")
+            buffer = _create_download_buffer(parsed_content_length_header)
+            parser = None
+            if text_extractor is not None:
+                parser = BackgroundArchiveParser(text_extractor, archive_format, root)
+            try:
+                download_size = 0
+                async for chunk in response.aiter_bytes():
+                    download_size += len(chunk)
+                    if download_size > max_repo_size:
+                        msize = filesizeformat(max_repo_size)
+                        raise RepositorySizeExceededError(
+                            f"Downloaded size exceeds the maximum allowed size. "
+                            f"Max size: {msize}"
+                        )
+                    buffer.write(chunk)
+                    if parser is not None:
+                        await parser.feed(chunk)
+                # drop any space reserved beyond what was actually received
+                buffer.truncate(download_size)
+                buffer.seek(0)
+            except BaseException:
+                if parser is not None:
+                    parser.abort()
+                buffer.close()
+                raise
+
+            logger.info(f"Downloaded {download_size} bytes from {url}")
 
-        # After successful download, proceed with file processing
         try:
-            zip_file = zipfile.ZipFile(io.BytesIO(content))
-            logger.info(f"Successfully extracted zip file from {url}")
-            total_uncompressed_size = sum(
-                file.file_size for file in zip_file.infolist()
+            extraction = None
+            if parser is not None:
+                try:
+                    await parser.close()
+                except ArchiveStreamError as e:
+                    logger.info(f"Couldn't extract {url} while downloading: {e}")
+                else:
+                    extraction = text_extractor.result()
+
+            # After successful download, proceed with file processing
+            result = await _open_archive(
+                buffer, download_size, url, archive_format, root
             )
-            return DownloadResult(zip_file, len(content), total_uncompressed_size)
-        except zipfile.BadZipFile:
-            logger.error(f"Invalid zip file content from {url}")
-            raise RepositoryDownloadError(f"Invalid zip file content from {url}")
+        except BaseException:
+            buffer.close()
+            raise
+        result.extraction = extraction
+
+    loop = asyncio.get_event_loop()
+    try:
+        await loop.run_in_executor(
+            None,
+            archive_cache.cache_archive,
+            url,
+            buffer,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+            archive_format,
+        )
+    except BaseException:
+        result.close()
+        raise
+    return result
+
+
+async def _open_archive(
+    buffer: IO[bytes], download_size: int, url: str, archive_format: str, root: str
+) -> DownloadResult:
+    def open_and_measure():
+        archive = open_archive(buffer, archive_format, root)
+        try:
+            return archive, get_uncompressed_size(archive)
+        except BaseException:
+            archive.close()
+            raise
+
+    # listing a tarball's members means decompressing all of it
+    loop = asyncio.get_event_loop()
+    try:
+        archive, total_uncompressed_size = await loop.run_in_executor(
+            None, open_and_measure
+        )
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError, zlib.error):
+        buffer.close()
+        logger.error(f"Invalid {archive_format} file content from {url}")
+        raise RepositoryDownloadError(
+            f"Invalid {archive_format} file content from {url}"
+        )
+    logger.info(f"Successfully opened {archive_format} file from {url}")
+    return DownloadResult(
+        archive,
+        download_size,
+        total_uncompressed_size,
+        get_archive_commit_sha(archive),
+    )
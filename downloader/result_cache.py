@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from django.conf import settings
+
+from .repo_utils import resolve_commit_sha
+from .result_store import touch_result
+from .shared_cache import SharedCache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ExtractionLimits:
+    max_files: int
+    max_total_size: int
+    exclude_files: tuple[str, ...] = ()
+    # gitignore-style patterns, see `downloader.path_filter.PathFilter`
+    include: tuple[str, ...] = ()
+    exclude: tuple[str, ...] = ()
+    # only extract this directory of the repository
+    subdirectory: str = ""
+    # see `downloader.skip_rules.SkipRules`
+    skip_rules: tuple[str, ...] = ()
+
+
+@dataclass
+class CachedResult:
+    # the key of the rendered output in the result store
+    result_key: str
+    # the results page context: file counts, sizes, etc. It must be JSON-serializable.
+    context: dict
+
+
+def _commit_shas() -> SharedCache:
+    # (owner, repo, ref) -> {"sha", "resolved_at"}. Entries aren't expired so a stale
+    # ref can still be revalidated against the commit it last pointed to.
+    return SharedCache(
+        Path(settings.RESULT_CACHE_DIR) / "commits",
+        max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+    )
+
+
+def _results() -> SharedCache:
+    # (owner, repo, commit sha, limits) -> CachedResult
+    return SharedCache(
+        Path(settings.RESULT_CACHE_DIR) / "results",
+        max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+        ttl=settings.RESULT_CACHE_TTL,
+    )
+
+
+def _entry_name(key: tuple) -> str:
+    # every worker process shares the entries, so their names can't depend on
+    # anything but the key's value
+    return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+
+
+def _repo_key(owner: str, repo_name: str, ref: str) -> tuple[str, str, str]:
+    # GitHub owner and repository names are case-insensitive, refs are not
+    return owner.lower(), repo_name.lower(), ref
+
+
+async def _get_commit_sha(owner: str, repo_name: str, ref: str) -> str | None:
+    commit_shas = _commit_shas()
+    name = _entry_name(_repo_key(owner, repo_name, ref))
+    known = commit_shas.get(name)
+    if known is None:
+        # we've never downloaded this ref, so there's nothing to revalidate
+        return None
+
+    sha, resolved_at = known.metadata["sha"], known.metadata["resolved_at"]
+    if time.time() - resolved_at <= settings.COMMIT_SHA_TTL:
+        return sha
+
+    current_sha = await resolve_commit_sha(owner, repo_name, ref)
+    if current_sha is None:
+        return None
+    commit_shas.put(name, metadata={"sha": current_sha, "resolved_at": time.time()})
+    return current_sha
+
+
+async def get_cached_result(
+    owner: str, repo_name: str, ref: str, limits: ExtractionLimits
+) -> CachedResult | None:
+    """
+    Looks up the result of a previous download of the same commit, by any worker
+    process.
+
+    If the ref was resolved less than `settings.COMMIT_SHA_TTL` seconds ago this
+    makes no network requests at all; otherwise the ref is revalidated with one
+    GitHub API request.
+
+    Returns:
+        CachedResult | None: The cached result, or None on a miss.
+    """
+    sha = await _get_commit_sha(owner, repo_name, ref)
+    if sha is None:
+        return None
+
+    results = _results()
+    name = _entry_name((*_repo_key(owner, repo_name, ref)[:2], sha, limits))
+    entry = results.get(name)
+    if entry is None:
+        return None
+    cached = CachedResult(**entry.metadata)
+    if not touch_result(cached.result_key):
+        # the rendered output has expired from the result store
+        results.delete(name)
+        return None
+
+    logger.info(f"Serving cached result for {owner}/{repo_name}@{sha}")
+    return cached
+
+
+def cache_result(
+    owner: str,
+    repo_name: str,
+    ref: str,
+    commit_sha: str | None,
+    limits: ExtractionLimits,
+    result: CachedResult,
+):
+    """
+    Caches the result of downloading and extracting a repository.
+
+    Nothing is cached if the commit the archive was built from is unknown.
+    """
+    if commit_sha is None:
+        return
+    repo_key = _repo_key(owner, repo_name, ref)
+    _commit_shas().put(
+        _entry_name(repo_key),
+        metadata={"sha": commit_sha, "resolved_at": time.time()},
+    )
+    _results().put(
+        _entry_name((*repo_key[:2], commit_sha, limits)), metadata=asdict(result)
+    )
+
+
+def clear_result_cache():
+    _commit_shas().clear()
+    _results().clear()
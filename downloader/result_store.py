@@ -0,0 +1,190 @@
+import gzip
+import hashlib
+import logging
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterable
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+from .shared_cache import SharedCache
+
+logger = logging.getLogger(__name__)
+
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+# content-coding -> file suffix of the precompressed variant
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+@dataclass
+class StoredResult:
+    key: str
+    size: int
+
+
+def _store() -> SharedCache:
+    # every worker process shares the results
+    return SharedCache(
+        settings.RESULT_STORE_DIR,
+        max_size=settings.RESULT_STORE_MAX_SIZE,
+        ttl=settings.RESULT_STORE_TTL,
+    )
+
+
+def _suffix(encoding: str | None) -> str:
+    return ".txt" + ENCODING_SUFFIXES.get(encoding, "")
+
+
+def store_result(text: str | Iterable[str]) -> StoredResult:
+    """
+    Stores the concatenated text under a content-addressed key.
+
+    The text is written as UTF-8 along with gzip (and, if the `brotli` package is
+    installed, brotli) compressed variants so `result_path` can hand out whichever
+    the client accepts without compressing on every request. Storing the same text
+    twice just refreshes its expiry. Results are evicted, least recently used
+    first, once they add up to more than `settings.RESULT_STORE_MAX_SIZE` bytes. A
+    result bigger than that on its own isn't stored.
+
+    Args:
+        text (str | Iterable[str]): The rendered output, or its chunks (see
+            `ExtractionResult.render_chunks`). Chunks are encoded, hashed and
+            compressed one at a time, so the whole output is never held in memory.
+
+    Returns:
+        StoredResult: The key to fetch the result with and its size in bytes.
+    """
+    if isinstance(text, str):
+        text = [text]
+
+    store = _store()
+    digest = hashlib.sha256()
+    size = 0
+    with _TemporaryVariants(store) as variants:
+        for chunk in text:
+            data = chunk.encode("utf-8")
+            digest.update(data)
+            size += len(data)
+            variants.write(data)
+        variants.finish()
+
+        key = digest.hexdigest()
+        if store.touch(key):
+            return StoredResult(key, size)
+        stored = variants.move_to(store, key)
+
+    if stored:
+        logger.info(f"Stored {size} byte result as {key}")
+    return StoredResult(key, size)
+
+
+class _TemporaryVariants:
+    """
+    Temporary files the plain text and its compressed variants are written to while
+    their key isn't known yet. Whatever isn't moved into place is deleted on exit.
+    """
+
+    def __init__(self, store: SharedCache):
+        self._paths = {}
+        self._files = {}
+        for suffix in [""] + [
+            suffix
+            for encoding, suffix in ENCODING_SUFFIXES.items()
+            if encoding != "br" or brotli is not None
+        ]:
+            self._files[suffix], self._paths[suffix] = store.temporary_file()
+        self._gzip = gzip.GzipFile(fileobj=self._files[".gz"], mode="wb")
+        self._brotli = brotli.Compressor() if brotli is not None else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        for f in self._files.values():
+            f.close()
+        for tmp_path in self._paths.values():
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+
+    def write(self, data: bytes):
+        self._files[""].write(data)
+        self._gzip.write(data)
+        if self._brotli is not None:
+            self._files[".br"].write(self._brotli.process(data))
+
+    def finish(self):
+        self._gzip.close()
+        if self._brotli is not None:
+            self._files[".br"].write(self._brotli.finish())
+        for f in self._files.values():
+            f.close()
+
+    def move_to(self, store: SharedCache, key: str) -> bool:
+        # False if the store refused them for being too big
+        paths, self._paths = self._paths, {}
+        files = {".txt" + suffix: path for suffix, path in paths.items()}
+        return store.put(key, files) is not None
+
+
+def result_path(key: str, encoding: str | None = None) -> Path | None:
+    """
+    Returns the path of a stored result, or None if it doesn't exist or has expired.
+
+    Args:
+        key (str): The key returned by `store_result`.
+        encoding (str | None): "br" or "gzip" for a precompressed variant, None for
+            the plain text.
+    """
+    if not KEY_PATTERN.match(key):
+        return None
+    store = _store()
+    entry = store.get(key, touch=False)
+    if entry is None or _suffix(encoding) not in entry.suffixes:
+        return None
+    return store.path(key, _suffix(encoding))
+
+
+def open_result(key: str, encoding: str | None = None) -> BinaryIO | None:
+    """
+    Opens a stored result, like `result_path` finds it, and restarts its expiry
+    clock. It stays readable even if it's evicted while it's being served.
+    """
+    if not KEY_PATTERN.match(key):
+        return None
+    return _store().open(key, _suffix(encoding))
+
+
+def read_result_range(key: str, start: int, end: int) -> bytes | None:
+    """
+    Returns bytes `start` to `end` (inclusive) of a stored result's plain text,
+    read from a memory map of it, or None if it doesn't exist or has expired.
+    """
+    if not KEY_PATTERN.match(key):
+        return None
+    mapped = _store().mmap(key, _suffix(None))
+    if mapped is None:
+        return None
+    with mapped:
+        return mapped[start : end + 1]
+
+
+def touch_result(key: str) -> bool:
+    """
+    Restarts the expiry clock of a stored result and its compressed variants.
+
+    Returns:
+        bool: False if the result doesn't exist (anymore).
+    """
+    if not KEY_PATTERN.match(key):
+        return False
+    return _store().touch(key)
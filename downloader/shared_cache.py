@@ -0,0 +1,278 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Iterable
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "index.json"
+LOCK_NAME = ".lock"
+
+
+@dataclass
+class CacheEntry:
+    name: str
+    # the suffixes of the entry's files, each named `name + suffix`
+    suffixes: list[str]
+    # the total size of the files, in bytes
+    size: int
+    # when the entry was last used, as a `time.time()`
+    used: float
+    metadata: dict = field(default_factory=dict)
+
+
+class SharedCache:
+    """
+    A cache of files on disk, shared by every worker process of the machine.
+
+    Each entry is a few files sharing a name, plus JSON metadata. `index.json`
+    records every entry's files, size, metadata and when it was last used. It's only
+    read while holding a shared `flock` on the directory's lock file, and only
+    replaced, atomically, while holding an exclusive one, so every worker sees the
+    same consistent cache. Files are written to temporary files and moved into
+    place along with the index update that adds their entry, and only deleted along
+    with the one that removes it: a file opened while the lock was held (see `open`
+    and `mmap`) stays readable even if its entry is evicted afterwards.
+
+    Lookups only take the shared lock. When an entry was last used is only updated,
+    under the exclusive lock, if that was more than `touch_interval` seconds ago, so
+    readers of popular entries don't take turns rewriting the index: eviction order
+    and expiry are only as precise as that.
+
+    Once the entries add up to more than `max_size` bytes or `max_entries` entries,
+    the least recently used ones are evicted. Entries not used for `ttl` seconds
+    have expired. Entries bigger than `max_size` on their own aren't added.
+
+    Args:
+        directory (str | Path): Where the entries, the index and the lock file are
+            kept. It's created if needed.
+        max_size (int | None): The maximum total size of the entries' files.
+        max_entries (int | None): The maximum number of entries.
+        ttl (float | None): Seconds after their last use entries expire after, or
+            None to keep entries until they're evicted.
+        touch_interval (float): Seconds after their last recorded use entries are
+            marked as used again.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        max_size: int | None = None,
+        max_entries: int | None = None,
+        ttl: float | None = None,
+        touch_interval: float = 60,
+    ):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, name: str, suffix: str = "") -> Path:
+        return self.directory / f"{name}{suffix}"
+
+    def temporary_file(self) -> tuple[BinaryIO, str]:
+        """
+        Returns a new temporary file in the cache directory, and its path, to write
+        the file of an entry to before `put` moves it into place.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        return os.fdopen(fd, "wb"), tmp_path
+
+    def get(self, name: str, touch: bool = True) -> CacheEntry | None:
+        """
+        Returns an entry, or None if it isn't cached or has expired. Unless `touch`
+        is False, the entry is marked as recently used.
+        """
+        with self._lock(exclusive=False):
+            entry = self._live_entry(self._read_index(), name)
+        if entry is not None and touch:
+            self._mark_used(entry)
+        return entry
+
+    def touch(self, name: str) -> bool:
+        """
+        Marks an entry as recently used, restarting its expiry clock.
+
+        Returns:
+            bool: False if the entry isn't cached (anymore).
+        """
+        return self.get(name) is not None
+
+    def open(self, name: str, suffix: str = "") -> BinaryIO | None:
+        """
+        Opens one of an entry's files for reading and marks the entry as recently
+        used. Returns None if the entry, or that file of it, isn't cached.
+        """
+        with self._lock(exclusive=False):
+            entry = self._live_entry(self._read_index(), name)
+            if entry is None or suffix not in entry.suffixes:
+                return None
+            try:
+                file = open(self.path(name, suffix), "rb")
+            except FileNotFoundError:
+                return None
+        self._mark_used(entry)
+        return file
+
+    def mmap(self, name: str, suffix: str = "") -> mmap.mmap | None:
+        """
+        Maps one of an entry's files into memory, read-only, like `open`. Reading it
+        is then done from the page cache the workers share, without copying it
+        into each of them first. The file must not be empty.
+        """
+        file = self.open(name, suffix)
+        if file is None:
+            return None
+        with file:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def put(
+        self,
+        name: str,
+        files: dict[str, str] | None = None,
+        metadata: dict | None = None,
+    ) -> CacheEntry | None:
+        """
+        Adds or replaces an entry, then evicts least recently used entries until
+        the cache fits its limits again.
+
+        Args:
+            name (str): The entry's name.
+            files (dict[str, str] | None): The entry's files: suffix -> the path of
+                a file written with `temporary_file`, which is moved into place.
+            metadata (dict | None): JSON-serializable metadata of the entry.
+
+        Returns:
+            CacheEntry | None: The entry, or None if it's bigger than `max_size`, in
+            which case its files are deleted and the cache is left as it was.
+        """
+        files = files or {}
+        size = sum(os.stat(tmp_path).st_size for tmp_path in files.values())
+        if self.max_size is not None and size > self.max_size:
+            logger.info(f"Not caching {name}: {size} bytes don't fit the cache")
+            for tmp_path in files.values():
+                os.unlink(tmp_path)
+            return None
+        entry = CacheEntry(name, list(files), size, time.time(), metadata or {})
+        with self._lock(exclusive=True):
+            index = self._read_index()
+            stale = index.pop(name, None)
+            for suffix, tmp_path in files.items():
+                os.replace(tmp_path, self.path(name, suffix))
+            index[name] = entry
+            removed = self._evict(index, keep=name)
+            self._write_index(index)
+            if stale is not None:
+                # the files that weren't replaced
+                stale.suffixes = [s for s in stale.suffixes if s not in files]
+                removed.append(stale)
+            self._delete_files(removed)
+        return entry
+
+    def delete(self, name: str):
+        with self._lock(exclusive=True):
+            index = self._read_index()
+            entry = index.pop(name, None)
+            if entry is None:
+                return
+            self._write_index(index)
+            self._delete_files([entry])
+
+    def clear(self):
+        with self._lock(exclusive=True):
+            index = self._read_index()
+            self._write_index({})
+            self._delete_files(index.values())
+
+    def __len__(self):
+        with self._lock(exclusive=False):
+            return len(self._read_index())
+
+    def _mark_used(self, entry: CacheEntry):
+        now = time.time()
+        interval = self.touch_interval
+        if self.ttl is not None:
+            # often enough that entries in use don't expire
+            interval = min(interval, self.ttl / 2)
+        if now - entry.used < interval:
+            return
+        with self._lock(exclusive=True):
+            index = self._read_index()
+            current = self._live_entry(index, entry.name)
+            if current is not None:
+                current.used = entry.used = now
+                self._write_index(index)
+
+    def _live_entry(self, index: dict[str, CacheEntry], name: str) -> CacheEntry | None:
+        entry = index.get(name)
+        if entry is None or self._expired(entry, time.time()):
+            return None
+        return entry
+
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        return self.ttl is not None and now - entry.used > self.ttl
+
+    def _evict(self, index: dict[str, CacheEntry], keep: str) -> list[CacheEntry]:
+        # removes expired entries, then least recently used ones until the limits
+        # are met, from `index`, and returns them
+        now = time.time()
+        removed = [
+            index.pop(name)
+            for name, entry in list(index.items())
+            if name != keep and self._expired(entry, now)
+        ]
+        total_size = sum(entry.size for entry in index.values())
+        for entry in sorted(index.values(), key=lambda entry: entry.used):
+            if (self.max_size is None or total_size <= self.max_size) and (
+                self.max_entries is None or len(index) <= self.max_entries
+            ):
+                break
+            if entry.name == keep:
+                continue
+            del index[entry.name]
+            total_size -= entry.size
+            removed.append(entry)
+        return removed
+
+    def _delete_files(self, entries: Iterable[CacheEntry]):
+        for entry in entries:
+            for suffix in entry.suffixes:
+                try:
+                    os.unlink(self.path(entry.name, suffix))
+                except FileNotFoundError:
+                    pass
+
+    @contextmanager
+    def _lock(self, exclusive: bool):
+        with open(self.directory / LOCK_NAME, "a+b") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            # released when the file is closed
+            yield
+
+    def _read_index(self) -> dict[str, CacheEntry]:
+        try:
+            with open(self.directory / INDEX_NAME, "rb") as f:
+                entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        return {entry["name"]: CacheEntry(**entry) for entry in entries}
+
+    def _write_index(self, index: dict[str, CacheEntry]):
+        file, tmp_path = self.temporary_file()
+        try:
+            with file:
+                entries = [asdict(entry) for entry in index.values()]
+                file.write(json.dumps(entries).encode("utf-8"))
+            os.replace(tmp_path, self.directory / INDEX_NAME)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
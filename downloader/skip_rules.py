@@ -0,0 +1,144 @@
+import functools
+import os
+import zipfile
+from typing import Iterable
+
+from django.conf import settings
+
+from .path_filter import PathFilter
+
+# gitignore-style patterns of the members skipped by each name-based rule
+# fmt: off
+SKIP_RULE_PATTERNS = {
+    # dependencies checked into the repository
+    "vendor": [
+        "node_modules/", "bower_components/", "jspm_packages/", "vendor/",
+        "third_party/", "third-party/", "Pods/", "Carthage/", ".yarn/",
+        ".pnpm-store/", "venv/", ".venv/", "site-packages/", "__pycache__/",
+        ".tox/", ".nox/",
+    ],
+    # dependency lock files
+    "lockfile": [
+        "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml",
+        "bun.lock", "bun.lockb", "deno.lock", "poetry.lock", "Pipfile.lock",
+        "pdm.lock", "uv.lock", "Cargo.lock", "Gemfile.lock", "composer.lock",
+        "go.sum", "mix.lock", "pubspec.lock", "Podfile.lock", "packages.lock.json",
+        "flake.lock", "gradle.lockfile", "Package.resolved",
+    ],
+    # build output, source maps and code generated from other sources
+    "generated": [
+        "*.min.js", "*.min.mjs", "*.min.css", "*.map", "*.bundle.js", "*.chunk.js",
+        "*.pb.go", "*.pb.h", "*.pb.cc", "*_pb2.py", "*_pb2_grpc.py", "*.g.dart",
+        "*.freezed.dart", "*.designer.cs", "*.generated.*",
+    ],
+}
+# fmt: on
+
+# every rule: the name-based ones, files bigger than `settings.SKIP_LARGE_FILE_SIZE`,
+# and minified files (see `looks_minified`)
+SKIP_RULES = [*SKIP_RULE_PATTERNS, "large", "minified"]
+
+# extensions of files that are commonly minified into a few very long lines
+MINIFIABLE_EXTENSIONS = frozenset([".js", ".mjs", ".cjs", ".css", ".json", ".svg"])
+
+# the average line length above which a minifiable file is considered minified
+MINIFIED_LINE_LENGTH = 1000
+
+
+def looks_minified(filename: str, head: bytes, head_size: int) -> bool:
+    """
+    Tells whether a file was minified from the first `head_size` bytes of it.
+
+    Only files with a minifiable extension whose head is full are judged: a head of
+    long lines means a file of long lines.
+    """
+    if os.path.splitext(filename)[1].lower() not in MINIFIABLE_EXTENSIONS:
+        return False
+    if len(head) < head_size:
+        return False
+    return head.count(b"\n") < len(head) // MINIFIED_LINE_LENGTH
+
+
+class SkipRules:
+    """
+    Skips members that are rarely worth reading: vendored dependencies, lock files,
+    generated files, very large files and minified files.
+
+    All but the minified rule are judged from a member's name and uncompressed size
+    alone, so the members they skip are never decompressed. The minified rule is
+    judged from the first bytes of a member (see `looks_minified`).
+
+    Args:
+        rules (Iterable[str]): The rules to apply, from `SKIP_RULES`.
+        large_file_size (int | None): The size above which the "large" rule skips a
+            member.
+
+    Raises:
+        ValueError: If a rule is unknown.
+    """
+
+    def __init__(self, rules: Iterable[str] = (), large_file_size: int | None = None):
+        self.rules = tuple(rules)
+        unknown = set(self.rules) - set(SKIP_RULES)
+        if unknown:
+            raise ValueError(f"Unknown skip rules: {', '.join(sorted(unknown))}")
+        self._name_filters = [
+            (rule, PathFilter(exclude=SKIP_RULE_PATTERNS[rule]))
+            for rule in SKIP_RULE_PATTERNS
+            if rule in self.rules
+        ]
+        self.large_file_size = large_file_size if "large" in self.rules else None
+        self.detect_minified = "minified" in self.rules
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def _key(self) -> tuple:
+        return self.rules, self.large_file_size
+
+    def __eq__(self, other):
+        if not isinstance(other, SkipRules):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return (
+            f"SkipRules(rules={self.rules!r}, "
+            f"large_file_size={self.large_file_size!r})"
+        )
+
+    def match_name(self, member: zipfile.ZipInfo) -> str | None:
+        """Returns the name-based rule that skips a member, if any."""
+        for rule, name_filter in self._name_filters:
+            if not name_filter.matches(member.filename):
+                return rule
+        return None
+
+    def is_large(self, member: zipfile.ZipInfo) -> bool:
+        return (
+            self.large_file_size is not None and member.file_size > self.large_file_size
+        )
+
+
+# skips nothing
+NO_SKIP_RULES = SkipRules()
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_skip_rules(rules: tuple[str, ...], large_file_size: int) -> SkipRules:
+    return SkipRules(rules, large_file_size)
+
+
+def get_skip_rules(rules: Iterable[str] | None = None) -> SkipRules:
+    """
+    Returns the compiled skip rules, `settings.SKIP_RULES` by default.
+
+    Raises:
+        ValueError: If a rule is unknown.
+    """
+    if rules is None:
+        rules = settings.SKIP_RULES
+    return _compile_skip_rules(tuple(rules), settings.SKIP_LARGE_FILE_SIZE)
@@ -1,4 +1,6 @@
+import io
 import os
+import zipfile
 
 import nest_asyncio
 import pytest
@@ -31,3 +33,77 @@ def staticfiles(tmp_path_factory):
     with override_settings(STATIC_ROOT=static_root):
         call_command("collectstatic", "--noinput")
         yield
+
+
+@pytest.fixture(autouse=True)
+def result_store_dir(settings, tmp_path):
+    settings.RESULT_STORE_DIR = tmp_path / "results"
+
+
+@pytest.fixture(autouse=True)
+def result_cache_dir(settings, tmp_path):
+    settings.RESULT_CACHE_DIR = tmp_path / "result_cache"
+
+
+@pytest.fixture(autouse=True)
+def archive_cache_dir(settings, tmp_path):
+    settings.ARCHIVE_CACHE_DIR = tmp_path / "archives"
+
+
+@pytest.fixture(autouse=True)
+def empty_blob_store():
+    from downloader.blob_store import clear_blob_store
+
+    clear_blob_store()
+    yield
+    clear_blob_store()
+
+
+class Unseekable:
+    # zipfile writes data descriptors when it can't seek back to the local headers
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def flush(self):
+        pass
+
+
+def _zip_bytes(
+    files: dict[str, bytes | str],
+    compression: int = zipfile.ZIP_DEFLATED,
+    data_descriptors: bool = False,
+    comment: bytes = b"",
+) -> bytes:
+    output = Unseekable() if data_descriptors else io.BytesIO()
+    with zipfile.ZipFile(output, mode="w", compression=compression) as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+        zf.comment = comment
+    return (output.buffer if data_descriptors else output).getvalue()
+
+
+def _open_zip(files: dict[str, bytes | str], **options) -> zipfile.ZipFile:
+    from downloader.archives import open_zip
+
+    # an archive `open_zip` opened is copied to a temporary file for worker processes
+    return open_zip(io.BytesIO(_zip_bytes(files, **options)))
+
+
+@pytest.fixture
+def make_zip_bytes():
+    """
+    Builds a ZIP archive of `files` (name -> content, names ending with "/" are
+    directories), in that order: `make_zip_bytes(files, compression=ZIP_DEFLATED,
+    data_descriptors=False, comment=b"")`. With `data_descriptors`, the sizes and
+    CRC-32 of members follow their data, like in archives written without seeking.
+    """
+    return _zip_bytes
+
+
+@pytest.fixture
+def make_zip():
+    """Opens the archive `make_zip_bytes` builds with `open_zip`."""
+    return _open_zip
@@ -0,0 +1,168 @@
+import hashlib
+import io
+import threading
+import zipfile
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from downloader.archive_cache import (
+    cache_archive,
+    get_cached_archive,
+    open_cached_archive,
+)
+from downloader.repo_utils import download_repo
+
+
+@pytest.fixture
+def make_archive(make_zip_bytes):
+    def make_archive(content: str) -> bytes:
+        return make_zip_bytes({"repo-master/file.txt": content}, zipfile.ZIP_STORED)
+
+    return make_archive
+
+
+class ArchiveServer(ThreadingHTTPServer):
+    """A stand-in for codeload.github.com that supports conditional requests."""
+
+    def __init__(self, archive: bytes):
+        super().__init__(("127.0.0.1", 0), ArchiveRequestHandler)
+        self.use_etag = True
+        self.set_archive(archive)
+        self.requests = []
+
+    def set_archive(self, archive: bytes):
+        self.archive = archive
+        self.etag = f'"{hashlib.sha256(archive).hexdigest()}"'
+        self.last_modified = formatdate(usegmt=True)
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+
+class ArchiveRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        if self.path != "/owner/repo/archive/master.zip":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if server.use_etag:
+            not_modified = self.headers.get("If-None-Match") == server.etag
+        else:
+            not_modified = self.headers.get("If-Modified-Since") == server.last_modified
+        if not_modified:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Length", str(len(server.archive)))
+        if server.use_etag:
+            self.send_header("ETag", server.etag)
+        else:
+            self.send_header("Last-Modified", server.last_modified)
+        self.end_headers()
+        self.wfile.write(server.archive)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def archive_server(make_archive):
+    server = ArchiveServer(make_archive("version 1"))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.asyncio
+async def test_unchanged_archive_is_revalidated(archive_server):
+    repo_url = f"{archive_server.url}/owner/repo"
+
+    first = await download_repo(repo_url)
+    second = await download_repo(repo_url)
+
+    assert second.archive.read("repo-master/file.txt") == b"version 1"
+    assert second.download_size == first.download_size
+    first_headers, second_headers = [h for _, h in archive_server.requests]
+    assert "If-None-Match" not in first_headers
+    assert second_headers["If-None-Match"] == archive_server.etag
+    first.close()
+    second.close()
+
+
+@pytest.mark.asyncio
+async def test_changed_archive_is_downloaded_again(archive_server, make_archive):
+    repo_url = f"{archive_server.url}/owner/repo"
+    (await download_repo(repo_url)).close()
+
+    archive_server.set_archive(make_archive("version 2"))
+    result = await download_repo(repo_url)
+
+    assert result.archive.read("repo-master/file.txt") == b"version 2"
+    cached = get_cached_archive(f"{repo_url}/archive/master.zip")
+    assert cached.etag == archive_server.etag
+    result.close()
+
+
+@pytest.mark.asyncio
+async def test_last_modified_revalidation(archive_server):
+    archive_server.use_etag = False
+    repo_url = f"{archive_server.url}/owner/repo"
+
+    (await download_repo(repo_url)).close()
+    result = await download_repo(repo_url)
+
+    _, second_headers = archive_server.requests[1]
+    assert second_headers["If-Modified-Since"] == archive_server.last_modified
+    assert result.archive.read("repo-master/file.txt") == b"version 1"
+    result.close()
+
+
+@pytest.mark.asyncio
+async def test_disabled_archive_cache(archive_server, settings):
+    settings.ARCHIVE_CACHE_MAX_SIZE = 0
+    repo_url = f"{archive_server.url}/owner/repo"
+
+    (await download_repo(repo_url)).close()
+    (await download_repo(repo_url)).close()
+
+    assert all("If-None-Match" not in h for _, h in archive_server.requests)
+
+
+@pytest.mark.asyncio
+async def test_archive_cache_eviction(archive_server, settings, make_archive):
+    archive_size = len(archive_server.archive)
+    settings.ARCHIVE_CACHE_MAX_SIZE = archive_size
+    first_url = f"{archive_server.url}/owner/repo"
+    (await download_repo(first_url)).close()
+    assert get_cached_archive(f"{first_url}/archive/master.zip")
+
+    # a second entry that doesn't fit alongside the first
+    archive_server.set_archive(make_archive("version 2"))
+    second_url = f"{archive_server.url}/owner/repo/archive/master.zip?x=1"
+    cache_archive(second_url, io.BytesIO(archive_server.archive), '"etag"', None)
+
+    assert get_cached_archive(f"{first_url}/archive/master.zip") is None
+    assert get_cached_archive(second_url)
+
+
+def test_tarball_is_cached_with_its_suffix():
+    url = "https://example.com/owner/repo/archive/master.tar.gz"
+    cache_archive(url, io.BytesIO(b"tarball"), '"etag"', None, "tar.gz")
+
+    with open_cached_archive(get_cached_archive(url, "tar.gz")) as file:
+        assert file.name.endswith(".tar.gz")
+        assert file.read() == b"tarball"
+    assert get_cached_archive(url, "zip") is None
@@ -0,0 +1,149 @@
+import io
+import os
+import subprocess
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from downloader import blob_store, file_utils
+from downloader.file_utils import StreamingTextExtractor, extract_text_files
+from downloader.priority import ARCHIVE_ORDER
+from downloader.zip_stream import ZipStreamParser
+
+FILES = {
+    "repo/README.md": b"# Hello\n" * 50,
+    "repo/app.py": b"print('hello')\n" * 50,
+    "repo/data.dat": b"\x00\x01\x02",
+}
+
+
+@pytest.fixture
+def decoded(monkeypatch):
+    decoded = []
+    read_text_member = file_utils.read_text_member
+    monkeypatch.setattr(
+        file_utils,
+        "read_text_member",
+        lambda zip_file, member, *args: decoded.append(member.filename)
+        or read_text_member(zip_file, member, *args),
+    )
+    return decoded
+
+
+@pytest.mark.asyncio
+async def test_members_of_other_archives_are_not_decoded_again(decoded, make_zip):
+    first = await extract_text_files(make_zip(FILES), mode="sequential")
+    fork = {f"fork/{name[5:]}": content for name, content in FILES.items()}
+    fork["fork/new.py"] = b"print('new')\n"
+    decoded.clear()
+
+    result = await extract_text_files(make_zip(fork), mode="sequential")
+
+    assert decoded == ["fork/new.py", "fork/data.dat"]
+    assert result.text_files["fork/app.py"] == first.text_files["repo/app.py"]
+    assert list(result.text_files) == ["fork/README.md", "fork/app.py", "fork/new.py"]
+
+
+@pytest.mark.asyncio
+async def test_stored_text_is_judged_against_the_budget(make_zip):
+    files = {"repo/a.txt": b"a\n" * 100, "repo/b.txt": b"b\n" * 100}
+    await extract_text_files(make_zip(files), mode="sequential")
+
+    result = await extract_text_files(make_zip(files), max_total_size=300)
+
+    assert list(result.text_files) == ["repo/a.txt"]
+    assert result.size_limit_reached
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["sequential", "threads"])
+async def test_stored_members_are_not_decompressed(mode, monkeypatch, make_zip):
+    await extract_text_files(make_zip(FILES), mode="sequential")
+    zip_file = make_zip(FILES)
+    opened = []
+    open_member = zipfile.ZipFile.open
+    monkeypatch.setattr(
+        zipfile.ZipFile,
+        "open",
+        lambda zip_file, name, *args, **kwargs: opened.append(
+            getattr(name, "filename", name)
+        )
+        or open_member(zip_file, name, *args, **kwargs),
+    )
+
+    await extract_text_files(zip_file, mode=mode)
+
+    assert opened == ["repo/data.dat"]
+
+
+@pytest.mark.asyncio
+async def test_decoding_depends_on_the_extension(decoded, make_zip):
+    content = b"# -*- coding: latin-1 -*-\n\xe9\n"
+    await extract_text_files(make_zip({"a.txt": content}), mode="sequential")
+
+    result = await extract_text_files(make_zip({"a.py": content}), mode="sequential")
+
+    assert decoded == ["a.txt", "a.py"]
+    assert result.text_files == {"a.py": "# -*- coding: latin-1 -*-\né\n"}
+
+
+@pytest.mark.asyncio
+async def test_disabled(settings, decoded, make_zip):
+    settings.BLOB_STORE_MAX_SIZE = 0
+    await extract_text_files(make_zip(FILES), mode="sequential")
+
+    await extract_text_files(make_zip(FILES), mode="sequential")
+
+    assert decoded == ["repo/README.md", "repo/app.py", "repo/data.dat"] * 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_total_size", [10**6, 1000])
+async def test_streaming_extraction_uses_stored_text(
+    max_total_size, monkeypatch, make_zip_bytes
+):
+    data = make_zip_bytes(FILES)
+    await extract_text_files(zipfile.ZipFile(io.BytesIO(data)), mode="sequential")
+    expected = await extract_text_files(
+        zipfile.ZipFile(io.BytesIO(data)),
+        max_total_size=max_total_size,
+        mode="sequential",
+        priority=ARCHIVE_ORDER,
+    )
+    decoders = []
+    decoder_class = file_utils.MemberTextDecoder
+    monkeypatch.setattr(
+        file_utils,
+        "MemberTextDecoder",
+        lambda *args, **kwargs: decoders.append(args[2])
+        or decoder_class(*args, **kwargs),
+    )
+
+    extractor = StreamingTextExtractor(
+        max_total_size=max_total_size, priority=ARCHIVE_ORDER
+    )
+    fed = set()
+    member_data = extractor.member_data
+    monkeypatch.setattr(
+        extractor, "member_data", lambda data: fed.add(data) or member_data(data)
+    )
+    parser = ZipStreamParser(extractor)
+    parser.feed(data)
+    parser.close()
+
+    assert extractor.result() == expected
+    assert decoders == ["repo/data.dat"]
+    assert fed == {FILES["repo/data.dat"]}
+
+
+def test_import_does_not_need_settings():
+    # what worker processes and benchmarks without a settings module do
+    env = {k: v for k, v in os.environ.items() if k != "DJANGO_SETTINGS_MODULE"}
+    subprocess.run(
+        [sys.executable, "-c", "import downloader.blob_store, downloader.file_utils"],
+        cwd=Path(__file__).parents[2],
+        env=env,
+        check=True,
+    )
@@ -1,13 +1,21 @@
+import asyncio
 import io
+import tarfile
+import threading
 import zipfile
 
 import pytest
-from pytest_httpx import HTTPXMock
+from pytest_httpx import HTTPXMock, IteratorStream
 
+from downloader import archive_cache, archives, repo_utils
+from downloader.archives import BackgroundArchiveParser, MappedFile
+from downloader.file_utils import StreamingTextExtractor, extract_text_files
+from downloader.priority import ARCHIVE_ORDER
 from downloader.repo_utils import (
     DownloadResult,
     RepositoryDownloadError,
     RepositorySizeExceededError,
+    archive_root,
     download_repo,
 )
 
@@ -28,7 +36,7 @@ async def test_download_repo_success(httpx_mock: HTTPXMock):
 
     assert isinstance(result, DownloadResult)
     assert result.download_size == len(zip_content)
-    assert "file.txt" in result.zip_file.namelist()
+    assert "file.txt" in result.archive.namelist()
 
 
 @pytest.mark.asyncio
@@ -97,3 +105,474 @@ async def test_download_repo_with_empty_repository(httpx_mock: HTTPXMock):
 
     assert isinstance(result, DownloadResult)
     assert result.download_size == len(zip_content)
+
+
+@pytest.fixture
+def make_zip_content(make_zip_bytes):
+    def make_zip_content(size: int) -> bytes:
+        # stored, so the archive is at least `size` bytes
+        return make_zip_bytes({"file.txt": b"x" * size}, zipfile.ZIP_STORED)
+
+    return make_zip_content
+
+
+@pytest.mark.asyncio
+async def test_download_repo_spools_large_archive_to_disk(
+    httpx_mock: HTTPXMock, settings, make_zip_content
+):
+    repo_url = "https://example.com/repo"
+    settings.DOWNLOAD_SPOOL_MAX_MEMORY = 1024
+    zip_content = make_zip_content(4096)
+
+    httpx_mock.add_response(url=f"{repo_url}/archive/master.zip", content=zip_content)
+
+    result = await download_repo(repo_url)
+
+    # read through a memory map of the temporary file
+    assert isinstance(result.archive.fp, MappedFile)
+    buffer = result.archive.fp.file
+    assert buffer._rolled
+    assert result.download_size == len(zip_content)
+    assert result.archive.read("file.txt") == b"x" * 4096
+    result.close()
+    assert result.archive.fp is None
+    assert buffer.closed
+
+
+@pytest.mark.asyncio
+async def test_download_repo_reads_spooled_archive_without_mmap(
+    httpx_mock: HTTPXMock, settings, make_zip_content
+):
+    repo_url = "https://example.com/repo"
+    settings.DOWNLOAD_SPOOL_MAX_MEMORY = 1024
+    settings.ARCHIVE_MMAP = False
+    zip_content = make_zip_content(4096)
+
+    httpx_mock.add_response(url=f"{repo_url}/archive/master.zip", content=zip_content)
+
+    result = await download_repo(repo_url)
+
+    assert result.archive.fp._rolled
+    assert result.archive.read("file.txt") == b"x" * 4096
+    result.close()
+
+
+@pytest.mark.asyncio
+async def test_download_repo_keeps_small_archive_in_memory(
+    httpx_mock: HTTPXMock, settings, make_zip_content
+):
+    repo_url = "https://example.com/repo"
+    settings.DOWNLOAD_SPOOL_MAX_MEMORY = 1024 * 1024
+    zip_content = make_zip_content(100)
+
+    httpx_mock.add_response(url=f"{repo_url}/archive/master.zip", content=zip_content)
+
+    result = await download_repo(repo_url)
+
+    assert not result.archive.fp._rolled
+    assert result.archive.read("file.txt") == b"x" * 100
+
+
+@pytest.mark.asyncio
+async def test_download_repo_preallocation_is_trimmed(
+    httpx_mock: HTTPXMock, settings, make_zip_content
+):
+    repo_url = "https://example.com/repo"
+    settings.DOWNLOAD_SPOOL_MAX_MEMORY = 1024
+    zip_content = make_zip_content(4096)
+
+    # a server that over-reports its size must not leave trailing garbage behind
+    # the end of central directory record
+    httpx_mock.add_response(
+        url=f"{repo_url}/archive/master.zip",
+        stream=IteratorStream([zip_content]),
+        headers={"Content-Length": str(len(zip_content) + 1000)},
+    )
+
+    result = await download_repo(repo_url)
+
+    assert result.archive.read("file.txt") == b"x" * 4096
+
+
+@pytest.mark.asyncio
+async def test_download_repo_without_spooling(
+    httpx_mock: HTTPXMock, settings, make_zip_content
+):
+    repo_url = "https://example.com/repo"
+    settings.DOWNLOAD_SPOOL_MAX_MEMORY = None
+    zip_content = make_zip_content(4096)
+
+    httpx_mock.add_response(url=f"{repo_url}/archive/master.zip", content=zip_content)
+
+    result = await download_repo(repo_url)
+
+    assert isinstance(result.archive.fp, io.BytesIO)
+    assert result.archive.read("file.txt") == b"x" * 4096
+
+
+@pytest.mark.asyncio
+async def test_download_repo_commit_sha_from_archive_comment(httpx_mock: HTTPXMock):
+    repo_url = "https://example.com/repo"
+    sha = "0123456789abcdef0123456789abcdef01234567"
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, mode="w") as zip_file:
+        zip_file.writestr("file.txt", "Dummy file content")
+        zip_file.comment = sha.encode()
+
+    httpx_mock.add_response(
+        url=f"{repo_url}/archive/master.zip", content=zip_buffer.getvalue()
+    )
+
+    result = await download_repo(repo_url)
+
+    assert result.commit_sha == sha
+
+
+@pytest.fixture
+def make_repo_zip(make_zip_bytes):
+    def make_repo_zip(compression=zipfile.ZIP_DEFLATED) -> bytes:
+        files = {
+            "repo/README.md": "# Hello\n" * 1000,
+            "repo/logo.bin": bytes(range(256)) * 10,
+            **{f"repo/{i}.py": f"print({i})\n" * 100 for i in range(20)},
+        }
+        return make_zip_bytes(files, compression)
+
+    return make_repo_zip
+
+
+@pytest.mark.asyncio
+async def test_download_repo_extracts_while_downloading(
+    httpx_mock: HTTPXMock, make_repo_zip
+):
+    repo_url = "https://example.com/repo"
+    zip_content = make_repo_zip()
+    chunks = [zip_content[i : i + 1000] for i in range(0, len(zip_content), 1000)]
+    httpx_mock.add_response(
+        url=f"{repo_url}/archive/master.zip", stream=IteratorStream(chunks)
+    )
+
+    result = await download_repo(
+        repo_url,
+        text_extractor=StreamingTextExtractor(10, 10**6, priority=ARCHIVE_ORDER),
+    )
+
+    assert result.extraction == await extract_text_files(
+        zipfile.ZipFile(io.BytesIO(zip_content)), 10, 10**6, priority=ARCHIVE_ORDER
+    )
+    assert result.extraction.file_limit_reached
+
+
+@pytest.fixture
+def download_buffers(monkeypatch):
+    buffers = []
+    create_download_buffer = repo_utils._create_download_buffer
+    monkeypatch.setattr(
+        repo_utils,
+        "_create_download_buffer",
+        lambda *args: buffers.append(create_download_buffer(*args)) or buffers[-1],
+    )
+    return buffers
+
+
+class FailingHandler:
+    def start_member(self, member):
+        raise RuntimeError("handler failed")
+
+
+@pytest.mark.asyncio
+async def test_download_repo_closes_buffer_when_extraction_fails(
+    httpx_mock: HTTPXMock, download_buffers, make_repo_zip
+):
+    repo_url = "https://example.com/repo"
+    httpx_mock.add_response(
+        url=f"{repo_url}/archive/master.zip", content=make_repo_zip()
+    )
+
+    with pytest.raises(RuntimeError):
+        await download_repo(repo_url, text_extractor=FailingHandler())
+
+    assert download_buffers[0].closed
+
+
+@pytest.mark.asyncio
+async def test_download_repo_closes_archive_when_caching_fails(
+    httpx_mock: HTTPXMock, download_buffers, monkeypatch, make_repo_zip
+):
+    repo_url = "https://example.com/repo"
+    httpx_mock.add_response(
+        url=f"{repo_url}/archive/master.zip", content=make_repo_zip()
+    )
+
+    def cache_archive(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(archive_cache, "cache_archive", cache_archive)
+
+    with pytest.raises(OSError):
+        await download_repo(repo_url)
+
+    assert download_buffers[0].closed
+
+
+class BlockingHandler:
+    # holds the parser up at the first member until `release` is set
+    def __init__(self):
+        self.release = threading.Event()
+        self.members = []
+
+    def start_member(self, member):
+        self.release.wait()
+        self.members.append(member.filename)
+        return False
+
+    def member_data(self, data):
+        return False
+
+    def end_member(self, member):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_background_parser_holds_the_download_back(monkeypatch, make_repo_zip):
+    monkeypatch.setattr(archives, "STREAM_QUEUE_SIZE", 2)
+    zip_content = make_repo_zip()
+    handler = BlockingHandler()
+    parser = BackgroundArchiveParser(handler, "zip")
+
+    async def feed_all():
+        for i in range(0, len(zip_content), 100):
+            await parser.feed(zip_content[i : i + 100])
+
+    feeding = asyncio.create_task(feed_all())
+    await asyncio.sleep(0.1)
+
+    assert not feeding.done()
+    handler.release.set()
+    await feeding
+    await parser.close()
+    assert len(handler.members) == 22
+
+
+@pytest.mark.asyncio
+async def test_download_repo_ranked_extraction_over_the_limits_waits_for_download(
+    httpx_mock: HTTPXMock,
+    make_repo_zip,
+):
+    repo_url = "https://example.com/repo"
+    httpx_mock.add_response(
+        url=f"{repo_url}/archive/master.zip", content=make_repo_zip()
+    )
+
+    result = await download_repo(
+        repo_url, text_extractor=StreamingTextExtractor(10, 10**6)
+    )
+
+    # the members that arrived first aren't necessarily the ones to extract
+    assert result.extraction is None
+
+
+@pytest.mark.asyncio
+async def test_download_repo_without_extraction_while_downloading(
+    httpx_mock: HTTPXMock,
+    make_repo_zip,
+):
+    repo_url = "https://example.com/repo"
+    # bzip2 members can't be read front to back
+    httpx_mock.add_response(
+        url=f"{repo_url}/archive/master.zip",
+        content=make_repo_zip(zipfile.ZIP_BZIP2),
+    )
+
+    result = await download_repo(repo_url, text_extractor=StreamingTextExtractor())
+
+    assert result.extraction is None
+    assert "repo/README.md" in result.archive.namelist()
+
+
+SHA = "0123456789abcdef0123456789abcdef01234567"
+REPO_FILES = {
+    "src/": None,
+    "README.md": b"# Hello\n" * 1000,
+    "logo.bin": bytes(range(256)) * 10,
+    "src/main.py": b"print('hello')\n" * 100,
+    "docs/index.md": b"Caf\xc3\xa9\n",
+    # a copy of the README that doesn't fit once the README is taken
+    "docs/README.md": b"# Hello\n" * 1000,
+}
+# GitHub stores a symlink as a file holding its target in ZIP archives
+REPO_SYMLINKS = {"link.md": "README.md"}
+
+
+@pytest.fixture
+def make_github_zip(make_zip_bytes):
+    def make_github_zip() -> bytes:
+        files = {"repo-master/": b""}
+        for name, content in REPO_FILES.items():
+            files[f"repo-master/{name}"] = content or b""
+        for name, target in REPO_SYMLINKS.items():
+            files[f"repo-master/{name}"] = target
+        return make_zip_bytes(files, zipfile.ZIP_STORED, comment=SHA.encode())
+
+    return make_github_zip
+
+
+def make_github_tarball() -> bytes:
+    tar_buffer = io.BytesIO()
+    root = f"owner-repo-{SHA[:7]}"
+    with tarfile.open(
+        fileobj=tar_buffer,
+        mode="w:gz",
+        format=tarfile.PAX_FORMAT,
+        pax_headers={"comment": SHA},
+    ) as tar:
+        tar.addfile(_tar_dir(root))
+        for name, content in REPO_FILES.items():
+            if content is None:
+                tar.addfile(_tar_dir(f"{root}/{name}"))
+            else:
+                info = tarfile.TarInfo(f"{root}/{name}")
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        for name, target in REPO_SYMLINKS.items():
+            info = tarfile.TarInfo(f"{root}/{name}")
+            info.type = tarfile.SYMTYPE
+            info.linkname = target
+            tar.addfile(info)
+    return tar_buffer.getvalue()
+
+
+def _tar_dir(name: str) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(name.rstrip("/"))
+    info.type = tarfile.DIRTYPE
+    return info
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("priority", [None, ARCHIVE_ORDER])
+@pytest.mark.parametrize(
+    "max_files,max_total_size", [(1000, 10**6), (2, 10**6), (1000, 9000)]
+)
+async def test_download_repo_tarball_matches_zip(
+    httpx_mock: HTTPXMock, max_files, max_total_size, priority, make_github_zip
+):
+    repo_url = "https://example.com/repo"
+    tarball = make_github_tarball()
+    chunks = [tarball[i : i + 1000] for i in range(0, len(tarball), 1000)]
+    httpx_mock.add_response(
+        url=f"{repo_url}/archive/master.tar.gz", stream=IteratorStream(chunks)
+    )
+    httpx_mock.add_response(
+        url=f"{repo_url}/archive/master.zip", content=make_github_zip()
+    )
+
+    text_extractor = StreamingTextExtractor(
+        max_files, max_total_size, priority=priority
+    )
+    tar_result = await download_repo(
+        repo_url, text_extractor=text_extractor, archive_format="tar.gz"
+    )
+    zip_result = await download_repo(repo_url, archive_format="zip")
+    expected = await extract_text_files(
+        zip_result.archive,
+        max_files,
+        max_total_size,
+        mode="sequential",
+        priority=priority,
+    )
+
+    assert isinstance(tar_result.archive, tarfile.TarFile)
+    assert tar_result.download_size == len(tarball)
+    assert tar_result.commit_sha == zip_result.commit_sha == SHA
+    assert tar_result.uncompressed_size == zip_result.uncompressed_size
+    if priority is ARCHIVE_ORDER or (max_files == 1000 and max_total_size == 10**6):
+        assert tar_result.extraction == expected
+        assert list(tar_result.extraction.text_files) == list(expected.text_files)
+    else:
+        # the limits can't fit every member, so they're only ranked afterwards
+        assert tar_result.extraction is None
+    for streamed in [None, text_extractor.streamed]:
+        assert (
+            await extract_text_files(
+                tar_result.archive,
+                max_files,
+                max_total_size,
+                priority=priority,
+                streamed=streamed,
+            )
+            == expected
+        )
+    tar_result.close()
+    zip_result.close()
+
+
+@pytest.mark.asyncio
+async def test_download_repo_archive_format_setting(httpx_mock: HTTPXMock, settings):
+    repo_url = "https://example.com/repo"
+    settings.ARCHIVE_FORMAT = "tar.gz"
+    httpx_mock.add_response(
+        url=f"{repo_url}/archive/master.tar.gz", content=make_github_tarball()
+    )
+
+    result = await download_repo(repo_url)
+    extraction = await extract_text_files(result.archive)
+
+    assert "repo-master/README.md" in result.archive.getnames()
+    assert extraction.text_files["repo-master/link.md"] == "README.md"
+
+
+@pytest.mark.asyncio
+async def test_download_repo_invalid_tarball(httpx_mock: HTTPXMock):
+    repo_url = "https://example.com/repo"
+    httpx_mock.add_response(
+        url=f"{repo_url}/archive/master.tar.gz", content=b"Invalid tarball content"
+    )
+
+    with pytest.raises(RepositoryDownloadError):
+        await download_repo(
+            repo_url,
+            text_extractor=StreamingTextExtractor(),
+            archive_format="tar.gz",
+        )
+
+
+@pytest.mark.asyncio
+async def test_download_repo_ref(httpx_mock: HTTPXMock):
+    repo_url = "https://example.com/repo"
+    httpx_mock.add_response(
+        url=f"{repo_url}/archive/feature/x.tar.gz", content=make_github_tarball()
+    )
+
+    result = await download_repo(repo_url, archive_format="tar.gz", ref="feature/x")
+
+    # like GitHub names the top-level directory of ZIP archives
+    assert "repo-feature-x/README.md" in result.archive.getnames()
+
+
+@pytest.mark.asyncio
+async def test_download_repo_version_tag(httpx_mock: HTTPXMock):
+    repo_url = "https://example.com/repo"
+    httpx_mock.add_response(
+        url=f"{repo_url}/archive/v1.2.3.tar.gz", content=make_github_tarball()
+    )
+
+    result = await download_repo(repo_url, archive_format="tar.gz", ref="v1.2.3")
+
+    # GitHub names the top-level directory of the tag's ZIP archive repo-1.2.3
+    assert "repo-1.2.3/README.md" in result.archive.getnames()
+    result.close()
+
+
+@pytest.mark.parametrize(
+    "ref,expected",
+    [
+        ("master", "repo-master"),
+        ("feature/x", "repo-feature-x"),
+        ("v1.2.3", "repo-1.2.3"),
+        ("v2", "repo-2"),
+        ("vendor", "repo-vendor"),
+        ("release/v1.0", "repo-release-v1.0"),
+    ],
+)
+def test_archive_root(ref, expected):
+    assert archive_root("https://github.com/owner/repo/", ref) == expected
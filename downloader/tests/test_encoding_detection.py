@@ -3,7 +3,10 @@ import io
 
 import pytest
 
-from downloader.file_utils import detect_internal_encoding_from_bytes
+from downloader.file_utils import (
+    detect_internal_encoding_from_bytes,
+    find_encoding_declaration,
+)
 
 FILE_ENCODING_MAPPING = {
     "python": {
@@ -232,3 +235,35 @@ def test_detect_internal_encoding_with_different_encodings(encoding):
 CONTENT = "# -*- coding: utf-8 -*-\n\nprint('Hello, World!')\n"
 
 
+def test_declaration_after_the_second_line_is_ignored():
+    content = b"#!/usr/bin/env python\n\n# -*- coding: latin-1 -*-\n"
+    assert detect_internal_encoding_from_bytes(content) == (None, None)
+
+
+def test_html_declaration_within_first_1024_characters():
+    content = "<html>\n" + " " * 900 + '<meta charset="latin-1">\n'
+    assert find_encoding_declaration(content) == ("HTML", "latin-1")
+    content = "<html>\n" + " " * 1100 + '<meta charset="latin-1">\n'
+    assert find_encoding_declaration(content) == (None, None)
+
+
+@pytest.mark.parametrize(
+    "content,filename,expected",
+    [
+        ("/* coding: latin-1 */", "style.css", (None, None)),
+        ("/* coding: latin-1 */", "notes.txt", ("Python", "latin-1")),
+        ("/* coding: latin-1 */", None, ("Python", "latin-1")),
+        ("# coding: latin-1", "lib/gem.rb", ("Ruby", "latin-1")),
+        ('@charset "latin-1";', "STYLE.CSS", ("CSS", "latin-1")),
+        ('<?xml version="1.0" encoding="latin-1"?>', "page.xhtml", ("XHTML", "latin-1")),
+    ],
+)
+def test_declarations_by_extension(content, filename, expected):
+    assert find_encoding_declaration(content, filename) == expected
+
+
+def test_head_ending_in_the_middle_of_a_character():
+    content = "# coding: latin-1\n".encode("utf-8") + "\u00e9".encode("utf-8") * 1000
+    head = content[:1023]
+    assert not head[-1:].isascii()
+    assert detect_internal_encoding_from_bytes(head) == ("Python", "latin-1")
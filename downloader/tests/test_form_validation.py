@@ -1,6 +1,13 @@
+import io
+
 import pytest
+from django.core.files.uploadedfile import (
+    InMemoryUploadedFile,
+    TemporaryUploadedFile,
+)
 
-from downloader.forms import RepositoryURLForm
+from downloader.archives import MappedFile, close_archive
+from downloader.forms import RepositoryURLForm, ZipFileForm
 
 
 def test_form_with_valid_input():
@@ -63,3 +70,117 @@ def test_form_with_multiple_valid_inputs(repo_url, username, repo_name):
     # Assert
     assert is_valid is True, f"Error in form validation: {form.errors}"
     assert form.cleaned_data["repo_url"] == (repo_url, username, repo_name)
+
+
+@pytest.fixture
+def zip_bytes(make_zip_bytes) -> bytes:
+    return make_zip_bytes({"repo/README.md": "# Hello\n"})
+
+
+def clean(upload):
+    form = ZipFileForm({}, {"zip_file": upload})
+    assert form.is_valid(), form.errors
+    return form.cleaned_data["zip_file"]
+
+
+def test_in_memory_upload_is_read_from_its_buffer(zip_bytes):
+    data = zip_bytes
+    buffer = io.BytesIO(data)
+    upload = InMemoryUploadedFile(
+        buffer, "zip_file", "repo.zip", "application/zip", len(data), None
+    )
+
+    zip_file, name, size, uncompressed_size = clean(upload)
+
+    assert zip_file.fp is buffer
+    assert zip_file.read("repo/README.md") == b"# Hello\n"
+    assert (name, size, uncompressed_size) == ("repo.zip", len(data), 8)
+
+
+def test_temporary_upload_is_opened_by_path(zip_bytes):
+    data = zip_bytes
+    upload = TemporaryUploadedFile("repo.zip", "application/zip", len(data), None)
+    upload.write(data)
+    upload.flush()
+
+    zip_file, *_ = clean(upload)
+
+    try:
+        assert isinstance(zip_file.fp, MappedFile)
+        assert zip_file.filename == upload.temporary_file_path()
+        assert zip_file.read("repo/README.md") == b"# Hello\n"
+    finally:
+        close_archive(zip_file)
+        upload.close()
+
+
+def test_invalid_temporary_upload():
+    data = b"PK\x03\x04 not really a zip"
+    upload = TemporaryUploadedFile("repo.zip", "application/zip", len(data), None)
+    upload.write(data)
+    upload.flush()
+
+    form = ZipFileForm({}, {"zip_file": upload})
+
+    assert not form.is_valid()
+    upload.close()
+
+
+@pytest.mark.parametrize("data", [b"PK\x03\x04 not really a zip", b"plain text"])
+def test_invalid_upload(data):
+    upload = InMemoryUploadedFile(
+        io.BytesIO(data), "zip_file", "repo.zip", "application/zip", len(data), None
+    )
+
+    form = ZipFileForm({}, {"zip_file": upload})
+
+    assert not form.is_valid()
+
+
+def test_form_path_patterns():
+    form = RepositoryURLForm(
+        {
+            "repo_url": "https://github.com/username/repo",
+            "include": "src/\r\n\r\n*.md",
+            "exclude": "tests/",
+        }
+    )
+
+    assert form.is_valid(), form.errors
+    assert form.cleaned_data["include"] == ["src/", "*.md"]
+    assert form.cleaned_data["exclude"] == ["tests/"]
+
+
+def test_form_invalid_path_pattern():
+    form = RepositoryURLForm(
+        {"repo_url": "https://github.com/username/repo", "exclude": "[z-a]"}
+    )
+
+    assert not form.is_valid()
+    assert "exclude" in form.errors
+
+
+@pytest.mark.parametrize(
+    "repo_url,ref,subdirectory",
+    [
+        ("https://github.com/username/repo", None, ""),
+        ("https://github.com/username/repo/tree/main", "main", ""),
+        (
+            "https://github.com/username/repo/tree/main/packages/foo",
+            "main",
+            "packages/foo",
+        ),
+        (
+            "https://github.com/username/repo/tree/dev/packages/foo/",
+            "dev",
+            "packages/foo",
+        ),
+    ],
+)
+def test_form_tree_url(repo_url, ref, subdirectory):
+    form = RepositoryURLForm({"repo_url": repo_url})
+
+    assert form.is_valid(), form.errors
+    assert form.cleaned_data["repo_url"][1:] == ("username", "repo")
+    assert form.cleaned_data["ref"] == ref
+    assert form.cleaned_data["subdirectory"] == subdirectory
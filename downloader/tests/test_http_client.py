@@ -0,0 +1,84 @@
+import asyncio
+import io
+import zipfile
+
+import pytest
+import pytest_asyncio
+from pytest_httpx import HTTPXMock
+
+from downloader import http_client
+from downloader.repo_utils import download_repo
+from gh_repo_download.asgi import application
+
+
+async def run_lifespan(*message_types):
+    received = asyncio.Queue()
+    for message_type in message_types:
+        received.put_nowait({"type": message_type})
+    sent = []
+
+    async def send(message):
+        sent.append(message["type"])
+
+    await application({"type": "lifespan"}, received.get, send)
+    return sent
+
+
+@pytest_asyncio.fixture
+async def shared_client():
+    await http_client.start_client()
+    yield http_client._client
+    await http_client.close_client()
+
+
+@pytest.mark.asyncio
+async def test_lifespan_starts_and_closes_client():
+    sent = await asyncio.wait_for(
+        run_lifespan("lifespan.startup", "lifespan.shutdown"), timeout=5
+    )
+
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert http_client._client is None
+
+
+@pytest.mark.asyncio
+async def test_client_settings(settings):
+    settings.HTTP_CLIENT_MAX_CONNECTIONS = 7
+    settings.HTTP_CLIENT_TIMEOUT = 12.0
+
+    async with http_client.create_client() as client:
+        assert client.timeout.read == 12.0
+        assert client.follow_redirects
+        pool = client._transport._pool
+        assert pool._max_connections == 7
+
+
+@pytest.mark.asyncio
+async def test_get_client_without_lifespan_is_short_lived():
+    async with http_client.get_client() as client:
+        assert client is not http_client._client
+    assert client.is_closed
+
+
+@pytest.mark.asyncio
+async def test_download_repo_reuses_shared_client(
+    shared_client, httpx_mock: HTTPXMock, monkeypatch
+):
+    def create_client():
+        raise AssertionError("the shared client should have been used")
+
+    monkeypatch.setattr(http_client, "create_client", create_client)
+    repo_url = "https://example.com/repo"
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, mode="w") as zip_file:
+        zip_file.writestr("file.txt", "Dummy file content")
+    httpx_mock.add_response(
+        url=f"{repo_url}/archive/master.zip",
+        content=zip_buffer.getvalue(),
+        is_reusable=True,
+    )
+
+    (await download_repo(repo_url)).close()
+    (await download_repo(repo_url)).close()
+
+    assert not shared_client.is_closed
@@ -0,0 +1,157 @@
+import pytest
+
+from downloader.path_filter import (
+    InvalidPatternError,
+    PathFilter,
+    get_path_filter,
+    translate_pattern,
+)
+
+
+def excluded(patterns: list[str], path: str) -> bool:
+    return not PathFilter(exclude=patterns).matches(f"repo-master/{path}")
+
+
+def included(patterns: list[str], path: str) -> bool:
+    return PathFilter(include=patterns).matches(f"repo-master/{path}")
+
+
+@pytest.mark.parametrize(
+    "patterns,path,expected",
+    [
+        # a pattern without a separator matches at any depth
+        (["*.log"], "debug.log", True),
+        (["*.log"], "a/b/debug.log", True),
+        (["*.log"], "debug.log.txt", False),
+        (["build"], "build/out.txt", True),
+        (["build"], "src/build/out.txt", True),
+        (["build"], "src/build", True),
+        # a leading or middle separator anchors it to the root
+        (["/build"], "build/out.txt", True),
+        (["/build"], "src/build/out.txt", False),
+        (["doc/frotz"], "doc/frotz/a.txt", True),
+        (["doc/frotz"], "a/doc/frotz/a.txt", False),
+        # a trailing separator only matches directories
+        (["build/"], "build", False),
+        (["build/"], "build/out.txt", True),
+        (["build/"], "src/build/out.txt", True),
+        # wildcards don't match the separator
+        (["a/*.txt"], "a/b.txt", True),
+        (["a/*.txt"], "a/b/c.txt", False),
+        (["a?c.txt"], "abc.txt", True),
+        (["a?c.txt"], "a/c.txt", False),
+        (["[ab].txt"], "b.txt", True),
+        (["[!ab].txt"], "b.txt", False),
+        (["[!ab].txt"], "c.txt", True),
+        # ** matches across segments
+        (["**/foo"], "foo", True),
+        (["**/foo"], "a/b/foo", True),
+        (["**/foo/bar"], "x/foo/bar", True),
+        (["abc/**"], "abc/x/y.txt", True),
+        (["abc/**"], "abc", False),
+        (["a/**/b"], "a/b", True),
+        (["a/**/b"], "a/x/y/b", True),
+        (["a/**/b"], "ab", False),
+        # the last matching pattern wins
+        (["*.txt", "!keep.txt"], "keep.txt", False),
+        (["*.txt", "!keep.txt"], "drop.txt", True),
+        (["!keep.txt", "*.txt"], "keep.txt", True),
+        # files in an excluded directory can't be included again
+        (["build/", "!build/keep.txt"], "build/keep.txt", True),
+        (["build/*", "!build/keep.txt"], "build/keep.txt", False),
+        (["build*", "!build-tools/"], "build-tools/x.txt", False),
+        # comments, blank lines and escapes
+        (["# comment", "", "   "], "# comment", False),
+        (["\\#notes.txt"], "#notes.txt", True),
+        (["\\!important.txt"], "!important.txt", True),
+        (["trailing.txt   "], "trailing.txt", True),
+        (["unclosed["], "unclosed[", False),
+    ],
+)
+def test_exclude(patterns, path, expected):
+    assert excluded(patterns, path) is expected
+
+
+@pytest.mark.parametrize(
+    "patterns,path,expected",
+    [
+        (["src/"], "src/main.py", True),
+        (["src/"], "src/deep/main.py", True),
+        (["src/"], "README.md", False),
+        (["*.py"], "src/main.py", True),
+        (["*.py"], "src/main.js", False),
+        # a negated include leaves out what it matches
+        (["src/", "!src/vendor/"], "src/vendor/lib.py", False),
+        (["src/", "!src/vendor/"], "src/main.py", True),
+        (["src/", "!*.md"], "src/README.md", False),
+        (["src/", "!src/vendor/", "src/vendor/keep.py"], "src/vendor/keep.py", True),
+    ],
+)
+def test_include(patterns, path, expected):
+    assert included(patterns, path) is expected
+
+
+def test_include_and_exclude():
+    path_filter = PathFilter(include=["src/"], exclude=["*_test.py"])
+
+    assert path_filter.matches("repo-master/src/main.py")
+    assert not path_filter.matches("repo-master/src/main_test.py")
+    assert not path_filter.matches("repo-master/README.md")
+
+
+def test_top_level_directory_is_always_kept():
+    path_filter = PathFilter(include=["src/"], exclude=["*"])
+
+    assert path_filter.matches("repo-master/")
+
+
+def test_directory_members():
+    path_filter = PathFilter(exclude=["build/"])
+
+    assert not path_filter.matches("repo-master/build/")
+    assert not path_filter.matches("repo-master/build/sub/")
+    assert path_filter.matches("repo-master/src/")
+
+
+def test_empty_filter():
+    assert not PathFilter()
+    assert not PathFilter(include=["# only a comment"])
+    assert PathFilter(exclude=["*.log"])
+    assert PathFilter().matches("repo-master/anything.txt")
+
+
+def test_translate_pattern():
+    assert translate_pattern("# comment") is None
+    assert translate_pattern("!/build/") == ("build", True, True)
+
+
+def test_invalid_pattern():
+    with pytest.raises(InvalidPatternError):
+        PathFilter(exclude=["[z-a].txt"])
+
+
+def test_get_path_filter_compiles_once():
+    first = get_path_filter(("src/",), ("*.log",))
+
+    assert get_path_filter(("src/",), ("*.log",)) is first
+    assert first == PathFilter(["src/"], ["*.log"])
+    assert hash(first) == hash(PathFilter(["src/"], ["*.log"]))
+
+
+@pytest.mark.parametrize(
+    "name,expected",
+    [
+        ("repo-master/", False),
+        ("repo-master/README.md", False),
+        ("repo-master/packages/", False),
+        ("repo-master/packages/foo/", True),
+        ("repo-master/packages/foo/index.js", True),
+        ("repo-master/packages/foo/lib/util.js", True),
+        ("repo-master/packages/foobar/index.js", False),
+        ("repo-master/packages/foo/index.test.js", False),
+    ],
+)
+def test_subdirectory(name, expected):
+    path_filter = PathFilter(exclude=["*.test.js"], subdirectory="/packages/foo/")
+
+    assert path_filter.matches(name) is expected
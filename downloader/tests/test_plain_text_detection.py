@@ -1,6 +1,14 @@
 import io
 
-from downloader.file_utils import is_plain_text_file
+import pytest
+
+from downloader.file_utils import (
+    ALLOW_BYTES,
+    BLOCK_BYTES,
+    get_chunk_classifier,
+    is_plain_text_file,
+    np,
+)
 
 
 def test_plain_text_file():
@@ -24,3 +32,45 @@ def test_large_text_file():
     large_text = b"A" * 10**6  # 1 MB of ASCII character 'A'
     file_obj = io.BytesIO(large_text)
     assert is_plain_text_file(file_obj)[0] == True
+
+
+BACKENDS = [
+    "table",
+    "python",
+    pytest.param(
+        "numpy",
+        marks=pytest.mark.skipif(np is None, reason="numpy is not installed"),
+    ),
+]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize(
+    "content,expected",
+    [
+        (b"Hello, world!\nThis is a plain text file.", True),
+        (b"caf\xc3\xa9\r\n\ttabbed", True),
+        (b"\x07\x08\x0b\x0c", False),  # gray list only
+        (b"text then a NUL\x00", False),
+        (b"A" * 8192 + b"\x01", False),  # blocked byte past the first chunk
+        (b"\x07bell\x0cform feed", True),  # gray bytes mixed with text
+    ],
+)
+def test_backends_agree(backend, content, expected):
+    assert is_plain_text_file(io.BytesIO(content), backend) == (
+        expected,
+        content[:4096],
+    )
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backends_match_reference_on_every_byte(backend):
+    classify_chunk = get_chunk_classifier(backend)
+    for byte in range(256):
+        chunk = bytes([byte])
+        assert classify_chunk(chunk) == (byte in ALLOW_BYTES, byte in BLOCK_BYTES)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        is_plain_text_file(io.BytesIO(b"text"), "nope")
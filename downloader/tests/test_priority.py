@@ -0,0 +1,88 @@
+import zipfile
+
+import pytest
+
+from downloader.priority import (
+    ARCHIVE_ORDER,
+    MemberPriority,
+    get_member_priority,
+    member_category,
+)
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("repo/README.md", "readme"),
+        ("repo/docs/readme.rst", "readme"),
+        ("repo/pyproject.toml", "manifest"),
+        ("repo/web/package.json", "manifest"),
+        ("repo/src/app.py", "source"),
+        ("repo/tests/test_app.py", "test"),
+        ("repo/src/app_test.go", "test"),
+        ("repo/src/app.spec.ts", "test"),
+        ("repo/tests/fixtures/app.py", "fixture"),
+        ("repo/docs/index.html", "docs"),
+        ("repo/CHANGELOG.md", "docs"),
+        ("repo/data/cities.csv", "other"),
+    ],
+)
+def test_member_category(name, expected):
+    assert member_category(name) == expected
+
+
+def members(*names_and_sizes) -> list[tuple[int, zipfile.ZipInfo]]:
+    result = []
+    for index, (name, size) in enumerate(names_and_sizes):
+        info = zipfile.ZipInfo(name)
+        info.file_size = size
+        result.append((index, info))
+    return result
+
+
+def test_rank():
+    ranked = MemberPriority({}).rank(
+        members(
+            ("repo/tests/test_b.py", 10),
+            ("repo/src/big.py", 500),
+            ("repo/src/small.py", 50),
+            ("repo/README.md", 1000),
+            ("repo/src/same.py", 50),
+        )
+    )
+
+    assert [member.filename for _, member in ranked] == [
+        "repo/README.md",
+        "repo/src/small.py",
+        "repo/src/same.py",
+        "repo/src/big.py",
+        "repo/tests/test_b.py",
+    ]
+
+
+def test_rank_with_weights():
+    ranked = MemberPriority({"test": 80}).rank(
+        members(("repo/src/a.py", 10), ("repo/tests/test_a.py", 10))
+    )
+
+    assert [index for index, _ in ranked] == [1, 0]
+
+
+def test_archive_order():
+    unranked = members(("repo/tests/test_a.py", 10), ("repo/README.md", 10))
+
+    assert not ARCHIVE_ORDER
+    assert ARCHIVE_ORDER.rank(unranked) == unranked
+
+
+def test_unknown_kind():
+    with pytest.raises(ValueError, match="binaries"):
+        MemberPriority({"binaries": 1})
+
+
+def test_get_member_priority(settings):
+    settings.EXTRACTION_PRIORITY_WEIGHTS = {"docs": 95}
+    assert get_member_priority().weights["docs"] == 95
+
+    settings.EXTRACTION_PRIORITY = False
+    assert get_member_priority() is ARCHIVE_ORDER
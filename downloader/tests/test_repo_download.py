@@ -1,5 +1,4 @@
 import os
-import urllib
 
 import pytest
 from django.urls import reverse
@@ -28,15 +27,9 @@ async def test_repository_downloader_integration(async_client, expected_content)
     # Check that the response contains the expected template
     assert "download.html" in [t.name for t in response.templates]
 
-    # Extract the data URI from the response content
-    data_uri = (
-        response.content.decode("utf-8")
-        .split("data:text/plain;charset=utf-8,")[1]
-        .split('"')[0]
-    )
-
-    # Decode the URL-encoded content
-    decoded_content = urllib.parse.unquote(data_uri)
+    # Fetch the concatenated file the results page links to
+    download = await async_client.get(response.context["download_url"])
+    decoded_content = b"".join(download.streaming_content).decode("utf-8")
 
     # Compare the decoded content with the expected content
     assert decoded_content == expected_content
@@ -0,0 +1,146 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from django.test import AsyncClient
+from django.urls import reverse
+from pytest_httpx import HTTPXMock
+
+from downloader.caching import LRUCache
+from downloader.file_utils import ExtractionResult
+from downloader.repo_utils import DownloadResult
+from downloader.result_cache import (
+    CachedResult,
+    ExtractionLimits,
+    cache_result,
+    get_cached_result,
+)
+from downloader.result_store import store_result
+
+SHA = "a" * 40
+OTHER_SHA = "b" * 40
+LIMITS = ExtractionLimits(1000, 1024)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+
+
+def test_lru_cache_sized_entries():
+    cache = LRUCache(max_size=10)
+    cache.set("a", "aaaaaa", size=6)
+    cache.set("b", "bbbbbb", size=6)
+
+    assert "a" not in cache
+    assert cache.size == 6
+
+    cache.set("huge", "x" * 11, size=11)
+    assert "huge" not in cache
+    assert "b" in cache
+
+
+def test_lru_cache_ttl():
+    cache = LRUCache(max_size=10, ttl=-1)
+    cache.set("a", 1)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def cached_result(text="content") -> CachedResult:
+    stored = store_result(text)
+    return CachedResult(stored.key, {"result_key": stored.key})
+
+
+@pytest.mark.asyncio
+async def test_fresh_ref_hits_without_network(settings):
+    settings.COMMIT_SHA_TTL = 60
+    result = cached_result()
+    cache_result("Owner", "Repo", "master", SHA, LIMITS, result)
+
+    # httpx_mock isn't used, so any network request would fail the test
+    assert await get_cached_result("owner", "repo", "master", LIMITS) == result
+    assert await get_cached_result("owner", "repo", "main", LIMITS) is None
+    assert (
+        await get_cached_result("owner", "repo", "master", ExtractionLimits(1, 1))
+        is None
+    )
+
+
+@pytest.mark.asyncio
+async def test_stale_ref_is_revalidated(settings, httpx_mock: HTTPXMock):
+    settings.COMMIT_SHA_TTL = -1
+    result = cached_result()
+    cache_result("owner", "repo", "master", SHA, LIMITS, result)
+
+    httpx_mock.add_response(
+        url=f"{settings.GITHUB_API_URL}/repos/owner/repo/commits/master", text=SHA
+    )
+    assert await get_cached_result("owner", "repo", "master", LIMITS) == result
+
+    httpx_mock.add_response(
+        url=f"{settings.GITHUB_API_URL}/repos/owner/repo/commits/master",
+        text=OTHER_SHA,
+    )
+    assert await get_cached_result("owner", "repo", "master", LIMITS) is None
+
+
+@pytest.mark.asyncio
+async def test_stale_ref_that_cannot_be_resolved_is_a_miss(
+    settings, httpx_mock: HTTPXMock
+):
+    settings.COMMIT_SHA_TTL = -1
+    cache_result("owner", "repo", "master", SHA, LIMITS, cached_result())
+
+    httpx_mock.add_response(
+        url=f"{settings.GITHUB_API_URL}/repos/owner/repo/commits/master",
+        status_code=403,
+    )
+    assert await get_cached_result("owner", "repo", "master", LIMITS) is None
+
+
+@pytest.mark.asyncio
+async def test_expired_result_file_is_a_miss(settings):
+    cache_result("owner", "repo", "master", SHA, LIMITS, cached_result())
+
+    settings.RESULT_STORE_TTL = -1
+    assert await get_cached_result("owner", "repo", "master", LIMITS) is None
+
+
+@pytest.mark.asyncio
+async def test_unknown_commit_is_not_cached():
+    cache_result("owner", "repo", "master", None, LIMITS, cached_result())
+
+    assert await get_cached_result("owner", "repo", "master", LIMITS) is None
+
+
+@pytest.mark.asyncio
+@patch("downloader.views.download_repo", new_callable=AsyncMock)
+@patch("downloader.views.extract_text_files", new_callable=AsyncMock)
+async def test_download_result_view_uses_cache(
+    mock_extract_text_files, mock_download_repo
+):
+    mock_download_repo.return_value = DownloadResult(None, 1000, 5000, SHA)
+    mock_extract_text_files.return_value = ExtractionResult(
+        {"file1.txt": "File 1 content"}, False, False, 1
+    )
+    async_client = AsyncClient()
+    url = reverse(
+        "download_result", kwargs={"username": "username", "repo_name": "repo"}
+    )
+
+    first = await async_client.get(url)
+    second = await async_client.get(url)
+
+    assert first.status_code == second.status_code == 200
+    assert second.context["download_url"] == first.context["download_url"]
+    assert second.context["zip_file_size"] == 1000
+    mock_download_repo.assert_called_once()
+    mock_extract_text_files.assert_called_once()
@@ -0,0 +1,150 @@
+import multiprocessing
+
+import pytest
+
+from downloader.shared_cache import SharedCache
+
+
+def put_bytes(cache: SharedCache, name: str, data: bytes, suffix: str = ".bin"):
+    file, tmp_path = cache.temporary_file()
+    with file:
+        file.write(data)
+    return cache.put(name, {suffix: tmp_path}, {"length": len(data)})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SharedCache(tmp_path / "cache", max_size=10, touch_interval=0)
+
+
+def test_put_and_get(cache):
+    put_bytes(cache, "a", b"aaa")
+
+    entry = cache.get("a")
+    assert entry.size == 3
+    assert entry.metadata == {"length": 3}
+    assert cache.path("a", ".bin").read_bytes() == b"aaa"
+    assert cache.get("b") is None
+    # no temporary files are left behind
+    assert not [p for p in cache.directory.iterdir() if p.name.startswith(".tmp-")]
+
+
+def test_entries_are_shared_between_instances(cache):
+    put_bytes(cache, "a", b"aaa")
+
+    other = SharedCache(cache.directory)
+    assert other.get("a").metadata == {"length": 3}
+    with other.open("a", ".bin") as file:
+        assert file.read() == b"aaa"
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    put_bytes(cache, "a", b"aaaa")
+    put_bytes(cache, "b", b"bbbb")
+    cache.get("a")
+    put_bytes(cache, "c", b"cccc")
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert not cache.path("b", ".bin").exists()
+    assert cache.get("c") is not None
+
+
+def test_entry_bigger_than_the_cache_is_refused(cache):
+    put_bytes(cache, "a", b"aaaa")
+
+    assert put_bytes(cache, "huge", b"x" * 11) is None
+    assert cache.get("a") is not None
+    assert cache.get("huge") is None
+    assert not cache.path("huge", ".bin").exists()
+    assert not [p for p in cache.directory.iterdir() if p.name.startswith(".tmp-")]
+
+
+def test_recently_used_entries_are_not_marked_again(tmp_path):
+    cache = SharedCache(tmp_path, touch_interval=60)
+    put_bytes(cache, "a", b"aaa")
+    index = tmp_path / "index.json"
+    inode = index.stat().st_ino
+
+    cache.get("a")
+    cache.open("a", ".bin").close()
+    assert index.stat().st_ino == inode
+
+    cache.touch_interval = 0
+    cache.get("a")
+    assert index.stat().st_ino != inode
+
+
+def test_max_entries(tmp_path):
+    cache = SharedCache(tmp_path, max_entries=2)
+    for name in "abc":
+        cache.put(name, metadata={"name": name})
+
+    assert cache.get("a") is None
+    assert len(cache) == 2
+
+
+def test_ttl(tmp_path):
+    cache = SharedCache(tmp_path, ttl=-1)
+    put_bytes(cache, "a", b"aaa")
+
+    assert cache.get("a") is None
+    assert not cache.touch("a")
+    assert cache.open("a", ".bin") is None
+
+
+def test_replacing_an_entry_deletes_its_old_files(cache):
+    put_bytes(cache, "a", b"aaa", ".old")
+    put_bytes(cache, "a", b"aa", ".new")
+
+    assert cache.get("a").suffixes == [".new"]
+    assert not cache.path("a", ".old").exists()
+
+
+def test_opened_file_stays_readable_after_eviction(cache):
+    put_bytes(cache, "a", b"aaaa")
+    mapped = cache.mmap("a", ".bin")
+    file = cache.open("a", ".bin")
+
+    cache.delete("a")
+
+    assert cache.open("a", ".bin") is None
+    assert mapped[1:3] == b"aa"
+    assert file.read() == b"aaaa"
+    mapped.close()
+    file.close()
+
+
+def test_clear(cache):
+    put_bytes(cache, "a", b"aaa")
+
+    cache.clear()
+
+    assert len(cache) == 0
+    assert not cache.path("a", ".bin").exists()
+
+
+def fill(directory: str, worker: int):
+    cache = SharedCache(directory, max_size=100)
+    for i in range(20):
+        put_bytes(cache, f"{worker}-{i}", bytes([worker]) * 10)
+        cache.get(f"{worker}-{i // 2}")
+
+
+def test_concurrent_workers(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=fill, args=(tmp_path, i)) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert all(worker.exitcode == 0 for worker in workers)
+    cache = SharedCache(tmp_path, max_size=100)
+    # every put was recorded, and the index agrees with the files on disk
+    assert len(cache) == 10
+    names = [path.name for path in tmp_path.iterdir() if path.suffix == ".bin"]
+    assert len(names) == 10
+    for name in names:
+        worker = int(name.split("-")[0])
+        assert cache.path(name).read_bytes() == bytes([worker]) * 10
@@ -0,0 +1,152 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from django.test import AsyncClient
+from django.urls import reverse
+
+from downloader.file_utils import ExtractionResult
+from downloader.repo_utils import DownloadResult, RepositoryDownloadError
+from downloader.single_flight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_run():
+    single_flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "result"
+
+    waiters = [asyncio.create_task(single_flight.do("key", work)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiters) == ["result"] * 5
+    assert calls == 1
+    assert "key" not in single_flight
+
+
+@pytest.mark.asyncio
+async def test_different_keys_run_separately():
+    single_flight = SingleFlight()
+
+    async def work(value):
+        await asyncio.sleep(0)
+        return value
+
+    results = await asyncio.gather(
+        single_flight.do("a", lambda: work("a")),
+        single_flight.do("b", lambda: work("b")),
+    )
+    assert results == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter():
+    single_flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        raise RepositoryDownloadError("nope")
+
+    waiters = [asyncio.create_task(single_flight.do("key", work)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    assert all(isinstance(r, RepositoryDownloadError) for r in results)
+
+    # a failed run isn't remembered
+    async def succeed():
+        return "ok"
+
+    assert await single_flight.do("key", succeed) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_one_waiter_leaving_does_not_cancel_the_others():
+    single_flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        return "result"
+
+    leaving = asyncio.create_task(single_flight.do("key", work))
+    staying = asyncio.create_task(single_flight.do("key", work))
+    await asyncio.sleep(0)
+    leaving.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await staying == "result"
+    assert leaving.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_work_is_cancelled_when_every_waiter_leaves():
+    single_flight = SingleFlight()
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def work():
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    waiters = [asyncio.create_task(single_flight.do("key", work)) for _ in range(2)]
+    await started.wait()
+    for waiter in waiters:
+        waiter.cancel()
+
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    await asyncio.sleep(0)
+    assert "key" not in single_flight
+
+    # a new caller starts a fresh run instead of joining the cancelled one
+    async def succeed():
+        return "ok"
+
+    assert await single_flight.do("key", succeed) == "ok"
+
+
+@pytest.mark.asyncio
+@patch("downloader.views.download_repo", new_callable=AsyncMock)
+@patch("downloader.views.extract_text_files", new_callable=AsyncMock)
+async def test_concurrent_view_requests_download_once(
+    mock_extract_text_files, mock_download_repo
+):
+    release = asyncio.Event()
+
+    async def download(
+        repo_url, text_extractor=None, archive_format=None, ref="master"
+    ):
+        await release.wait()
+        return DownloadResult(None, 1000, 5000)
+
+    mock_download_repo.side_effect = download
+    mock_extract_text_files.return_value = ExtractionResult(
+        {"file1.txt": "File 1 content"}, False, False, 1
+    )
+    url = reverse(
+        "download_result", kwargs={"username": "username", "repo_name": "repo"}
+    )
+
+    requests = [asyncio.create_task(AsyncClient().get(url)) for _ in range(3)]
+    await asyncio.sleep(0.1)
+    release.set()
+    responses = await asyncio.gather(*requests)
+
+    assert [r.status_code for r in responses] == [200] * 3
+    assert len({r.context["download_url"] for r in responses}) == 1
+    mock_download_repo.assert_called_once()
+    mock_extract_text_files.assert_called_once()
@@ -0,0 +1,84 @@
+import zipfile
+
+import pytest
+
+from downloader.skip_rules import (
+    NO_SKIP_RULES,
+    SKIP_RULES,
+    SkipRules,
+    get_skip_rules,
+    looks_minified,
+)
+
+
+def member(name: str, size: int = 10) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name)
+    info.file_size = size
+    return info
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("repo/node_modules/left-pad/index.js", "vendor"),
+        ("repo/web/vendor/jquery.js", "vendor"),
+        ("repo/package-lock.json", "lockfile"),
+        ("repo/rust/Cargo.lock", "lockfile"),
+        ("repo/static/app.min.js", "generated"),
+        ("repo/static/app.js.map", "generated"),
+        ("repo/proto/service_pb2.py", "generated"),
+        ("repo/src/main.py", None),
+        ("repo/docs/vendoring.md", None),
+        ("repo/package.json", None),
+    ],
+)
+def test_match_name(name, expected):
+    assert SkipRules(SKIP_RULES).match_name(member(name)) == expected
+
+
+def test_only_the_chosen_rules_apply():
+    rules = SkipRules(["lockfile"])
+
+    assert rules.match_name(member("repo/yarn.lock")) == "lockfile"
+    assert rules.match_name(member("repo/node_modules/a.js")) is None
+
+
+def test_is_large():
+    rules = SkipRules(["large"], large_file_size=100)
+
+    assert rules.is_large(member("repo/big.txt", 101))
+    assert not rules.is_large(member("repo/small.txt", 100))
+    assert not SkipRules(large_file_size=100).is_large(member("repo/big.txt", 101))
+
+
+def test_unknown_rule():
+    with pytest.raises(ValueError, match="docs"):
+        SkipRules(["vendor", "docs"])
+
+
+def test_no_skip_rules():
+    assert not NO_SKIP_RULES
+    assert NO_SKIP_RULES.match_name(member("repo/node_modules/a.js")) is None
+    assert not NO_SKIP_RULES.detect_minified
+
+
+def test_get_skip_rules_defaults_to_settings(settings):
+    settings.SKIP_RULES = ["vendor"]
+    settings.SKIP_LARGE_FILE_SIZE = 5
+
+    assert get_skip_rules() == SkipRules(["vendor"], 5)
+    assert get_skip_rules(["large"]).large_file_size == 5
+
+
+@pytest.mark.parametrize(
+    "filename, head, expected",
+    [
+        ("app.js", b"x" * 4096, True),
+        ("app.js", b"var a = 1;\n" * 400, False),
+        ("notes.txt", b"x" * 4096, False),
+        # too short to tell
+        ("app.js", b"x" * 100, False),
+    ],
+)
+def test_looks_minified(filename, head, expected):
+    assert looks_minified(filename, head[:4096], 4096) == expected
@@ -0,0 +1,663 @@
+import io
+import random
+import tarfile
+import threading
+import time
+import zipfile
+
+import pytest
+
+from downloader import file_utils
+from downloader.file_utils import (
+    EXTRACTION_MODES,
+    RENDER_CHUNK_SIZE,
+    ExtractionResult,
+    MemberTextDecoder,
+    extract_text_files,
+    plan_extraction,
+)
+from downloader.path_filter import PathFilter
+from downloader.priority import ARCHIVE_ORDER
+from downloader.skip_rules import NO_SKIP_RULES, SKIP_RULES, SkipRules
+
+
+@pytest.fixture(params=EXTRACTION_MODES, autouse=True)
+def mode(request, settings):
+    settings.EXTRACTION_MODE = request.param
+    settings.EXTRACTION_WORKERS = 3
+    return request.param
+
+
+@pytest.mark.asyncio
+async def test_extracts_text_and_skips_binary(make_zip):
+    zip_file = make_zip(
+        {
+            "repo/": b"",
+            "repo/README.md": b"# Hello\n",
+            "repo/image.png": b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR",
+            "repo/empty.txt": b"",
+            "repo/latin.py": "# coding: latin-1\nname = 'caf\xe9'\n".encode("latin-1"),
+        }
+    )
+
+    result = await extract_text_files(zip_file)
+
+    assert result.text_files == {
+        "repo/README.md": "# Hello\n",
+        "repo/latin.py": "# coding: latin-1\nname = 'caf\xe9'\n",
+    }
+    assert result.total_files_count == 5
+    assert not result.file_limit_reached
+    assert not result.size_limit_reached
+
+
+@pytest.mark.asyncio
+async def test_invalid_utf8_is_replaced(make_zip):
+    zip_file = make_zip({"bad.txt": b"ok \xff\xfe ok"})
+
+    result = await extract_text_files(zip_file)
+
+    assert result.text_files == {"bad.txt": "ok �� ok"}
+
+
+@pytest.mark.asyncio
+async def test_multibyte_characters_across_chunks(make_zip):
+    content = ("é" * 100_000).encode("utf-8")  # crosses several read chunks
+    zip_file = make_zip({"accents.txt": content})
+
+    result = await extract_text_files(zip_file)
+
+    assert result.text_files["accents.txt"] == content.decode("utf-8")
+
+
+@pytest.mark.asyncio
+async def test_file_limit(make_zip):
+    zip_file = make_zip({f"{i}.txt": b"text" for i in range(5)})
+
+    result = await extract_text_files(zip_file, max_files=3)
+
+    assert list(result.text_files) == ["0.txt", "1.txt", "2.txt"]
+    assert result.file_limit_reached
+
+
+@pytest.mark.asyncio
+async def test_size_limit(make_zip):
+    zip_file = make_zip({"a.txt": b"a" * 60, "b.txt": b"b" * 60, "c.txt": b"c"})
+
+    result = await extract_text_files(zip_file, max_total_size=100)
+
+    # b.txt doesn't fit what's left of the budget, c.txt still does
+    assert list(result.text_files) == ["a.txt", "c.txt"]
+    assert result.size_limit_reached
+
+
+@pytest.mark.asyncio
+async def test_members_bigger_than_budget_are_only_read_until_text_does_not_fit(
+    monkeypatch,
+    make_zip,
+):
+    zip_file = make_zip(
+        {"big.txt": b"a" * 200, "bigger.txt": b"b" * 300, "small.txt": b"text"}
+    )
+    opened = []
+    open_member = zip_file.open
+    monkeypatch.setattr(
+        zip_file,
+        "open",
+        lambda member, *args: opened.append(member) or open_member(member, *args),
+    )
+
+    result = await extract_text_files(
+        zip_file, max_total_size=100, mode="sequential", priority=ARCHIVE_ORDER
+    )
+
+    assert list(result.text_files) == ["small.txt"]
+    assert result.size_limit_reached
+    # big.txt is read to tell it's text, after that bigger.txt can't be taken
+    assert [member.filename for member in opened] == ["big.txt", "small.txt"]
+
+
+@pytest.mark.asyncio
+async def test_unknown_binary_file_larger_than_budget_does_not_hit_size_limit(make_zip):
+    zip_file = make_zip({"big.dat": b"\x00" * 200, "small.txt": b"text"})
+
+    result = await extract_text_files(zip_file, max_total_size=100)
+
+    assert list(result.text_files) == ["small.txt"]
+    assert not result.size_limit_reached
+
+
+@pytest.mark.asyncio
+async def test_size_budget_counts_bytes_as_an_upper_bound(make_zip):
+    # 60 characters, 120 bytes
+    zip_file = make_zip({"accents.txt": "é".encode() * 60, "small.txt": b"text"})
+
+    result = await extract_text_files(zip_file, max_total_size=100)
+
+    assert list(result.text_files) == ["small.txt"]
+    assert result.size_limit_reached
+
+
+@pytest.mark.asyncio
+async def test_binary_file_larger_than_budget_does_not_hit_size_limit(make_zip):
+    zip_file = make_zip({"big.bin": b"a" * 200 + b"\x00", "small.txt": b"text"})
+
+    result = await extract_text_files(zip_file, max_total_size=100)
+
+    assert list(result.text_files) == ["small.txt"]
+    assert not result.size_limit_reached
+
+
+@pytest.mark.asyncio
+async def test_exclude_files(make_zip):
+    zip_file = make_zip({"keep.txt": b"keep", "drop.txt": b"drop"})
+
+    result = await extract_text_files(zip_file, exclude_files=["drop.txt"])
+
+    assert list(result.text_files) == ["keep.txt"]
+    assert result.total_files_count == 1
+
+
+def test_plan_extraction(make_zip):
+    members = make_zip(
+        {
+            "repo/": b"",
+            "repo/a.py": b"a",
+            "repo/logo.PNG": b"png",
+            "repo/skip.txt": b"skip",
+            "repo/big.txt": b"b" * 200,
+            "repo/b.txt": b"b",
+        }
+    ).infolist()
+
+    plan = plan_extraction(members, ["repo/skip.txt"])
+
+    # big.txt doesn't fit the budget, but only reading it tells if it's text
+    assert [(index, member.filename) for index, member in plan.members] == [
+        (1, "repo/a.py"),
+        (4, "repo/big.txt"),
+        (5, "repo/b.txt"),
+    ]
+    assert plan.total_files == 5
+
+
+def test_decoder_stops_at_first_blocked_byte():
+    decoder = MemberTextDecoder()
+
+    assert decoder.feed(b"text " * 1000)
+    assert not decoder.feed(b"more\x00")
+    assert not decoder.feed(b"never looked at")
+    assert decoder.is_binary
+    assert decoder.finish() is None
+
+
+def test_decoder_max_size():
+    decoder = MemberTextDecoder(max_size=10)
+    decoder.feed(b"x" * 11)
+
+    assert decoder.finish() is None
+    assert decoder.size_exceeded
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "max_files,max_total_size", [(1000, 10**6), (7, 10**6), (1000, 2000), (5, 900)]
+)
+async def test_modes_agree(max_files, max_total_size, mode, make_zip):
+    rng = random.Random(1234)
+    files = {}
+    for i in range(40):
+        if rng.random() < 0.25:
+            files[f"repo/bin{i}.dat"] = bytes(rng.randrange(256) for _ in range(300))
+        else:
+            files[f"repo/text{i}.txt"] = b"line\n" * rng.randrange(1, 100)
+    zip_file = make_zip(files)
+
+    expected = await extract_text_files(
+        zip_file, max_files, max_total_size, ["repo/text3.txt"], mode="sequential"
+    )
+    result = await extract_text_files(
+        zip_file, max_files, max_total_size, ["repo/text3.txt"], mode=mode
+    )
+
+    assert result == expected
+    assert list(result.text_files) == list(expected.text_files)
+
+
+@pytest.mark.asyncio
+async def test_modes_agree_on_archive_opened_from_path(tmp_path, mode, make_zip_bytes):
+    path = tmp_path / "repo.zip"
+    files = {f"repo/{i}.txt": f"file {i}\n" * 100 for i in range(20)}
+    files["repo/image.bin"] = b"\x00" * 100
+    path.write_bytes(make_zip_bytes(files))
+
+    with zipfile.ZipFile(path) as zip_file:
+        expected = await extract_text_files(zip_file, 15, mode="sequential")
+        result = await extract_text_files(zip_file, 15, mode=mode)
+
+    assert result == expected
+    assert result.file_limit_reached
+
+
+@pytest.mark.asyncio
+async def test_members_far_past_the_file_limit_are_not_read(
+    monkeypatch, mode, make_zip
+):
+    if mode == "processes":
+        pytest.skip("members are read in other processes")
+    decoded = []
+    read_text_member = file_utils.read_text_member
+    monkeypatch.setattr(
+        file_utils,
+        "read_text_member",
+        lambda zip_file, member, *args: decoded.append(member.filename)
+        or read_text_member(zip_file, member, *args),
+    )
+    zip_file = make_zip({f"repo/{i}.txt": f"file {i}\n".encode() for i in range(200)})
+
+    result = await extract_text_files(zip_file, 10)
+
+    assert list(result.text_files) == [f"repo/{i}.txt" for i in range(10)]
+    # the parallel modes read a few batches ahead at most
+    assert len(decoded) <= 20
+
+
+@pytest.mark.asyncio
+async def test_archive_without_a_file_is_extracted_in_threads(mode, make_zip_bytes):
+    data = make_zip_bytes({f"repo/{i}.txt": f"file {i}\n" for i in range(5)})
+
+    result = await extract_text_files(zipfile.ZipFile(io.BytesIO(data)), 4, mode=mode)
+
+    assert list(result.text_files) == [f"repo/{i}.txt" for i in range(4)]
+    assert result.file_limit_reached
+
+
+@pytest.mark.parametrize(
+    "pool,executor,get_pool",
+    [
+        ("_process_pool", "ProcessPoolExecutor", "_get_process_pool"),
+        ("_thread_pool", "ThreadPoolExecutor", "_get_thread_pool"),
+    ],
+)
+def test_pool_is_created_once(monkeypatch, pool, executor, get_pool):
+    monkeypatch.setattr(file_utils, pool, None)
+    created = []
+
+    def create_pool(**kwargs):
+        time.sleep(0.01)
+        created.append(kwargs)
+        return object()
+
+    monkeypatch.setattr(file_utils.concurrent.futures, executor, create_pool)
+    threads = [threading.Thread(target=getattr(file_utils, get_pool)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+
+
+@pytest.mark.asyncio
+async def test_unknown_mode(make_zip):
+    with pytest.raises(ValueError):
+        await extract_text_files(make_zip({"a.txt": b"a"}), mode="nope")
+
+
+@pytest.mark.parametrize(
+    "text_files,duplicate_files",
+    [
+        ({}, {}),
+        ({"repo/<b>.txt": "x & <y>", "repo/c.txt": "z\n"}, {}),
+        ({"repo/big.txt": "0123456789" * 20000, "repo/small.txt": "s"}, {}),
+        (
+            {"repo/a.txt": "a\n", "repo/<b>.txt": "a\n", "repo/c.txt": "c"},
+            {"repo/<b>.txt": "repo/a.txt"},
+        ),
+    ],
+)
+def test_render_chunks_matches_template(text_files, duplicate_files):
+    result = ExtractionResult(
+        text_files, False, False, len(text_files), duplicate_files=duplicate_files
+    )
+
+    chunks = list(result.render_chunks("re<po>"))
+
+    assert "".join(chunks) == result.render_template("re<po>", "repo_template.txt")
+    assert all(len(chunk) < 2 * RENDER_CHUNK_SIZE for chunk in chunks)
+
+
+@pytest.mark.asyncio
+async def test_path_filter(make_zip):
+    zip_file = make_zip(
+        {
+            "repo/": b"",
+            "repo/README.md": b"readme",
+            "repo/src/": b"",
+            "repo/src/main.py": b"main",
+            "repo/src/main_test.py": b"test",
+            "repo/src/vendor/lib.py": b"lib",
+        }
+    )
+    path_filter = PathFilter(include=["src/", "!vendor/"], exclude=["*_test.py"])
+
+    result = await extract_text_files(zip_file, path_filter=path_filter)
+
+    assert list(result.text_files) == ["repo/src/main.py"]
+    # the top-level directory, src/ and main.py
+    assert result.total_files_count == 3
+
+
+@pytest.mark.asyncio
+async def test_subdirectory_members_are_the_only_ones_decompressed(
+    monkeypatch, make_zip
+):
+    zip_file = make_zip(
+        {
+            "repo/": b"",
+            "repo/a.txt": b"a" * 50,
+            "repo/packages/": b"",
+            "repo/packages/foo/": b"",
+            "repo/packages/foo/b.txt": b"b" * 50,
+            "repo/packages/bar/c.txt": b"c" * 50,
+            "repo/packages/foo/d.txt": b"d" * 50,
+        }
+    )
+    opened = []
+    open_member = zip_file.open
+    monkeypatch.setattr(
+        zip_file,
+        "open",
+        lambda member, *args: opened.append(member.filename)
+        or open_member(member, *args),
+    )
+    path_filter = PathFilter(subdirectory="packages/foo")
+
+    # the budget only fits the subdirectory's files
+    result = await extract_text_files(
+        zip_file, max_files=2, max_total_size=100, path_filter=path_filter
+    )
+
+    assert list(result.text_files) == [
+        "repo/packages/foo/b.txt",
+        "repo/packages/foo/d.txt",
+    ]
+    assert result.total_files_count == 3
+    assert not result.file_limit_reached
+    assert not result.size_limit_reached
+    if opened:
+        # the parallel modes may open members by name from a fresh handle
+        assert set(opened) <= set(result.text_files)
+
+
+SKIPPABLE_FILES = {
+    "repo/": b"",
+    "repo/README.md": b"readme",
+    "repo/node_modules/lib/index.js": b"module.exports = 1;",
+    "repo/package-lock.json": b"{}",
+    "repo/yarn.lock": b"# yarn",
+    "repo/static/app.min.js": b"var a=1;",
+    "repo/static/app.js": b"var a = 1;" * 900,
+    "repo/static/bundle.js": b"var a=1;\n" + b"a" * 5000,
+    "repo/big.txt": b"big\n" * 3000,
+    "repo/src/main.py": b"main",
+}
+
+
+@pytest.mark.asyncio
+async def test_skip_rules(monkeypatch, make_zip):
+    zip_file = make_zip(SKIPPABLE_FILES)
+    opened = []
+    open_member = zip_file.open
+    monkeypatch.setattr(
+        zip_file,
+        "open",
+        lambda member, *args: opened.append(member.filename)
+        or open_member(member, *args),
+    )
+
+    result = await extract_text_files(
+        zip_file,
+        skip_rules=SkipRules(SKIP_RULES, large_file_size=10_000),
+        mode="sequential",
+    )
+
+    assert list(result.text_files) == ["repo/README.md", "repo/src/main.py"]
+    assert result.skipped_files == {
+        "vendor": 1,
+        "lockfile": 2,
+        "generated": 1,
+        "large": 1,
+        "minified": 2,
+    }
+    # skipped members still count as files of the repository
+    assert result.total_files_count == len(SKIPPABLE_FILES)
+    # only the minified ones are looked at, to tell them from the others
+    assert sorted(opened) == [
+        "repo/README.md",
+        "repo/src/main.py",
+        "repo/static/app.js",
+        "repo/static/bundle.js",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_skip_rules_default_to_settings(settings, make_zip):
+    settings.SKIP_RULES = ["lockfile"]
+    zip_file = make_zip(SKIPPABLE_FILES)
+
+    result = await extract_text_files(zip_file)
+
+    assert "repo/package-lock.json" not in result.text_files
+    assert "repo/node_modules/lib/index.js" in result.text_files
+    assert result.skipped_files == {"lockfile": 2}
+
+
+@pytest.mark.asyncio
+async def test_no_skip_rules(make_zip):
+    zip_file = make_zip(SKIPPABLE_FILES)
+
+    result = await extract_text_files(zip_file, skip_rules=NO_SKIP_RULES)
+
+    assert len(result.text_files) == len(SKIPPABLE_FILES) - 1
+    assert result.skipped_files == {}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_files,max_total_size", [(1000, 10**6), (3, 10**6)])
+async def test_modes_agree_on_skipped_files(max_files, max_total_size, mode, make_zip):
+    zip_file = make_zip(SKIPPABLE_FILES)
+    skip_rules = SkipRules(SKIP_RULES, large_file_size=10_000)
+
+    expected = await extract_text_files(
+        zip_file, max_files, max_total_size, skip_rules=skip_rules, mode="sequential"
+    )
+    result = await extract_text_files(
+        zip_file, max_files, max_total_size, skip_rules=skip_rules, mode=mode
+    )
+
+    assert result == expected
+
+
+RANKED_FILES = {
+    "repo/": b"",
+    "repo/docs/guide.md": b"guide\n" * 40,
+    "repo/tests/test_app.py": b"test\n" * 40,
+    "repo/src/app.py": b"app\n" * 40,
+    "repo/src/logo.dat": b"\x00" * 100,
+    "repo/src/util.py": b"util\n" * 20,
+    "repo/README.md": b"readme\n" * 30,
+}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "max_files,max_total_size,expected",
+    [
+        (1000, 10**6, list(RANKED_FILES)[1:4] + list(RANKED_FILES)[5:]),
+        (3, 10**6, ["repo/src/app.py", "repo/src/util.py", "repo/README.md"]),
+        (1000, 500, ["repo/src/app.py", "repo/src/util.py", "repo/README.md"]),
+    ],
+)
+async def test_limits_are_spent_on_the_most_useful_files(
+    max_files, max_total_size, expected, make_zip
+):
+    zip_file = make_zip(RANKED_FILES)
+
+    result = await extract_text_files(zip_file, max_files, max_total_size)
+
+    # taken in their ranking, returned in archive order
+    assert list(result.text_files) == expected
+
+
+@pytest.mark.asyncio
+async def test_files_past_the_size_limit_are_never_decompressed(monkeypatch, make_zip):
+    zip_file = make_zip(RANKED_FILES)
+    opened = []
+    open_member = zip_file.open
+    monkeypatch.setattr(
+        zip_file,
+        "open",
+        lambda member, *args: opened.append(member.filename)
+        or open_member(member, *args),
+    )
+
+    await extract_text_files(zip_file, max_total_size=500, mode="sequential")
+
+    # guide.md is read to tell it's text that doesn't fit, test_app.py isn't read
+    assert opened == [
+        "repo/README.md",
+        "repo/src/util.py",
+        "repo/src/app.py",
+        "repo/docs/guide.md",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_archive_order(make_zip):
+    zip_file = make_zip(RANKED_FILES)
+
+    result = await extract_text_files(zip_file, 3, priority=ARCHIVE_ORDER)
+
+    assert list(result.text_files) == list(RANKED_FILES)[1:4]
+
+
+DUPLICATE_FILES = {
+    "repo/tests/conftest.py": b"import pytest\n" * 20,
+    "repo/LICENSE": b"license\n" * 50,
+    "repo/src/conftest.py": b"import pytest\n" * 20,
+    "repo/docs/LICENSE": b"license\n" * 50,
+    "repo/other/LICENSE": b"license\n" * 50,
+    "repo/empty.txt": b"",
+    "repo/empty2.txt": b"",
+}
+
+
+@pytest.mark.asyncio
+async def test_duplicates_are_rendered_once(make_zip):
+    zip_file = make_zip(DUPLICATE_FILES)
+
+    result = await extract_text_files(zip_file)
+
+    # the first copy in archive order is the original, whichever was taken first
+    assert result.duplicate_files == {
+        "repo/src/conftest.py": "repo/tests/conftest.py",
+        "repo/docs/LICENSE": "repo/LICENSE",
+        "repo/other/LICENSE": "repo/LICENSE",
+    }
+    assert list(result.text_files) == list(DUPLICATE_FILES)[:5]
+    assert result.text_files["repo/docs/LICENSE"] == "license\n" * 50
+    output = result.render_template("repo", "repo_template.txt")
+    assert output.count("license\n" * 50) == 1
+    assert "## repo/docs/LICENSE\n\n>>> SAME CONTENTS AS repo/LICENSE\n" in output
+
+
+@pytest.mark.asyncio
+async def test_duplicates_dont_spend_the_size_budget(make_zip):
+    zip_file = make_zip(DUPLICATE_FILES)
+
+    result = await extract_text_files(zip_file, max_total_size=1000)
+
+    assert list(result.text_files) == list(DUPLICATE_FILES)[:5]
+    assert not result.size_limit_reached
+
+
+@pytest.mark.asyncio
+async def test_duplicates_count_towards_the_file_limit(make_zip):
+    zip_file = make_zip(DUPLICATE_FILES)
+
+    result = await extract_text_files(zip_file, max_files=3, priority=ARCHIVE_ORDER)
+
+    assert list(result.text_files) == list(DUPLICATE_FILES)[:3]
+    assert result.file_limit_reached
+
+
+@pytest.mark.asyncio
+async def test_duplicates_are_never_decoded(monkeypatch, make_zip):
+    zip_file = make_zip(DUPLICATE_FILES)
+    decoded = []
+    read_text_member = file_utils.read_text_member
+    monkeypatch.setattr(
+        file_utils,
+        "read_text_member",
+        lambda zip_file, member, *args: decoded.append(member.filename)
+        or read_text_member(zip_file, member, *args),
+    )
+
+    await extract_text_files(zip_file, mode="sequential", priority=ARCHIVE_ORDER)
+
+    assert sorted(decoded) == [
+        "repo/LICENSE",
+        "repo/empty.txt",
+        "repo/empty2.txt",
+        "repo/tests/conftest.py",
+    ]
+
+
+def make_tar(files: dict[str, bytes]) -> tarfile.TarFile:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    buffer.seek(0)
+    return tarfile.open(fileobj=buffer)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("priority", [ARCHIVE_ORDER, None])
+@pytest.mark.parametrize("archive_format", ["zip", "tar.gz"])
+async def test_duplicates_past_the_size_limit(archive_format, priority, make_zip):
+    # tarballs don't record CRCs, so their duplicates are found by size and digest
+    make_archive = make_zip if archive_format == "zip" else make_tar
+    archive = make_archive(
+        {
+            "repo/a.txt": b"same content!!\n",
+            "repo/big.txt": b"x" * 49 + b"\n",
+            "repo/b.txt": b"same content!!\n",
+            "repo/c.txt": b"other content!\n",
+        }
+    )
+
+    result = await extract_text_files(archive, max_total_size=20, priority=priority)
+
+    assert result == ExtractionResult(
+        {"repo/a.txt": "same content!!\n", "repo/b.txt": "same content!!\n"},
+        file_limit_reached=False,
+        size_limit_reached=True,
+        total_files_count=4,
+        duplicate_files={"repo/b.txt": "repo/a.txt"},
+    )
+
+
+@pytest.mark.asyncio
+async def test_same_crc_and_size_with_different_contents(monkeypatch, make_zip):
+    zip_file = make_zip({"repo/a.txt": b"aaaa", "repo/b.txt": b"bbbb"})
+    # a CRC-32 collision
+    monkeypatch.setattr(file_utils, "content_key", lambda member: member.file_size)
+
+    result = await extract_text_files(zip_file)
+
+    assert result.text_files == {"repo/a.txt": "aaaa", "repo/b.txt": "bbbb"}
+    assert result.duplicate_files == {}
@@ -41,3 +41,29 @@ def test_validate_repo_url_edgecases(url, exception_msg):
     with pytest.raises(ValidationError) as exc:
         validate_repo_url(url)
     assert str(exc.value.messages[0]) == exception_msg
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://github.com/username/repository/tree/main",
+        "https://github.com/username/repository/tree/main/packages/foo",
+        "https://github.com/username/repository/tree/v1.0/packages/foo/",
+    ],
+)
+def test_validate_repo_url_tree(url):
+    assert validate_repo_url(url) is None
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://github.com/username/repository/tree",
+        "https://github.com/username/repository/tree/",
+        "https://github.com/username/repository/tree/a..b/packages",
+        "https://github.com/username/repository/tree/bad%20ref",
+    ],
+)
+def test_validate_repo_url_invalid_tree(url):
+    with pytest.raises(ValidationError):
+        validate_repo_url(url)
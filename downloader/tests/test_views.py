@@ -1,15 +1,24 @@
+import gzip
+import random
+import zipfile
+
 import pytest
 from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 from django.test import AsyncClient
-from unittest.mock import AsyncMock, patch
+from unittest.mock import ANY, AsyncMock, patch
 
 from downloader.repo_utils import (
     DownloadResult,
     RepositoryDownloadError,
     RepositorySizeExceededError,
 )
-from downloader.file_utils import ExtractionResult
+from downloader.file_utils import ExtractionResult, StreamingTextExtractor
+from downloader.path_filter import PathFilter
+from downloader.result_store import result_path, store_result
+from downloader.views import DOWNLOAD_CHUNK_SIZE
+from downloader.skip_rules import SkipRules
 
 
 @pytest.mark.asyncio
@@ -33,6 +42,46 @@ async def test_download_repo_view_post_valid_form(async_client):
     )
 
 
+@pytest.mark.asyncio
+async def test_download_repo_view_post_path_patterns(async_client):
+    url = reverse("download_repo")
+    data = {
+        "repo_url": "https://github.com/username/repo",
+        "include": "src/\n*.md",
+        "exclude": "!src/keep.py",
+    }
+    response = await async_client.post(url, data)
+    assert response.status_code == 302
+    assert response.url == (
+        reverse("download_result", kwargs={"username": "username", "repo_name": "repo"})
+        + "?include=src%2F&include=%2A.md&exclude=%21src%2Fkeep.py"
+    )
+
+
+@pytest.mark.asyncio
+async def test_download_repo_view_post_tree_url(async_client):
+    url = reverse("download_repo")
+    data = {"repo_url": "https://github.com/username/repo/tree/main/packages/foo"}
+    response = await async_client.post(url, data)
+    assert response.status_code == 302
+    assert response.url == (
+        reverse("download_result", kwargs={"username": "username", "repo_name": "repo"})
+        + "?ref=main&path=packages%2Ffoo"
+    )
+
+
+@pytest.mark.asyncio
+async def test_download_repo_view_post_keep_generated(async_client):
+    url = reverse("download_repo")
+    data = {"repo_url": "https://github.com/username/repo", "keep_generated": "on"}
+    response = await async_client.post(url, data)
+    assert response.status_code == 302
+    assert response.url == (
+        reverse("download_result", kwargs={"username": "username", "repo_name": "repo"})
+        + "?skip=none"
+    )
+
+
 @pytest.mark.asyncio
 async def test_download_repo_view_post_invalid_form(async_client):
     url = reverse("download_repo")
@@ -65,21 +114,228 @@ async def test_download_result_view_success(
     assert response.status_code == 200
     assert "download.html" in [t.name for t in response.templates]
     assert response.context["repo_name"] == "repo"
-    assert response.context["encoded_file_content"]
+    assert response.context["download_url"]
     assert response.context["download_file_size"]
     assert response.context["concatenated_file_count"] == 1
     assert response.context["total_file_count"] == 1
     assert response.context["zip_file_size"] == 1000
     assert response.context["total_uncompressed_size"] == 5000
 
-    mock_download_repo.assert_called_once_with("https://github.com/username/repo")
+    mock_download_repo.assert_called_once_with(
+        "https://github.com/username/repo",
+        text_extractor=ANY,
+        archive_format="zip",
+        ref="master",
+    )
     mock_extract_text_files.assert_called_once_with(
         None,
         max_files=settings.MAX_FILE_COUNT,
         max_total_size=settings.MAX_TEXT_SIZE,
         exclude_files=[],
+        path_filter=PathFilter(),
+        skip_rules=SkipRules(settings.SKIP_RULES, settings.SKIP_LARGE_FILE_SIZE),
+        streamed=ANY,
+    )
+
+
+@pytest.mark.asyncio
+@patch("downloader.views.download_repo", new_callable=AsyncMock)
+@patch("downloader.views.extract_text_files", new_callable=AsyncMock)
+async def test_download_result_view_archive_format(
+    mock_extract_text_files, mock_download_repo
+):
+    mock_download_repo.return_value = DownloadResult(None, 1000, 5000)
+    mock_extract_text_files.return_value = ExtractionResult({}, False, False, 0)
+    url = reverse(
+        "download_result", kwargs={"username": "username", "repo_name": "repo"}
+    )
+
+    response = await AsyncClient().get(url, {"format": "tar.gz"})
+
+    assert response.status_code == 200
+    mock_download_repo.assert_called_once_with(
+        "https://github.com/username/repo",
+        text_extractor=ANY,
+        archive_format="tar.gz",
+        ref="master",
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("priority", [True, False])
+@pytest.mark.parametrize("streams", [True, False])
+@patch("downloader.views.download_repo", new_callable=AsyncMock)
+@patch("downloader.views.extract_text_files", new_callable=AsyncMock)
+async def test_download_result_view_streaming(
+    mock_extract_text_files, mock_download_repo, settings, priority, streams
+):
+    settings.EXTRACTION_PRIORITY = priority
+    settings.STREAMING_EXTRACTION = streams
+    mock_download_repo.return_value = DownloadResult(None, 1000, 5000)
+    mock_extract_text_files.return_value = ExtractionResult({}, False, False, 0)
+    url = reverse(
+        "download_result", kwargs={"username": "username", "repo_name": "repo"}
     )
 
+    response = await AsyncClient().get(url)
+
+    assert response.status_code == 200
+    text_extractor = mock_download_repo.call_args.kwargs["text_extractor"]
+    assert isinstance(text_extractor, StreamingTextExtractor) == streams
+    # what was read while downloading isn't read again
+    streamed = mock_extract_text_files.call_args.kwargs["streamed"]
+    assert streamed is (text_extractor.streamed if streams else None)
+
+
+@pytest.mark.asyncio
+@patch("downloader.views.download_repo", new_callable=AsyncMock)
+@patch("downloader.views.extract_text_files", new_callable=AsyncMock)
+async def test_download_result_view_path_patterns(
+    mock_extract_text_files, mock_download_repo, settings
+):
+    settings.STREAMING_EXTRACTION = False
+    mock_download_repo.return_value = DownloadResult(None, 1000, 5000)
+    mock_extract_text_files.return_value = ExtractionResult({}, False, False, 0)
+    url = reverse(
+        "download_result", kwargs={"username": "username", "repo_name": "repo"}
+    )
+
+    response = await AsyncClient().get(
+        url, {"include": ["src/", "*.md"], "exclude": "tests/"}
+    )
+
+    assert response.status_code == 200
+    path_filter = mock_extract_text_files.call_args.kwargs["path_filter"]
+    assert path_filter == PathFilter(["src/", "*.md"], ["tests/"])
+
+
+@pytest.mark.asyncio
+@patch("downloader.views.download_repo", new_callable=AsyncMock)
+@patch("downloader.views.extract_text_files", new_callable=AsyncMock)
+async def test_download_result_view_subdirectory(
+    mock_extract_text_files, mock_download_repo, settings
+):
+    settings.STREAMING_EXTRACTION = False
+    mock_download_repo.return_value = DownloadResult(None, 1000, 5000)
+    mock_extract_text_files.return_value = ExtractionResult(
+        {"repo-main/packages/foo/a.txt": "a"}, False, False, 2
+    )
+    url = reverse(
+        "download_result", kwargs={"username": "username", "repo_name": "repo"}
+    )
+
+    response = await AsyncClient().get(url, {"ref": "main", "path": "packages/foo"})
+
+    assert response.status_code == 200
+    assert mock_download_repo.call_args.kwargs["ref"] == "main"
+    path_filter = mock_extract_text_files.call_args.kwargs["path_filter"]
+    assert path_filter == PathFilter(subdirectory="packages/foo")
+
+
+@pytest.mark.asyncio
+@patch("downloader.views.download_repo", new_callable=AsyncMock)
+@patch("downloader.views.extract_text_files", new_callable=AsyncMock)
+async def test_download_result_view_missing_subdirectory(
+    mock_extract_text_files, mock_download_repo, settings
+):
+    settings.STREAMING_EXTRACTION = False
+    mock_download_repo.return_value = DownloadResult(None, 1000, 5000)
+    mock_extract_text_files.return_value = ExtractionResult({}, False, False, 0)
+    url = reverse(
+        "download_result", kwargs={"username": "username", "repo_name": "repo"}
+    )
+
+    response = await AsyncClient().get(url, {"path": "nope"})
+
+    assert response.status_code == 302
+    assert response.url == reverse("new_download")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "query, expected_rules",
+    [
+        ({"skip": "none"}, ()),
+        ({"skip": ["vendor", "lockfile"]}, ("vendor", "lockfile")),
+    ],
+)
+@patch("downloader.views.download_repo", new_callable=AsyncMock)
+@patch("downloader.views.extract_text_files", new_callable=AsyncMock)
+async def test_download_result_view_skip_rules(
+    mock_extract_text_files, mock_download_repo, settings, query, expected_rules
+):
+    settings.STREAMING_EXTRACTION = False
+    mock_download_repo.return_value = DownloadResult(None, 1000, 5000)
+    mock_extract_text_files.return_value = ExtractionResult(
+        {}, False, False, 3, {"vendor": 2}
+    )
+    url = reverse(
+        "download_result", kwargs={"username": "username", "repo_name": "repo"}
+    )
+
+    response = await AsyncClient().get(url, query)
+
+    assert response.status_code == 200
+    assert response.context["skipped_file_counts"] == [("vendor", 2)]
+    skip_rules = mock_extract_text_files.call_args.kwargs["skip_rules"]
+    assert skip_rules.rules == expected_rules
+
+
+@pytest.mark.asyncio
+@patch("downloader.views.download_repo", new_callable=AsyncMock)
+async def test_download_result_view_unknown_skip_rule(mock_download_repo):
+    url = reverse(
+        "download_result", kwargs={"username": "username", "repo_name": "repo"}
+    )
+
+    response = await AsyncClient().get(url, {"skip": "docs"})
+
+    assert response.status_code == 302
+    assert response.url == reverse("new_download")
+    mock_download_repo.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("downloader.views.download_repo", new_callable=AsyncMock)
+async def test_download_result_view_invalid_ref(mock_download_repo):
+    url = reverse(
+        "download_result", kwargs={"username": "username", "repo_name": "repo"}
+    )
+
+    response = await AsyncClient().get(url, {"ref": "../../evil"})
+
+    assert response.status_code == 302
+    assert response.url == reverse("new_download")
+    mock_download_repo.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("downloader.views.download_repo", new_callable=AsyncMock)
+async def test_download_result_view_invalid_path_pattern(mock_download_repo):
+    url = reverse(
+        "download_result", kwargs={"username": "username", "repo_name": "repo"}
+    )
+
+    response = await AsyncClient().get(url, {"exclude": "[z-a]"})
+
+    assert response.status_code == 302
+    assert response.url == reverse("new_download")
+    mock_download_repo.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("downloader.views.download_repo", new_callable=AsyncMock)
+async def test_download_result_view_unsupported_archive_format(mock_download_repo):
+    url = reverse(
+        "download_result", kwargs={"username": "username", "repo_name": "repo"}
+    )
+
+    response = await AsyncClient().get(url, {"format": "rar"})
+
+    assert response.status_code == 302
+    assert response.url == reverse("new_download")
+    mock_download_repo.assert_not_called()
+
 
 @pytest.mark.asyncio
 @patch("downloader.views.download_repo", new_callable=AsyncMock)
@@ -121,3 +377,196 @@ async def test_download_result_view_repo_download_error(mock_download_repo):
     session = SessionStore(response.cookies["sessionid"].value)
     assert "error_message" in session
     assert session["error_message"] == "Failed to download repository"
+
+
+@pytest.mark.asyncio
+@patch("downloader.views.download_repo", new_callable=AsyncMock)
+@patch("downloader.views.extract_text_files", new_callable=AsyncMock)
+async def test_download_result_view_links_to_stored_file(
+    mock_extract_text_files, mock_download_repo
+):
+    mock_download_repo.return_value = DownloadResult(None, 1000, 5000)
+    mock_extract_text_files.return_value = ExtractionResult(
+        {"file1.txt": "File 1 content"}, False, False, 1
+    )
+    async_client = AsyncClient()
+    url = reverse(
+        "download_result", kwargs={"username": "username", "repo_name": "repo"}
+    )
+
+    response = await async_client.get(url)
+    download_url = response.context["download_url"]
+    assert download_url.encode() in response.content
+    assert b"File 1 content" not in response.content
+
+    download = await async_client.get(download_url)
+    content = b"".join([chunk async for chunk in download.streaming_content])
+    assert b"## file1.txt" in content
+    assert b"File 1 content" in content
+    assert response.context["download_file_size"] == len(content)
+
+
+def test_store_result_from_chunks(settings):
+    chunks = ["héllo ", "", "world" * 1000]
+
+    stored = store_result(iter(chunks))
+
+    assert stored == store_result("".join(chunks))
+    path = result_path(stored.key)
+    assert path.read_bytes() == "".join(chunks).encode()
+    assert gzip.decompress(result_path(stored.key, "gzip").read_bytes()) == (
+        "".join(chunks).encode()
+    )
+    # no temporary files are left behind
+    assert not [p for p in path.parent.iterdir() if p.name.startswith(".tmp-")]
+
+
+def test_download_file_view(client):
+    stored = store_result("héllo world")
+    url = reverse("download_file", kwargs={"key": stored.key})
+
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "text/plain; charset=utf-8"
+    assert response["Content-Length"] == str(stored.size)
+    assert response["Accept-Ranges"] == "bytes"
+    assert "Content-Encoding" not in response
+    assert b"".join(response.streaming_content) == "héllo world".encode()
+
+
+def test_download_file_view_gzip(client):
+    stored = store_result("hello world" * 100)
+    url = reverse("download_file", kwargs={"key": stored.key})
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip, deflate"})
+
+    assert response["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response["Vary"]
+    body = b"".join(response.streaming_content)
+    assert int(response["Content-Length"]) == len(body) < stored.size
+    assert gzip.decompress(body) == b"hello world" * 100
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("accept_encoding", ["", "gzip"])
+async def test_download_file_view_asgi(async_client, accept_encoding):
+    content = random.Random(1).randbytes(200 * 1024).hex()
+    stored = store_result(content)
+    url = reverse("download_file", kwargs={"key": stored.key})
+
+    response = await async_client.get(url, headers={"Accept-Encoding": accept_encoding})
+
+    # read a chunk at a time, rather than into a list by Django's ASGI handler
+    assert response.is_async
+    chunks = [chunk async for chunk in response.streaming_content]
+    assert max(map(len, chunks)) <= DOWNLOAD_CHUNK_SIZE
+    body = b"".join(chunks)
+    assert int(response["Content-Length"]) == len(body)
+    if accept_encoding:
+        body = gzip.decompress(body)
+    assert body == content.encode()
+
+
+@pytest.mark.parametrize(
+    "range_header,expected_range,expected_body",
+    [
+        ("bytes=0-4", "bytes 0-4/11", b"hello"),
+        ("bytes=6-", "bytes 6-10/11", b"world"),
+        ("bytes=-3", "bytes 8-10/11", b"rld"),
+        ("bytes=6-100", "bytes 6-10/11", b"world"),
+    ],
+)
+def test_download_file_view_range(client, range_header, expected_range, expected_body):
+    stored = store_result("hello world")
+    url = reverse("download_file", kwargs={"key": stored.key})
+
+    response = client.get(
+        url, headers={"Range": range_header, "Accept-Encoding": "gzip"}
+    )
+
+    assert response.status_code == 206
+    assert response["Content-Range"] == expected_range
+    assert "Content-Encoding" not in response
+    assert response.content == expected_body
+
+
+def test_download_file_view_unsatisfiable_range(client):
+    stored = store_result("hello world")
+    url = reverse("download_file", kwargs={"key": stored.key})
+
+    response = client.get(url, headers={"Range": "bytes=20-"})
+
+    assert response.status_code == 416
+    assert response["Content-Range"] == "bytes */11"
+
+
+def test_download_file_view_missing(client, settings):
+    url = reverse("download_file", kwargs={"key": "0" * 64})
+    assert client.get(url).status_code == 404
+
+    stored = store_result("hello world")
+    settings.RESULT_STORE_TTL = -1
+    url = reverse("download_file", kwargs={"key": stored.key})
+    assert client.get(url).status_code == 404
+
+
+@pytest.fixture
+def make_zip_upload(make_zip_bytes):
+    def make_zip_upload(files: dict[str, bytes], **options) -> SimpleUploadedFile:
+        data = make_zip_bytes(files, **options)
+        return SimpleUploadedFile("repo.zip", data, "application/zip")
+
+    return make_zip_upload
+
+
+@pytest.mark.asyncio
+@patch("downloader.views.extract_text_files", new_callable=AsyncMock)
+async def test_zip_upload_is_extracted_while_uploading(
+    mock_extract_text_files, async_client, make_zip_upload
+):
+    upload = make_zip_upload({"repo/a.txt": b"a\n", "repo/b.bin": b"\x00\x01"})
+
+    response = await async_client.post(reverse("download_repo"), {"zip_file": upload})
+
+    assert response.status_code == 200
+    assert "download.html" in [t.name for t in response.templates]
+    assert response.context["concatenated_file_count"] == 1
+    assert response.context["total_file_count"] == 2
+    mock_extract_text_files.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_zip_upload_that_cant_be_streamed_is_extracted_afterwards(
+    async_client, make_zip_upload
+):
+    upload = make_zip_upload({"repo/a.txt": b"a\n"}, compression=zipfile.ZIP_BZIP2)
+
+    response = await async_client.post(reverse("download_repo"), {"zip_file": upload})
+
+    assert response.status_code == 200
+    assert response.context["concatenated_file_count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_non_zip_upload_is_rejected_while_uploading(async_client):
+    upload = SimpleUploadedFile("repo.zip", b"<html>" * 1000, "application/zip")
+
+    response = await async_client.post(reverse("download_repo"), {"zip_file": upload})
+
+    assert response.status_code == 200
+    assert "downloader.html" in [t.name for t in response.templates]
+    assert response.context["error_message"] == "File is not a valid ZIP file."
+
+
+@pytest.mark.asyncio
+async def test_oversize_upload_is_rejected_while_uploading(
+    async_client, settings, make_zip_upload
+):
+    settings.MAX_REPO_SIZE = 1000
+    upload = make_zip_upload({"repo/a.txt": random.Random(1).randbytes(2000)})
+
+    response = await async_client.post(reverse("download_repo"), {"zip_file": upload})
+
+    assert response.status_code == 200
+    assert "exceeds maximum allowed size" in response.context["error_message"]
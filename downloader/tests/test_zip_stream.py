@@ -0,0 +1,312 @@
+import io
+import random
+import zipfile
+
+import pytest
+
+from downloader import file_utils
+from downloader.file_utils import StreamingTextExtractor, extract_text_files
+from downloader.priority import ARCHIVE_ORDER
+from downloader.skip_rules import SKIP_RULES, SkipRules
+from downloader.zip_stream import NotAZipFileError, ZipStreamError, ZipStreamParser
+
+
+class RecordingHandler:
+    def __init__(self, wanted=lambda member: True, max_data=None):
+        self.wanted = wanted
+        self.max_data = max_data
+        self.contents = {}
+        self.ended = []
+
+    def start_member(self, member):
+        if not self.wanted(member):
+            return False
+        self.contents[member.filename] = b""
+        self._current = member.filename
+        return True
+
+    def member_data(self, data):
+        self.contents[self._current] += data
+        return (
+            self.max_data is None or len(self.contents[self._current]) < self.max_data
+        )
+
+    def end_member(self, member):
+        self.ended.append((member.filename, member.file_size, member.CRC))
+
+
+def parse(data: bytes, handler, chunk_size: int) -> ZipStreamParser:
+    parser = ZipStreamParser(handler)
+    for offset in range(0, len(data), chunk_size):
+        parser.feed(data[offset : offset + chunk_size])
+    parser.close()
+    return parser
+
+
+FILES = {
+    "repo/": b"",
+    "repo/README.md": b"# Hello\n" * 100,
+    "repo/data.bin": bytes(range(256)) * 50,
+    "repo/empty.txt": b"",
+    "repo/caf\xe9.txt": "caf\xe9\n".encode(),
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000, 10**6])
+@pytest.mark.parametrize("compression", [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED])
+@pytest.mark.parametrize("data_descriptors", [False, True])
+def test_parses_members(chunk_size, compression, data_descriptors, make_zip_bytes):
+    if compression == zipfile.ZIP_STORED and data_descriptors:
+        pytest.skip("stored members with data descriptors can't be streamed")
+    data = make_zip_bytes(FILES, compression, data_descriptors)
+    handler = RecordingHandler()
+
+    parse(data, handler, chunk_size)
+
+    assert handler.contents == FILES
+    expected = [
+        (i.filename, i.file_size, i.CRC)
+        for i in zipfile.ZipFile(io.BytesIO(data)).infolist()
+    ]
+    assert handler.ended == expected
+
+
+@pytest.mark.parametrize("data_descriptors", [False, True])
+def test_unwanted_members_are_skipped(data_descriptors, make_zip_bytes):
+    data = make_zip_bytes(FILES, data_descriptors=data_descriptors)
+    handler = RecordingHandler(
+        wanted=lambda member: member.filename.endswith(".md"), max_data=10
+    )
+
+    parse(data, handler, 100)
+
+    assert list(handler.contents) == ["repo/README.md"]
+    assert len(handler.ended) == len(FILES)
+
+
+def test_stored_member_with_data_descriptor_is_unsupported(make_zip_bytes):
+    data = make_zip_bytes({"a.txt": b"a"}, zipfile.ZIP_STORED, data_descriptors=True)
+
+    with pytest.raises(ZipStreamError):
+        parse(data, RecordingHandler(), 100)
+
+
+def test_not_a_zip_file():
+    parser = ZipStreamParser(RecordingHandler())
+
+    with pytest.raises(NotAZipFileError):
+        parser.feed(b"<html>")
+
+
+def test_truncated(make_zip_bytes):
+    data = make_zip_bytes(FILES)
+
+    with pytest.raises(ZipStreamError):
+        parse(data[: len(data) // 2], RecordingHandler(), 100)
+
+
+def test_bad_crc(make_zip_bytes):
+    data = bytearray(make_zip_bytes({"a.txt": b"hello"}, zipfile.ZIP_STORED))
+    data[data.index(b"hello")] = ord("j")
+
+    with pytest.raises(ZipStreamError, match="CRC"):
+        parse(bytes(data), RecordingHandler(), 100)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "max_files,max_total_size", [(1000, 10**6), (7, 10**6), (1000, 2000), (5, 900)]
+)
+@pytest.mark.parametrize("data_descriptors", [False, True])
+async def test_streaming_extraction_matches_extract_text_files(
+    max_files, max_total_size, data_descriptors, make_zip_bytes
+):
+    rng = random.Random(1234)
+    files = {"repo/": b"", "repo/logo.png": b"\x89PNG\r\n\x1a\n"}
+    for i in range(40):
+        if rng.random() < 0.25:
+            files[f"repo/bin{i}.dat"] = bytes(rng.randrange(256) for _ in range(300))
+        else:
+            files[f"repo/text{i}.txt"] = b"line\n" * rng.randrange(1, 100)
+    data = make_zip_bytes(files, data_descriptors=data_descriptors)
+    exclude_files = ["repo/text3.txt"]
+
+    extractor = StreamingTextExtractor(
+        max_files, max_total_size, exclude_files, priority=ARCHIVE_ORDER
+    )
+    parse(data, extractor, 1000)
+    expected = await extract_text_files(
+        zipfile.ZipFile(io.BytesIO(data)),
+        max_files,
+        max_total_size,
+        exclude_files,
+        mode="sequential",
+        priority=ARCHIVE_ORDER,
+    )
+
+    assert extractor.result() == expected
+    assert list(extractor.result().text_files) == list(expected.text_files)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "max_files,max_total_size,fits",
+    [(1000, 10**6, True), (5, 10**6, True), (4, 10**6, False), (1000, 2000, False)],
+)
+async def test_ranked_streaming_extraction_needs_limits_that_fit(
+    max_files, max_total_size, fits, make_zip_bytes
+):
+    files = {
+        "repo/README.md": b"# Hello\n" * 100,
+        "repo/data.bin": bytes(range(256)),
+        **{f"repo/{i}.py": f"x = {i}\n".encode() * 100 for i in range(4)},
+    }
+    data = make_zip_bytes(files)
+
+    extractor = StreamingTextExtractor(max_files, max_total_size)
+    parse(data, extractor, 1000)
+
+    if fits:
+        assert extractor.result() == await extract_text_files(
+            zipfile.ZipFile(io.BytesIO(data)), max_files, max_total_size
+        )
+    else:
+        assert extractor.result() is None
+
+
+def test_ranked_streaming_extraction_stops_reading_once_limits_are_exhausted(
+    make_zip_bytes,
+):
+    files = {f"repo/{i}.py": f"x = {i}\n".encode() * 100 for i in range(3)}
+    files["repo/small.py"] = b"x = 3\n"
+    extractor = StreamingTextExtractor(1000, 1500)
+    started = []
+    start_member = extractor.start_member
+    extractor.start_member = lambda member: (
+        start_member(member) and not started.append(member.filename)
+    )
+
+    parse(make_zip_bytes(files), extractor, 1000)
+
+    assert extractor.result() is None
+    # 2.py is read to find it's text that doesn't fit, small.py would still fit
+    assert started == ["repo/0.py", "repo/1.py", "repo/2.py"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["sequential", "threads"])
+@pytest.mark.parametrize("data_descriptors", [False, True])
+async def test_ranked_extraction_reuses_streamed_members(
+    monkeypatch, settings, mode, data_descriptors, make_zip_bytes
+):
+    files = {
+        "repo/README.md": b"# Hello\n" * 50,
+        "repo/tests/fixture.md": b"# Hello\n" * 50,
+        "repo/data.bin": bytes(range(256)),
+        **{f"repo/{i}.py": f"x = {i}\n".encode() * 100 for i in range(4)},
+    }
+    data = make_zip_bytes(files, data_descriptors=data_descriptors)
+    expected = await extract_text_files(
+        zipfile.ZipFile(io.BytesIO(data)), 1000, 1500, mode="sequential"
+    )
+    extractor = StreamingTextExtractor(1000, 1500)
+    parse(data, extractor, 1000)
+    settings.EXTRACTION_WORKERS = 2
+    read = []
+    read_text_member = file_utils.read_text_member
+    monkeypatch.setattr(
+        file_utils,
+        "read_text_member",
+        lambda zip_file, member, *args: read.append(member.filename)
+        or read_text_member(zip_file, member, *args),
+    )
+    member_digest = file_utils.member_digest
+    monkeypatch.setattr(
+        file_utils,
+        "member_digest",
+        lambda zip_file, member: read.append(member.filename)
+        or member_digest(zip_file, member),
+    )
+
+    result = await extract_text_files(
+        zipfile.ZipFile(io.BytesIO(data)),
+        1000,
+        1500,
+        mode=mode,
+        streamed=extractor.streamed,
+    )
+
+    assert extractor.result() is None
+    assert result == expected
+    # 1.py was only read while streaming to find it's text that doesn't fit
+    assert "repo/1.py" in read
+    never_read = {"repo/README.md", "repo/data.bin", "repo/0.py"}
+    if mode == "sequential":
+        # the copy was only hashed, so its batch may be read ahead in threads
+        never_read.add("repo/tests/fixture.md")
+    assert not set(read) & never_read
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("data_descriptors", [False, True])
+async def test_streaming_extraction_matches_skipped_files(
+    data_descriptors, make_zip_bytes
+):
+    files = {
+        "repo/README.md": b"readme",
+        "repo/node_modules/a.js": b"a",
+        "repo/yarn.lock": b"# yarn",
+        "repo/app.min.css": b"a{}",
+        "repo/app.css": b"a{color:red}" * 500,
+        "repo/big.txt": b"big\n" * 3000,
+    }
+    data = make_zip_bytes(files, data_descriptors=data_descriptors)
+    skip_rules = SkipRules(SKIP_RULES, large_file_size=10_000)
+
+    extractor = StreamingTextExtractor(skip_rules=skip_rules)
+    parse(data, extractor, 1000)
+    expected = await extract_text_files(
+        zipfile.ZipFile(io.BytesIO(data)), skip_rules=skip_rules, mode="sequential"
+    )
+
+    assert extractor.result() == expected
+    assert list(expected.text_files) == ["repo/README.md"]
+    assert expected.skipped_files == {
+        "vendor": 1,
+        "lockfile": 1,
+        "generated": 1,
+        "minified": 1,
+        "large": 1,
+    }
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_total_size", [10**6, 500])
+@pytest.mark.parametrize("data_descriptors", [False, True])
+async def test_streaming_extraction_matches_duplicates(
+    max_total_size, data_descriptors, make_zip_bytes
+):
+    files = {
+        "repo/LICENSE": b"license\n" * 50,
+        "repo/a.py": b"a = 1\n",
+        "repo/docs/LICENSE": b"license\n" * 50,
+        "repo/b.py": b"a = 1\n",
+    }
+    data = make_zip_bytes(files, data_descriptors=data_descriptors)
+
+    extractor = StreamingTextExtractor(
+        max_total_size=max_total_size, priority=ARCHIVE_ORDER
+    )
+    parse(data, extractor, 1000)
+    expected = await extract_text_files(
+        zipfile.ZipFile(io.BytesIO(data)),
+        max_total_size=max_total_size,
+        mode="sequential",
+        priority=ARCHIVE_ORDER,
+    )
+
+    assert extractor.result() == expected
+    assert expected.duplicate_files == {
+        "repo/docs/LICENSE": "repo/LICENSE",
+        "repo/b.py": "repo/a.py",
+    }
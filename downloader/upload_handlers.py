@@ -0,0 +1,97 @@
+import logging
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.template.defaultfilters import filesizeformat
+
+from .file_utils import ExtractionResult, StreamedMembers, StreamingTextExtractor
+from .zip_stream import NotAZipFileError, ZipStreamError, ZipStreamParser
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StreamedUpload:
+    # the text files extracted while the upload arrived, if it could be streamed and
+    # the limits fit all of them (see `StreamingTextExtractor`)
+    result: ExtractionResult | None = None
+    # what was read of its members meanwhile, for extracting it again otherwise
+    streamed: StreamedMembers | None = None
+    # why the upload was rejected before it finished arriving
+    error: str | None = None
+
+
+class StreamingZipUploadHandler(FileUploadHandler):
+    """
+    Extracts the text files of an uploaded ZIP file while the upload arrives.
+
+    The upload of the `zip_file` field is parsed from its local file headers as it's
+    received (see `ZipStreamParser`), and its members are classified and decoded
+    straight away. Once the upload is complete, the result is set on
+    `request.streamed_upload` for the view to use instead of extracting the archive
+    again.
+
+    Uploads that don't start like a ZIP file or are bigger than
+    `settings.MAX_REPO_SIZE` are rejected as soon as that's known, without the rest
+    of them being stored: `request.streamed_upload.error` says why. Archives that
+    can't be read front to back are still stored by the next handlers, and are
+    extracted from their central directory as usual.
+
+    The upload is still passed on to the next handlers, which store it for the
+    form's validation.
+    """
+
+    field_name = "zip_file"
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.upload = None
+        self.parser = None
+        if field_name != self.field_name:
+            return
+        self.upload = StreamedUpload()
+        self.request.streamed_upload = self.upload
+        self.extractor = StreamingTextExtractor(
+            settings.MAX_FILE_COUNT, settings.MAX_TEXT_SIZE
+        )
+        self.upload.streamed = self.extractor.streamed
+        self.parser = ZipStreamParser(self.extractor)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.upload is None:
+            return raw_data
+
+        self.received += len(raw_data)
+        if self.received > settings.MAX_REPO_SIZE:
+            self._reject(
+                f"File size exceeds maximum allowed size of "
+                f"{filesizeformat(settings.MAX_REPO_SIZE)}."
+            )
+
+        if self.parser is not None:
+            try:
+                self.parser.feed(raw_data)
+            except NotAZipFileError:
+                self._reject("File is not a valid ZIP file.")
+            except ZipStreamError as e:
+                logger.info(f"Not extracting {self.file_name} while uploading: {e}")
+                self.parser = None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.parser is not None:
+            try:
+                self.parser.close()
+            except ZipStreamError as e:
+                logger.info(f"Not extracting {self.file_name} while uploading: {e}")
+            else:
+                self.upload.result = self.extractor.result()
+        # the next handlers provide the uploaded file itself
+        return None
+
+    def _reject(self, error: str):
+        self.upload.error = error
+        self.parser = None
+        raise StopUpload(connection_reset=False)
@@ -1,21 +1,45 @@
+import asyncio
 import logging
-from urllib.parse import quote
+import os
+import re
 
 from django.conf import settings
-from django.http import HttpRequest, HttpResponse
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpRequest, HttpResponse
 from django.shortcuts import redirect, render
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.utils.cache import patch_vary_headers
 
-from .file_utils import ExtractionResult, extract_text_files
-from .forms import RepositoryURLForm, ZipFileForm
+from .archives import ARCHIVE_FORMATS
+from .file_utils import (
+    ExtractionResult,
+    StreamingTextExtractor,
+    extract_text_files,
+)
+from .forms import RepositoryURLForm, ZipFileForm, validate_ref
+from .path_filter import InvalidPatternError, get_path_filter
 from .repo_utils import (
     DownloadResult,
     RepositoryDownloadError,
     RepositorySizeExceededError,
     download_repo,
 )
+from .result_cache import (
+    CachedResult,
+    ExtractionLimits,
+    cache_result,
+    get_cached_result,
+)
+from .result_store import open_result, read_result_range, store_result
+from .single_flight import SingleFlight
+from .skip_rules import get_skip_rules
 
 logger = logging.getLogger(__name__)
 
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
 
 async def download_repo_view(request: HttpRequest) -> HttpResponse:
     context = {
@@ -27,6 +51,12 @@ async def download_repo_view(request: HttpRequest) -> HttpResponse:
     if request.method == "POST":
         if "repo_url" in request.POST:
             return _handle_repo_url_form(request, context)
+        # only set once the request body has been parsed
+        streamed_upload = getattr(request, "streamed_upload", None)
+        if streamed_upload is not None and streamed_upload.error:
+            # rejected by `StreamingZipUploadHandler` before it was fully received
+            context["error_message"] = streamed_upload.error
+            return render(request, "downloader.html", context)
         elif "zip_file" in request.FILES:
             return await _handle_zip_file_form(request, context)
         else:
@@ -41,7 +71,25 @@ def _handle_repo_url_form(request: HttpRequest, context):
     repo_url_form = RepositoryURLForm(request.POST)
     if repo_url_form.is_valid():
         _, username, repo_name = repo_url_form.cleaned_data["repo_url"]
-        return redirect("download_result", username=username, repo_name=repo_name)
+        url = reverse(
+            "download_result", kwargs={"username": username, "repo_name": repo_name}
+        )
+        cleaned_data = repo_url_form.cleaned_data
+        query = {
+            parameter: cleaned_data[field]
+            for parameter, field in [
+                ("ref", "ref"),
+                ("path", "subdirectory"),
+                ("include", "include"),
+                ("exclude", "exclude"),
+            ]
+            if cleaned_data[field]
+        }
+        if cleaned_data["keep_generated"]:
+            query["skip"] = "none"
+        if query:
+            url += "?" + urlencode(query, doseq=True)
+        return redirect(url)
     else:
         context["repo_url_form"] = repo_url_form
         return render(request, "downloader_new.html", context)
@@ -51,16 +99,25 @@ async def _handle_zip_file_form(request: HttpRequest, context):
     zip_file_form = ZipFileForm(request.POST, request.FILES)
     if zip_file_form.is_valid():
         file, name, size, uncompressed_size = zip_file_form.cleaned_data["zip_file"]
-        extraction = await extract_text_files(file)
+        result = DownloadResult(file, size, uncompressed_size)
+        try:
+            streamed_upload = getattr(request, "streamed_upload", None)
+            if streamed_upload is not None and streamed_upload.result is not None:
+                # extracted by `StreamingZipUploadHandler` while it was uploaded
+                extraction = streamed_upload.result
+            else:
+                extraction = await extract_text_files(
+                    file,
+                    settings.MAX_FILE_COUNT,
+                    settings.MAX_TEXT_SIZE,
+                    streamed=streamed_upload and streamed_upload.streamed,
+                )
+            extraction_context = await _get_extraction_context(extraction, name, result)
+        finally:
+            result.close()
         # when the user uploads a zip file, we don't redirect to another page with
         # the results, we render the results template on the same url.
-        return render(
-            request,
-            "download.html",
-            _get_extraction_context(
-                extraction, name, DownloadResult(file, size, uncompressed_size)
-            ),
-        )
+        return render(request, "download.html", extraction_context)
     else:
         context["zip_file_form"] = zip_file_form
         return render(request, "downloader.html", context)
@@ -68,10 +125,74 @@ async def _handle_zip_file_form(request: HttpRequest, context):
 
 async def download_result_view(request, username, repo_name):
     repo_url = f"https://github.com/{username}/{repo_name}"
+    # the branch or tag, and the subdirectory of a `tree/<ref>/<path>` URL
+    ref = request.GET.get("ref") or "master"
+    subdirectory = request.GET.get("path", "").strip("/")
+    try:
+        validate_ref(ref)
+    except ValidationError as e:
+        request.session["error_message"] = e.messages[0]
+        return redirect("new_download")
+    archive_format = request.GET.get("format", settings.ARCHIVE_FORMAT)
+    if archive_format not in ARCHIVE_FORMATS:
+        request.session["error_message"] = (
+            f"Unsupported archive format: {archive_format}. "
+            f"Choose one of: {', '.join(ARCHIVE_FORMATS)}."
+        )
+        return redirect("new_download")
+    # this file is excluded from the text extraction on our home repo because
+    # it's a little weird to include its contents in the download. People
+    # won't understand why it's there, LLMs will be confused, it will take up
+    # token limits, etc.  See
+    # `downloader.tests.test_repo_download.test_invalid_repository_url` for
+    # its real purpose.
+    exclude_files = (
+        ["downloader/tests/data/gh_repo_dl_test.txt"]
+        if username == "dmwyatt" and repo_name == "gh_repo_download"
+        else []
+    )
+    # gitignore-style patterns, one per `include` or `exclude` parameter
+    include = tuple(request.GET.getlist("include"))
+    exclude = tuple(request.GET.getlist("exclude"))
+    try:
+        get_path_filter(include, exclude, subdirectory)
+    except InvalidPatternError as e:
+        request.session["error_message"] = str(e)
+        return redirect("new_download")
+    # the skip rules to apply, one per `skip` parameter: `settings.SKIP_RULES` if
+    # there are none, and none at all for `skip=none`
+    skip_rules = tuple(request.GET.getlist("skip")) or tuple(settings.SKIP_RULES)
+    if skip_rules == ("none",):
+        skip_rules = ()
+    try:
+        get_skip_rules(skip_rules)
+    except ValueError as e:
+        request.session["error_message"] = str(e)
+        return redirect("new_download")
+    limits = ExtractionLimits(
+        settings.MAX_FILE_COUNT,
+        settings.MAX_TEXT_SIZE,
+        tuple(exclude_files),
+        include,
+        exclude,
+        subdirectory,
+        skip_rules,
+    )
+
+    cached = await get_cached_result(username, repo_name, ref, limits)
+    if cached is not None:
+        return render(request, "download.html", cached.context)
 
     try:
-        # Download and extract the repository
-        result = await download_repo(repo_url)
+        # Concurrent requests for the same repository share one download and
+        # extraction. Both archive formats produce the same result, so they share
+        # it too.
+        context = await _in_flight_downloads.do(
+            (username.lower(), repo_name.lower(), ref, limits),
+            lambda: _download_and_extract(
+                repo_url, username, repo_name, ref, limits, archive_format
+            ),
+        )
     except RepositorySizeExceededError as e:
         error_message = str(e)
         logger.error(error_message)
@@ -83,40 +204,90 @@ async def download_result_view(request, username, repo_name):
         request.session["error_message"] = error_message
         return redirect("new_download")
 
-    # Process the downloaded repository
+    return render(request, "download.html", context)
 
-    extraction = await extract_text_files(
-        result.zip_file,
-        max_files=settings.MAX_FILE_COUNT,
-        max_total_size=settings.MAX_TEXT_SIZE,
-        # this file is excluded from the text extraction on our home repo because
-        # it's a little weird to include its contents in the download. People
-        # won't understand why it's there, LLMs will be confused, it will take up
-        # token limits, etc.  See
-        # `downloader.tests.test_repo_download.test_invalid_repository_url` for
-        # its real purpose.
-        exclude_files=(
-            ["downloader/tests/data/gh_repo_dl_test.txt"]
-            if username == "dmwyatt" and repo_name == "gh_repo_download"
-            else []
-        ),
+
+_in_flight_downloads = SingleFlight()
+
+
+async def _download_and_extract(
+    repo_url: str,
+    username: str,
+    repo_name: str,
+    ref: str,
+    limits: ExtractionLimits,
+    archive_format: str,
+) -> dict:
+    # Download and extract the repository
+    path_filter = get_path_filter(limits.include, limits.exclude, limits.subdirectory)
+    skip_rules = get_skip_rules(limits.skip_rules)
+    text_extractor = None
+    if settings.STREAMING_EXTRACTION:
+        text_extractor = StreamingTextExtractor(
+            limits.max_files,
+            limits.max_total_size,
+            list(limits.exclude_files),
+            path_filter=path_filter,
+            skip_rules=skip_rules,
+        )
+    result = await download_repo(
+        repo_url, text_extractor=text_extractor, archive_format=archive_format, ref=ref
     )
 
-    return render(
-        request, "download.html", _get_extraction_context(extraction, repo_name, result)
+    # Process the downloaded repository
+
+    try:
+        if result.extraction is not None:
+            extraction = result.extraction
+        else:
+            extraction = await extract_text_files(
+                result.archive,
+                max_files=limits.max_files,
+                max_total_size=limits.max_total_size,
+                exclude_files=list(limits.exclude_files),
+                path_filter=path_filter,
+                skip_rules=skip_rules,
+                streamed=text_extractor and text_extractor.streamed,
+            )
+    finally:
+        result.close()
+
+    if limits.subdirectory and not extraction.total_files_count:
+        raise RepositoryDownloadError(
+            f"There's no {limits.subdirectory} directory in {username}/{repo_name} "
+            f"at {ref}."
+        )
+
+    context = await _get_extraction_context(extraction, repo_name, result)
+    cache_result(
+        username,
+        repo_name,
+        ref,
+        result.commit_sha,
+        limits,
+        CachedResult(context["result_key"], context),
     )
+    return context
 
 
-def _get_extraction_context(
+async def _get_extraction_context(
     extraction: ExtractionResult, repo_name: str, result: DownloadResult
 ):
-    rendered_text = extraction.render_template(repo_name, "repo_template.txt")
+    def render_and_store():
+        return store_result(extraction.render_chunks(repo_name))
+
+    # rendering, encoding and compressing a large result would block the event loop
+    loop = asyncio.get_event_loop()
+    stored = await loop.run_in_executor(None, render_and_store)
     return {
         "repo_name": repo_name,
-        "encoded_file_content": quote(rendered_text),
-        "download_file_size": len(rendered_text),
+        "result_key": stored.key,
+        "download_url": reverse("download_file", kwargs={"key": stored.key}),
+        "download_file_size": stored.size,
         "concatenated_file_count": len(extraction.text_files),
         "total_file_count": extraction.total_files_count,
+        "skipped_file_counts": sorted(extraction.skipped_files.items()),
+        "duplicate_file_count": len(extraction.duplicate_files),
         "zip_file_size": result.download_size,
         "total_uncompressed_size": result.uncompressed_size,
     }
@@ -125,3 +296,111 @@ def _get_extraction_context(
 def new_downloader_view(request: HttpRequest) -> HttpResponse:
     error_message = request.session.pop("error_message", None)
     return render(request, "downloader_new.html", {"error_message": error_message})
+
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(range_header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parses a single-range `Range` header into inclusive (start, end) offsets.
+
+    Returns None for headers we don't support (e.g. multiple ranges), in which case
+    the whole file is served. Raises ValueError for unsatisfiable ranges.
+    """
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # suffix range: the last `end` bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+def _preferred_encoding(request: HttpRequest) -> str | None:
+    accepted = {
+        part.split(";")[0].strip().lower()
+        for part in request.headers.get("Accept-Encoding", "").split(",")
+    }
+    for encoding in ["br", "gzip"]:
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+EXPIRED_DOWNLOAD_MESSAGE = "This download has expired. Please generate it again."
+
+
+def download_file_view(request: HttpRequest, key: str) -> HttpResponse:
+    """
+    Serves a stored concatenated text file.
+
+    Precompressed variants are served when the client accepts them. Range requests
+    are answered from the uncompressed text so they stay meaningful for resuming a
+    download.
+
+    Under WSGI, full downloads are FileResponses of the open file, which the server
+    can hand to sendfile. Django's ASGI handler would read such a response into a
+    list before sending it, so under ASGI the file is read a chunk at a time in the
+    default executor instead.
+    """
+    result = open_result(key)
+    if result is None:
+        raise Http404(EXPIRED_DOWNLOAD_MESSAGE)
+    size = os.fstat(result.fileno()).st_size
+    content_type = "text/plain; charset=utf-8"
+
+    range_header = request.headers.get("Range")
+    if range_header:
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            result.close()
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        if byte_range is not None:
+            result.close()
+            start, end = byte_range
+            data = read_result_range(key, start, end)
+            if data is None:
+                # evicted since it was opened
+                raise Http404(EXPIRED_DOWNLOAD_MESSAGE)
+            response = HttpResponse(data, status=206, content_type=content_type)
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response["Accept-Ranges"] = "bytes"
+            return response
+
+    encoding = _preferred_encoding(request)
+    encoded = open_result(key, encoding) if encoding else None
+    if encoded is not None:
+        result.close()
+        response = FileResponse(encoded, content_type=content_type)
+        response["Content-Encoding"] = encoding
+    else:
+        response = FileResponse(result, content_type=content_type)
+    if isinstance(request, ASGIRequest):
+        # the response still closes the file, and keeps the headers it set from it
+        response.streaming_content = _read_chunks(response.file_to_stream)
+    response["Accept-Ranges"] = "bytes"
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+async def _read_chunks(file):
+    loop = asyncio.get_running_loop()
+    try:
+        while chunk := await loop.run_in_executor(None, file.read, DOWNLOAD_CHUNK_SIZE):
+            yield chunk
+    finally:
+        file.close()
@@ -1,22 +1,17 @@
 import "vite/modulepreload-polyfill";
 import { get_encoding } from "tiktoken";
 
-function decodeDataURI(element) {
+async function fetchDownload(element) {
   // Check if the element is valid and has the required attribute
   if (!element || !element.getAttribute || !element.hasAttribute("href")) {
     throw new Error("Invalid element: Element must have an href attribute.");
   }
 
-  const dataURI = element.getAttribute("href");
-  if (!dataURI.startsWith("data:")) {
-    throw new Error(
-      "Invalid element: href attribute does not contain a valid data URI.",
-    );
+  const response = await fetch(element.getAttribute("href"));
+  if (!response.ok) {
+    throw new Error(`Download failed with status ${response.status}`);
   }
-
-  // Extract and decode the content from the data URI
-  const content = dataURI.split(",")[1];
-  return decodeURIComponent(content);
+  return response.text();
 }
 
 function countTokens(text) {
@@ -37,7 +32,7 @@ function countTokens(text) {
   }
   return tokenCount;
 }
-function download() {
+async function download() {
 
   // Format numbers with commas
   const numberSpans = document.querySelectorAll(".locale-number");
@@ -46,9 +41,9 @@ function download() {
     span.textContent = number.toLocaleString();
   });
 
-  // Get the data URI from the <a> element
+  // Fetch the file the <a> element links to
   const downloadLink = document.querySelector("a[download]");
-  const decodedContent = decodeDataURI(downloadLink);
+  const decodedContent = await fetchDownload(downloadLink);
 
   // Count the tokens
   const tokenCount = countTokens(decodedContent);
@@ -0,0 +1,269 @@
+import struct
+import zipfile
+import zlib
+from typing import Protocol
+
+LOCAL_FILE_HEADER_SIGNATURE = b"PK\x03\x04"
+DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+# the central directory, (zip64) end of central directory: the members are over
+END_OF_MEMBERS_SIGNATURES = [b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06"]
+
+_local_file_header = struct.Struct("<4sHHHHHIIIHH")
+_extra_field_header = struct.Struct("<HH")
+
+ZIP64_EXTRA_ID = 0x0001
+ZIP64_LIMIT = 0xFFFFFFFF
+
+FLAG_ENCRYPTED = 0x1
+FLAG_DATA_DESCRIPTOR = 0x8
+FLAG_UTF8 = 0x800
+
+# the most decompressed data handed over at once, so that a member that compresses
+# extremely well can't blow up memory
+DECOMPRESS_CHUNK_SIZE = 64 * 1024
+
+
+class ZipStreamError(Exception):
+    """The stream isn't a ZIP archive that can be read front to back."""
+
+
+class NotAZipFileError(ZipStreamError):
+    """The stream doesn't start with a ZIP local file header."""
+
+
+class MemberHandler(Protocol):
+    def start_member(self, member: zipfile.ZipInfo) -> bool:
+        """Returns whether the member's content is wanted."""
+
+    def member_data(self, data: bytes) -> bool:
+        """Receives decompressed content. Returns whether more of it is wanted."""
+
+    def end_member(self, member: zipfile.ZipInfo):
+        """Called after the member's data, with its sizes and CRC filled in."""
+
+
+class ZipStreamParser:
+    """
+    Parses a ZIP archive from its local file headers while its bytes arrive.
+
+    ZIP readers normally start from the central directory at the end of the archive.
+    This reads members front to back instead, so they can be processed while the rest
+    of the archive is still being received. For each member,
+    `handler.start_member(member)` gets a `zipfile.ZipInfo` built from its local file
+    header and returns whether it wants the member's content. If it does, the
+    decompressed content is passed to `handler.member_data` until that returns False.
+    `handler.end_member(member)` is called once the member's data has gone by.
+
+    Members whose content is read to the end are checked against their CRC-32.
+    Encrypted members, compression methods other than stored and deflated, stored
+    members followed by a data descriptor (whose end can't be found without the
+    central directory) and corrupt data raise `ZipStreamError`.
+
+    Args:
+        handler (MemberHandler): Receives the members and their content.
+    """
+
+    def __init__(self, handler: MemberHandler):
+        self._handler = handler
+        self._buffer = bytearray()
+        self._state = self._read_header
+        self._started = False
+        self._member = None
+        self.done = False
+
+    def feed(self, data: bytes):
+        """Parses the next bytes of the archive."""
+        if self.done:
+            return
+        self._buffer += data
+        while self._state():
+            pass
+
+    def close(self):
+        """
+        Checks that the whole archive was parsed.
+
+        Raises:
+            ZipStreamError: If the stream ended before the central directory.
+        """
+        if not self.done:
+            raise ZipStreamError("The ZIP archive is truncated.")
+
+    def _read_header(self) -> bool:
+        if len(self._buffer) < 4:
+            return False
+        signature = bytes(self._buffer[:4])
+        if signature in END_OF_MEMBERS_SIGNATURES:
+            self.done = True
+            self._buffer = bytearray()
+            return False
+        if signature != LOCAL_FILE_HEADER_SIGNATURE:
+            if not self._started:
+                raise NotAZipFileError("Not a ZIP file.")
+            raise ZipStreamError(f"Unexpected signature {signature!r}.")
+        self._started = True
+
+        if len(self._buffer) < _local_file_header.size:
+            return False
+        (
+            _,
+            _,
+            flags,
+            method,
+            mod_time,
+            mod_date,
+            crc,
+            compress_size,
+            file_size,
+            name_length,
+            extra_length,
+        ) = _local_file_header.unpack_from(self._buffer)
+        header_size = _local_file_header.size + name_length + extra_length
+        if len(self._buffer) < header_size:
+            return False
+        name = bytes(self._buffer[_local_file_header.size :][:name_length])
+        extra = bytes(self._buffer[header_size - extra_length : header_size])
+        del self._buffer[:header_size]
+
+        member = zipfile.ZipInfo(
+            name.decode("utf-8" if flags & FLAG_UTF8 else "cp437"),
+            (
+                (mod_date >> 9) + 1980,
+                (mod_date >> 5) & 0xF,
+                mod_date & 0x1F,
+                mod_time >> 11,
+                (mod_time >> 5) & 0x3F,
+                (mod_time & 0x1F) * 2,
+            ),
+        )
+        member.flag_bits = flags
+        member.compress_type = method
+        member.CRC = crc
+        member.compress_size = compress_size
+        member.file_size = file_size
+        self._zip64 = _apply_zip64_extra(member, extra)
+
+        if flags & FLAG_ENCRYPTED:
+            raise ZipStreamError(f"{member.filename} is encrypted.")
+        if method == zipfile.ZIP_DEFLATED:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        elif method == zipfile.ZIP_STORED:
+            self._decompressor = None
+        else:
+            raise ZipStreamError(f"{member.filename} uses compression method {method}.")
+
+        self._data_descriptor = bool(flags & FLAG_DATA_DESCRIPTOR)
+        if self._data_descriptor:
+            if self._decompressor is None:
+                raise ZipStreamError(
+                    f"{member.filename} is stored with a data descriptor."
+                )
+            # the sizes and CRC in the header are zeros, the real ones follow the data
+            member.CRC = member.compress_size = member.file_size = 0
+            self._remaining = None
+        else:
+            self._remaining = member.compress_size
+
+        self._member = member
+        self._crc = 0
+        self._size = 0
+        # a member is only checked if all of its content went through `_output`
+        self._complete = True
+        self._wanted = self._handler.start_member(member)
+        self._state = self._read_data
+        return True
+
+    def _read_data(self) -> bool:
+        if self._remaining is None:
+            # data descriptor: the data ends where the deflate stream does
+            if not self._buffer:
+                return False
+            data, self._buffer = bytes(self._buffer), bytearray()
+            self._decompress(data)
+            if not self._decompressor.eof:
+                return False
+            self._buffer[:0] = self._decompressor.unused_data
+            self._state = self._read_data_descriptor
+            return True
+
+        if self._remaining:
+            if not self._buffer:
+                return False
+            data = bytes(self._buffer[: self._remaining])
+            del self._buffer[: len(data)]
+            self._remaining -= len(data)
+            if self._wanted:
+                self._decompress(data)
+            else:
+                # nobody wants the rest of this member, so don't decompress it
+                self._complete = False
+        if self._remaining:
+            return False
+
+        if self._complete and self._decompressor is not None:
+            self._output(self._decompressor.flush())
+            if not self._decompressor.eof:
+                raise ZipStreamError(f"{self._member.filename} is corrupt.")
+        self._end_member()
+        return True
+
+    def _read_data_descriptor(self) -> bool:
+        size_format = "QQ" if self._zip64 else "II"
+        descriptor = struct.Struct("<I" + size_format)
+        offset = 4 if self._buffer.startswith(DATA_DESCRIPTOR_SIGNATURE) else 0
+        if len(self._buffer) < offset + descriptor.size:
+            return False
+        member = self._member
+        member.CRC, member.compress_size, member.file_size = descriptor.unpack_from(
+            self._buffer, offset
+        )
+        del self._buffer[: offset + descriptor.size]
+        self._end_member()
+        return True
+
+    def _decompress(self, data: bytes):
+        if self._decompressor is None:
+            self._output(data)
+            return
+        while data and not self._decompressor.eof:
+            self._output(self._decompressor.decompress(data, DECOMPRESS_CHUNK_SIZE))
+            data = self._decompressor.unconsumed_tail
+
+    def _output(self, data: bytes):
+        if not data:
+            return
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        if self._wanted:
+            self._wanted = self._handler.member_data(data)
+
+    def _end_member(self):
+        member = self._member
+        if self._complete and (
+            self._crc != member.CRC or self._size != member.file_size
+        ):
+            raise ZipStreamError(f"Bad CRC-32 for file {member.filename}.")
+        self._member = None
+        self._handler.end_member(member)
+        self._state = self._read_header
+
+
+def _apply_zip64_extra(member: zipfile.ZipInfo, extra: bytes) -> bool:
+    """
+    Reads the sizes that didn't fit in the local file header from its zip64 extra
+    field. Returns whether the header had one.
+    """
+    offset = 0
+    while offset + _extra_field_header.size <= len(extra):
+        field_id, field_size = _extra_field_header.unpack_from(extra, offset)
+        offset += _extra_field_header.size
+        if field_id == ZIP64_EXTRA_ID:
+            values = extra[offset : offset + field_size]
+            # only the sizes that overflowed are present, uncompressed size first
+            for attribute in ["file_size", "compress_size"]:
+                if getattr(member, attribute) == ZIP64_LIMIT and len(values) >= 8:
+                    setattr(member, attribute, struct.unpack_from("<Q", values)[0])
+                    values = values[8:]
+            return True
+        offset += field_size
+    return False
@@ -13,4 +13,34 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gh_repo_download.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported after Django is set up, since it reads settings
+from downloader import http_client  # noqa: E402
+
+
+async def lifespan(scope, receive, send):
+    """
+    Handles the ASGI lifespan protocol, which Django doesn't, to own process-wide
+    resources: the shared HTTP client is created on startup and closed on shutdown.
+    """
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await http_client.start_client()
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await http_client.close_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
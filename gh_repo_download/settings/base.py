@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 import re
+import tempfile
 from pathlib import Path
 
 from environ import Env
@@ -180,6 +182,93 @@ INTERNAL_IPS = ["127.0.0.1"]
 MAX_REPO_SIZE = 10 * 1024 * 1024  # size of zip file downloaded from github
 MAX_FILE_COUNT = 1000  # number of files extracted from the zip file
 MAX_TEXT_SIZE = 10 * 1024 * 1024  # size of text to be extracted from the files
+# uploaded ZIP files are extracted while they arrive, see
+# `downloader.upload_handlers.StreamingZipUploadHandler`
+FILE_UPLOAD_HANDLERS = [
+    "downloader.upload_handlers.StreamingZipUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+# how `extract_text_files` processes archive members: "sequential", "threads" or
+# "processes" (spread across EXTRACTION_WORKERS worker threads or processes)
+EXTRACTION_MODE = env("EXTRACTION_MODE", default="sequential")
+EXTRACTION_WORKERS = env.int("EXTRACTION_WORKERS", default=os.cpu_count() or 1)
+# extract repository archives while they download, falling back to `EXTRACTION_MODE`
+# for archives that can't be read front to back
+STREAMING_EXTRACTION = env.bool("STREAMING_EXTRACTION", default=True)
+# members skipped before they're decompressed: "vendor", "lockfile", "generated",
+# "large" (bigger than SKIP_LARGE_FILE_SIZE) and "minified", see
+# `downloader.skip_rules`. Can be overridden per request with `?skip=`.
+SKIP_RULES = env.list(
+    "SKIP_RULES", default=["vendor", "lockfile", "generated", "large", "minified"]
+)
+SKIP_LARGE_FILE_SIZE = env.int("SKIP_LARGE_FILE_SIZE", default=1024 * 1024)
+# when an archive has more text than MAX_FILE_COUNT and MAX_TEXT_SIZE allow, extract
+# its most useful members (READMEs and manifests, then source, docs, tests and
+# fixtures, smallest first) rather than the first ones in archive order, see
+# `downloader.priority`
+EXTRACTION_PRIORITY = env.bool("EXTRACTION_PRIORITY", default=True)
+# overrides of `downloader.priority.PRIORITY_WEIGHTS`, e.g. "docs=80;test=60"
+EXTRACTION_PRIORITY_WEIGHTS = env.dict(
+    "EXTRACTION_PRIORITY_WEIGHTS", cast={"value": int}, default={}
+)
+# the archive repositories are downloaded as: "zip" or "tar.gz". Can be overridden
+# per request with `?format=`.
+ARCHIVE_FORMAT = env("ARCHIVE_FORMAT", default="zip")
+# downloaded archives larger than this are spooled to a temporary file instead of
+# being kept in memory. Set to None to always keep them in memory.
+DOWNLOAD_SPOOL_MAX_MEMORY = 1024 * 1024
+# whether ZIP archives on disk (spooled downloads, cached archives, uploads Django
+# wrote to a temporary file) are read through a memory map of them
+ARCHIVE_MMAP = env.bool("ARCHIVE_MMAP", default=True)
+
+# where concatenated results are kept for the download link, for how long (seconds)
+# and how many bytes of them, shared by every worker process (see
+# `downloader.shared_cache`)
+RESULT_STORE_DIR = env(
+    "RESULT_STORE_DIR",
+    default=str(Path(tempfile.gettempdir()) / "gh_repo_download" / "results"),
+)
+RESULT_STORE_TTL = 60 * 60
+RESULT_STORE_MAX_SIZE = 1024 * 1024 * 1024
+
+# the HTTP client shared by all requests in a worker process (see
+# `downloader.http_client`). HTTP/2 needs the `h2` package (`httpx[http2]`).
+HTTP_CLIENT_MAX_CONNECTIONS = env.int("HTTP_CLIENT_MAX_CONNECTIONS", default=100)
+HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS = env.int(
+    "HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS", default=20
+)
+HTTP_CLIENT_KEEPALIVE_EXPIRY = env.float("HTTP_CLIENT_KEEPALIVE_EXPIRY", default=30.0)
+HTTP_CLIENT_HTTP2 = env.bool("HTTP_CLIENT_HTTP2", default=False)
+HTTP_CLIENT_TIMEOUT = env.float("HTTP_CLIENT_TIMEOUT", default=5.0)
+
+# downloaded archives are kept here and revalidated with conditional requests. Set
+# ARCHIVE_CACHE_MAX_SIZE (bytes) to 0 to disable the cache.
+ARCHIVE_CACHE_DIR = env(
+    "ARCHIVE_CACHE_DIR",
+    default=str(Path(tempfile.gettempdir()) / "gh_repo_download" / "archives"),
+)
+ARCHIVE_CACHE_MAX_SIZE = 500 * 1024 * 1024
+
+# results of repository downloads are cached per commit, in RESULT_CACHE_DIR so
+# every worker process shares them. A ref (e.g. "master") is trusted to point at the
+# same commit for COMMIT_SHA_TTL seconds, after which it's revalidated with one
+# GitHub API request. Keep RESULT_CACHE_TTL below RESULT_STORE_TTL so cached results
+# still have their file.
+RESULT_CACHE_DIR = env(
+    "RESULT_CACHE_DIR",
+    default=str(Path(tempfile.gettempdir()) / "gh_repo_download" / "result_cache"),
+)
+RESULT_CACHE_MAX_ENTRIES = 256
+RESULT_CACHE_TTL = 30 * 60
+COMMIT_SHA_TTL = 60
+
+# the text archive members were decoded to is kept, per worker process, and reused
+# for members of any archive with the same CRC-32, size and SHA-256 (see
+# `downloader.blob_store`). The size is in characters; set it to 0 to disable it.
+BLOB_STORE_MAX_SIZE = 64 * 1024 * 1024
+GITHUB_API_URL = "https://api.github.com"
+GITHUB_TOKEN = env("GITHUB_TOKEN", default=None)
 
 DJANGO_VITE = {"default": {"dev_mode": DEBUG}}
 
@@ -10,6 +10,11 @@ urlpatterns = [
         views.download_result_view,
         name="download_result",
     ),
+    path(
+        "download/file/<str:key>/",
+        views.download_file_view,
+        name="download_file",
+    ),
     path("", views.new_downloader_view, name="new_download"),
 ]
 